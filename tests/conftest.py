@@ -0,0 +1,74 @@
+"""
+Shared fixtures: the core sheets and small synthetic models.
+
+Session fixtures are shared by many tests and must not be mutated; tests
+that edit a store build their own with `core_model()` or `synthetic_store`.
+"""
+
+import os
+import random
+
+import pytest
+
+from trigraph.constraints import MANDATORY, UNIQUE
+from trigraph.packages import parse_all
+from trigraph.sheets import Model, load_model
+from trigraph.store import TripleStore
+from trigraph.synthetic import generate, spec_for
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORE_SHEETS = os.path.join(ROOT, 'sheets')
+CORE_INFO = os.path.join(ROOT, 'package-info')
+
+
+def core_model():
+    """A fresh store of the core sheets."""
+    return TripleStore.from_model(load_model(CORE_SHEETS))
+
+
+def synthetic_store(root, relations, **params):
+    """A store of a synthetic tree of about `relations` relations, written below `root`."""
+    files = generate(str(root), spec_for(relations, **params), core=CORE_SHEETS,
+                     core_info=CORE_INFO)
+    return TripleStore.from_model(Model(parse_all(files, cache_dir=None, jobs=1)))
+
+
+def constrained_store(extra=()):
+    """People `like` each other at most once and must `own` something."""
+    store = TripleStore()
+    sheet = store.add_sheet('people')
+    for name in ('alice', 'bob', 'carol', 'car'):
+        store.add_node(name, 'public', sheet)
+    for triple in [
+        ('likes', 'signature', 'person-likes-person'),
+        ('person-likes-person', 'sourceType', 'person'),
+        ('person-likes-person', 'targetType', 'person'),
+        ('person-likes-person', 'relationPropertyRelation', UNIQUE),
+        ('owns', 'signature', 'person-owns-thing'),
+        ('person-owns-thing', 'sourceType', 'person'),
+        ('person-owns-thing', 'targetType', 'thing'),
+        ('person-owns-thing', 'relationPropertyRelation', MANDATORY),
+        ('alice', 'type', 'person'),
+        ('bob', 'type', 'person'),
+        ('car', 'type', 'thing'),
+        ('alice', 'likes', 'bob'),
+        ('alice', 'owns', 'car'),
+        ('bob', 'owns', 'car'),
+    ] + list(extra):
+        store.add(*triple, sheet=sheet, line=store.num_relations + 1)
+    return store
+
+
+@pytest.fixture(scope='session')
+def core_store():
+    return core_model()
+
+
+@pytest.fixture(scope='session')
+def synthetic(tmp_path_factory):
+    return synthetic_store(tmp_path_factory.mktemp('synthetic'), 2000)
+
+
+@pytest.fixture
+def rng():
+    return random.Random(0)
@@ -0,0 +1,97 @@
+import os
+import sys
+
+import pytest
+
+from trigraph.build import (BUILT, FAILED, SKIPPED, UP_TO_DATE, BuildError, Builder, Stage,
+                            default_stages, levels)
+from trigraph.convert import black_ids_path
+
+# Copies its first argument to its second and counts its runs in `runs`
+COPY = ('import sys; data = open(sys.argv[1]).read(); open(sys.argv[2], "w").write(data); '
+        'open("runs", "a").write("x")')
+
+# Writes `out` and numbers it in `ids`, which it creates if it is missing
+NUMBER = ('import os; n = open("ids").read() if os.path.exists("ids") else "7"; '
+          'open("ids", "w").write(n); open("out", "w").write(n); open("runs", "a").write("x")')
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _runs():
+    with open('runs') as f:
+        return len(f.read())
+
+
+def _builder():
+    stages = [
+        Stage('copy', [sys.executable, '-c', COPY, 'a.txt', 'b.txt'], ['a.txt'], ['b.txt']),
+        Stage('again', [sys.executable, '-c', COPY, 'b.txt', 'c.txt'], ['b.txt'], ['c.txt']),
+    ]
+    return Builder(stages, manifest='manifest.json', jobs=1)
+
+
+def _build(builder, **kwargs):
+    return builder.build(log=lambda message: None, **kwargs)
+
+
+def test_only_changed_inputs_rebuild(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write('a.txt', 'one')
+    assert _build(_builder()) == {'copy': BUILT, 'again': BUILT}
+    assert _build(_builder()) == {'copy': UP_TO_DATE, 'again': UP_TO_DATE}
+
+    # Touched but unchanged: nothing runs
+    os.utime('a.txt', ns=(0, 10**9))
+    assert _build(_builder()) == {'copy': UP_TO_DATE, 'again': UP_TO_DATE}
+
+    _write('a.txt', 'two')
+    assert _build(_builder()) == {'copy': BUILT, 'again': BUILT}
+    assert open('c.txt').read() == 'two'
+
+    # An output changed by hand is rebuilt, and so is nothing else
+    _write('c.txt', 'edited')
+    assert _build(_builder()) == {'copy': UP_TO_DATE, 'again': BUILT}
+    assert _runs() == 5
+    assert _build(_builder(), targets=['copy'], force=True) == {'copy': BUILT}
+
+
+def test_failed_stage_skips_dependents(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert _build(_builder()) == {'copy': FAILED, 'again': SKIPPED}
+
+
+def test_file_updated_in_place(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def builder():
+        stage = Stage('number', [sys.executable, '-c', NUMBER], ['ids'], ['out', 'ids'])
+        return Builder([stage], manifest='manifest.json')
+
+    assert _build(builder()) == {'number': BUILT}
+    assert _build(builder()) == {'number': UP_TO_DATE}
+    os.remove('ids')
+    assert _build(builder()) == {'number': BUILT}
+    _write('ids', '9')
+    assert _build(builder()) == {'number': BUILT}
+    assert open('out').read() == '9'
+    assert _build(builder()) == {'number': UP_TO_DATE}
+    assert _runs() == 3
+
+
+def test_default_stages_declare_black_ids():
+    stages = {stage.name: stage for stage in default_stages('sheets')}
+    radial = stages['radial']
+    assert black_ids_path('sheets') in radial.inputs
+    assert black_ids_path('sheets') in radial.outputs
+    assert [[s.name for s in group] for group in levels(stages.values())][:2] == \
+        [['model', 'overview.png'], ['grouped', 'radial']]
+
+
+def test_two_producers_are_an_error():
+    stages = [Stage('a', ['true'], [], ['x']), Stage('b', ['true'], [], ['x'])]
+    with pytest.raises(BuildError):
+        levels(stages)
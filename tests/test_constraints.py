@@ -0,0 +1,59 @@
+from trigraph.constraints import MANDATORY, UNIQUE, ConstraintIndex, check_constraints
+
+from .conftest import constrained_store
+
+
+def _summary(violations):
+    return sorted((v.source, v.name, v.target, v.message.split(':')[0]) for v in violations)
+
+
+def test_valid_store_has_no_violations():
+    assert check_constraints(constrained_store()) == []
+
+
+def test_check_constraints_finds_duplicates_and_missing():
+    store = constrained_store([('alice', 'likes', 'bob'), ('carol', 'type', 'person')])
+    assert _summary(check_constraints(store)) == [
+        ('alice', 'likes', 'bob', UNIQUE),
+        ('carol', 'owns', None, MANDATORY),
+    ]
+
+
+def test_index_checks_inserts_and_removals():
+    store = constrained_store()
+    index = ConstraintIndex(store)
+    alice, bob, car = map(store.id, ('alice', 'bob', 'car'))
+    likes, owns = store.id('likes'), store.id('owns')
+    assert index.check_insert(alice, likes, bob)
+    assert not index.check_insert(bob, likes, alice)
+    assert index.check_remove(alice, owns, car)
+    index.insert(alice, owns, bob)
+    assert not index.check_remove(alice, owns, car)
+
+
+def test_index_counts_copies_of_unique_triples():
+    store = constrained_store([('alice', 'likes', 'bob')])
+    index = ConstraintIndex(store)
+    triple = tuple(map(store.id, ('alice', 'likes', 'bob')))
+    index.remove(*triple)
+    # One copy is left, so inserting another is still a duplicate
+    assert index.check_insert(*triple)
+    index.remove(*triple)
+    assert not index.check_insert(*triple)
+    index.insert(*triple)
+    assert index.check_insert(*triple)
+
+
+def test_index_agrees_with_bulk_check(rng):
+    store = constrained_store([('carol', 'type', 'person'), ('carol', 'owns', 'car')])
+    index = ConstraintIndex(store)
+    people = [store.id(name) for name in ('alice', 'bob', 'carol')]
+    likes = store.id('likes')
+    for _ in range(50):
+        source, target = rng.sample(people, 2)
+        if index.check_insert(source, likes, target):
+            assert any(r for r in range(store.num_relations)
+                       if store.triple(r) == (source, likes, target))
+        else:
+            index.insert(source, likes, target)
+            assert check_constraints(store) == []
@@ -0,0 +1,114 @@
+from array import array
+
+import pytest
+
+from trigraph.convert import (COLORS, ROLE_BITS, Bipartite, BlackIds, by_black, from_edges,
+                              from_trigraph, labelled, read_trigraph, to_store, to_trigraph,
+                              write_trigraph)
+from trigraph.emit import black_edges
+from trigraph.store import RELATION, SOURCE, TARGET
+from trigraph.views import StoreView
+
+
+def _columns(graph):
+    return list(graph.source), list(graph.relation), list(graph.target)
+
+
+def _shuffled(trigraph, rng):
+    order = list(range(len(trigraph.black)))
+    rng.shuffle(order)
+    return trigraph._replace(**{field: type(column)(column.typecode, map(column.__getitem__, order))
+                                for field, column in (('black', trigraph.black),
+                                                      ('white', trigraph.white),
+                                                      ('roles', trigraph.roles))})
+
+
+@pytest.mark.parametrize('dedup', [True, False])
+def test_round_trip(synthetic, rng, dedup):
+    graph = labelled(synthetic)
+    trigraph = to_trigraph(graph, dedup=dedup)
+    assert _columns(from_trigraph(trigraph)) == _columns(graph)
+    assert _columns(from_trigraph(_shuffled(trigraph, rng))) == _columns(graph)
+    if not dedup:
+        assert len(trigraph.black) == 3 * synthetic.num_relations
+
+
+def test_edges_match_black_edges(synthetic):
+    trigraph = to_trigraph(labelled(synthetic))
+    edges = by_black(trigraph)
+    for r in range(synthetic.num_relations):
+        assert [(trigraph.white[e], COLORS[trigraph.roles[e]]) for e in edges.row(r)] == \
+            black_edges(synthetic, r)
+
+
+def test_merged_roles():
+    graph = from_edges([('a', 'a', 'a'), ('a', 'b', 'a'), ('a', 'a', 'b'), ('a', 'b', 'b'),
+                        ('a', 'b', 'c')])
+    trigraph = to_trigraph(graph)
+    roles = {}
+    for black, white, mask in zip(trigraph.black, trigraph.white, trigraph.roles):
+        roles.setdefault(black, []).append((graph.names[white], mask))
+    red, green, blue = ROLE_BITS[SOURCE], ROLE_BITS[TARGET], ROLE_BITS[RELATION]
+    assert roles == {
+        0: [('a', red | green | blue)],
+        1: [('a', red | green), ('b', blue)],
+        2: [('a', red | blue), ('b', green)],
+        3: [('a', red), ('b', green | blue)],
+        4: [('a', red), ('c', green), ('b', blue)],
+    }
+    assert _columns(from_trigraph(trigraph)) == _columns(graph)
+
+
+def test_missing_role_is_an_error(synthetic):
+    trigraph = to_trigraph(labelled(synthetic))
+    broken = Bipartite(trigraph.names, trigraph.num_black, trigraph.black[1:],
+                       trigraph.white[1:], trigraph.roles[1:])
+    with pytest.raises(ValueError, match='black node 0 has 0 red edges'):
+        from_trigraph(broken)
+
+
+def test_view_and_store_conversion(synthetic):
+    view_relations = bytearray(synthetic.num_relations)
+    view_relations[::3] = b'\x01' * len(view_relations[::3])
+    view = StoreView(synthetic, bytearray(b'\x01') * synthetic.num_nodes, view_relations)
+    graph = labelled(view)
+    assert list(zip(*_columns(graph))) == [synthetic.triple(r)
+                                           for r in range(0, synthetic.num_relations, 3)]
+    store = to_store(graph)
+    assert [tuple(map(store.name, t)) for t in store.triples()] == \
+        [tuple(map(synthetic.name, synthetic.triple(r)))
+         for r in range(0, synthetic.num_relations, 3)]
+
+
+def test_tsv_round_trip(synthetic, tmp_path):
+    path = str(tmp_path / 'trigraph.tsv')
+    graph = labelled(synthetic)
+    numbers = array('i', range(10, 10 + 2 * synthetic.num_relations, 2))
+    write_trigraph(path, to_trigraph(graph), numbers)
+    trigraph, read_numbers = read_trigraph(path)
+    assert read_numbers == numbers
+    back = from_trigraph(trigraph)
+    assert [tuple(map(back.names.__getitem__, t)) for t in zip(*_columns(back))] == \
+        [tuple(map(synthetic.name, t)) for t in synthetic.triples()]
+
+
+def test_black_ids_are_stable(tmp_path):
+    path = str(tmp_path / 'ids.tsv')
+    first = from_edges([('a', 'r', 'b'), ('b', 'r', 'c'), ('a', 'r', 'b'), ('c', 'r', 'a')])
+    ids = BlackIds(path)
+    assert list(ids.assign(first)) == [1, 2, 3, 4]
+    ids.save()
+
+    # Removing and duplicating relations keeps the numbers of the rest
+    second = from_edges([('x', 'y', 'z'), ('c', 'r', 'a'), ('a', 'r', 'b'), ('a', 'r', 'b'),
+                         ('a', 'r', 'b')])
+    ids = BlackIds(path)
+    assert list(ids.assign(second)) == [5, 4, 1, 3, 6]
+    ids.save()
+
+    # Another model through the same file does not wipe them
+    ids = BlackIds(path)
+    ids.assign(from_edges([('p', 'q', 'r')]))
+    ids.save()
+    ids = BlackIds(path)
+    assert list(ids.assign(first)) == [1, 2, 3, 4]
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from trigraph.daemon import Daemon, ModelState
+
+from .conftest import CORE_SHEETS
+
+
+@pytest.fixture(scope='module')
+def state(tmp_path_factory):
+    return ModelState(CORE_SHEETS, cache_dir=str(tmp_path_factory.mktemp('cache')))
+
+
+def _ask(daemon, *requests):
+    async def run():
+        return [await daemon.respond(json.dumps(r).encode()) for r in requests]
+
+    return asyncio.run(run())
+
+
+def test_requests_get_results_or_errors(state):
+    daemon = Daemon(state)
+    ping, lookup, unknown, match, bad_op = _ask(
+        daemon,
+        {'id': 1, 'op': 'ping'},
+        {'id': 2, 'op': 'lookup', 'name': 'metaType'},
+        {'id': 3, 'op': 'lookup', 'name': 'no such node'},
+        {'id': 4, 'op': 'match', 'relation': 'type', 'target': 'metaNType'},
+        {'op': 'frobnicate'})
+    assert ping == {'id': 1, 'ok': True, 'generation': 1, 'result': 'pong'}
+    assert lookup['ok'] and lookup['result']['name'] == 'metaType'
+    assert unknown == {'id': 3, 'ok': False, 'error': "unknown node 'no such node'"}
+    assert match['ok'] and match['result']
+    assert all(t[1:] == ['type', 'metaNType'] for t in match['result'])
+    assert bad_op == {'id': None, 'ok': False, 'error': "unknown op 'frobnicate'"}
+
+
+@pytest.mark.parametrize('request_', [
+    {'op': 'match', 'source': ['x']},
+    {'op': 'match', 'relation': {'a': 1}},
+    {'op': 'lookup', 'name': 3},
+    {'op': 'lookup'},
+    {'op': 'query', 'pattern': '?x -type->'},
+    {'op': 'export', 'format': 'svg'},
+])
+def test_bad_parameters_are_answered(state, request_):
+    response, = _ask(Daemon(state), dict(request_, id=7))
+    assert response['id'] == 7 and response['ok'] is False and response['error']
+
+
+def test_unexpected_errors_are_answered(state):
+    logged = []
+    daemon = Daemon(state, log=logged.append)
+
+    def fail(request):
+        raise KeyError('boom')
+
+    daemon.handle = fail
+    response, = _ask(daemon, {'id': 1, 'op': 'ping'})
+    assert response == {'id': 1, 'ok': False, 'error': "internal error: KeyError: 'boom'"}
+    assert logged
+
+
+def test_socket_answers_every_line(state, tmp_path):
+    path = str(tmp_path / 'daemon.sock')
+    daemon = Daemon(state, path, interval=0)
+
+    async def run():
+        server = asyncio.ensure_future(daemon.serve())
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if daemon._stopped is not None:
+                break
+        reader, writer = await asyncio.open_unix_connection(path)
+        lines = [b'{"id": 1, "op": "match", "source": ["x"]}', b'not json', b'',
+                 b'{"id": 2, "op": "ping"}', b'{"id": 3, "op": "stop"}']
+        writer.write(b'\n'.join(lines) + b'\n')
+        responses = [json.loads(await reader.readline()) for _ in range(4)]
+        writer.close()
+        await server
+        return responses
+
+    responses = asyncio.run(run())
+    assert [(r['id'], r['ok']) for r in responses] == [(1, False), (None, False),
+                                                       (2, True), (3, True)]
@@ -0,0 +1,155 @@
+import io
+import math
+from collections import deque
+
+import pytest
+
+from trigraph.constraints import ConstraintError
+from trigraph.convert import BlackIds, stable_black_names
+from trigraph.edit import Editor, LiveLayout, RadialDot
+
+from .conftest import constrained_store, core_model
+
+
+def _bfs(editor, center):
+    """Shell of every node key reachable from `center` over the live relations."""
+    store = editor.store
+    adjacent = {}
+    for r, alive in enumerate(editor.relation_alive):
+        if alive:
+            for white in set(store.triple(r)):
+                adjacent.setdefault(white, []).append(~r)
+                adjacent.setdefault(~r, []).append(white)
+    shell = {center: 0}
+    queue = deque([center])
+    while queue:
+        key = queue.popleft()
+        for other in adjacent.get(key, ()):
+            if other not in shell:
+                shell[other] = shell[key] + 1
+                queue.append(other)
+    return shell
+
+
+def _check(layout):
+    assert layout.shell_of == _bfs(layout.editor, layout.center)
+    assert set(layout.positions) == set(layout.shell_of)
+    for k, ring in enumerate(layout.rings):
+        assert ring == sorted(ring)
+        assert all(layout.shell_of[key] == k for _, key in ring)
+    assert sum(map(len, layout.rings)) == len(layout.shell_of)
+    for key, (x, y) in layout.positions.items():
+        shell = layout.shell_of[key]
+        radius = layout.radius[shell] if shell else 0.0
+        assert math.isclose(math.hypot(x, y), radius, abs_tol=1e-9)
+
+
+def test_live_layout_follows_random_edits(rng):
+    store = core_model()
+    editor = Editor(store)
+    layout = LiveLayout(editor, store.id('metaNType'))
+    _check(layout)
+    names = list(store.strings)
+    for step in range(40):
+        with editor.transaction() as tx:
+            for _ in range(rng.randrange(1, 4)):
+                live = [r for r, alive in enumerate(editor.relation_alive) if alive]
+                if rng.random() < 0.5 and live:
+                    tx.remove_relation(rng.choice(live))
+                else:
+                    source = rng.choice(names) if rng.random() < 0.8 else f'new{step}'
+                    tx.add_relation(source, rng.choice(names), rng.choice(names))
+        _check(layout)
+    layout.relayout()
+    _check(layout)
+
+
+def test_patch_lists_only_changed_fragments():
+    store = core_model()
+    editor = Editor(store)
+    layout = LiveLayout(editor, store.id('metaNType'))
+    dot = RadialDot(layout)
+    assert dot.patch() is None            # after the initial layout
+    with editor.transaction() as tx:
+        r = tx.add_relation('leaf', 'type', 'metaNType')
+    fragments = dot.patch()
+    names = {f.name for f in fragments}
+    assert {'leaf', f'r{r + 1}'} <= names
+    assert len(fragments) < 10
+    assert dot.patch() == []
+    out = io.StringIO()
+    dot.write(out)
+    assert '"leaf"' in out.getvalue()
+
+
+
+def test_fragments_use_stable_black_names(tmp_path):
+    path = str(tmp_path / 'ids.tsv')
+    store = core_model()
+    editor = Editor(store, black_ids=BlackIds(path))
+    dot = RadialDot(LiveLayout(editor, store.id('metaNType')))
+    dot.patch()
+    editor.black_ids.save()
+    names = [editor.black_name(r) for r in range(store.num_relations)]
+    assert names == stable_black_names(core_model(), path)
+
+    # Removing a relation leaves the other names alone
+    with editor.transaction() as tx:
+        tx.remove_relation(0)
+        r = tx.add_relation('leaf', 'type', 'metaNType')
+    fragments = {f.name: f.text for f in dot.patch() if f.kind == 'relation'}
+    assert set(fragments) == {names[0], editor.black_name(r)}
+    assert fragments[names[0]] is None
+    assert [editor.black_name(r) for r in range(1, len(names))] == names[1:]
+
+    # The full render of the edited model names the new relation alike
+    editor.black_ids.save()
+    edited = core_model()
+    edited.add('leaf', 'type', 'metaNType')
+    assert stable_black_names(edited, path)[-1] == editor.black_name(r)
+    out = io.StringIO()
+    dot.write(out)
+    assert f'  {editor.black_name(r)} -- "leaf"' in out.getvalue()
+
+
+def test_failed_transaction_rolls_back():
+    store = core_model()
+    editor = Editor(store)
+    layout = LiveLayout(editor, store.id('metaNType'))
+    shells = dict(layout.shell_of)
+    alive = bytes(editor.relation_alive)
+    with pytest.raises(KeyError):
+        with editor.transaction() as tx:
+            tx.remove_relation(0)
+            tx.add_relation('ghost', 'type', 'metaNType')
+            tx.remove_node('no such node')
+    assert bytes(editor.relation_alive[:len(alive)]) == alive
+    assert not any(editor.relation_alive[len(alive):])
+    assert not editor.node_alive[store.id('ghost')]
+    assert layout.shell_of == shells
+    assert editor.log == []
+
+
+def test_remove_node_removes_its_relations():
+    store = core_model()
+    editor = Editor(store)
+    node = store.id('metaLevel-3')
+    touching = editor.relations_of(node)
+    with editor.transaction() as tx:
+        tx.remove_node('metaLevel-3')
+    assert touching and not any(editor.relation_alive[r] for r in touching)
+    assert 'metaLevel-3' not in editor.view().strings
+
+
+def test_edits_respect_constraints():
+    store = constrained_store()
+    editor = Editor(store)
+    with pytest.raises(ConstraintError):
+        with editor.transaction() as tx:
+            tx.add_relation('bob', 'likes', 'alice')
+            tx.add_relation('bob', 'likes', 'alice')
+    assert editor.find('bob', 'likes', 'alice') == []
+    with pytest.raises(ConstraintError):
+        with editor.transaction() as tx:
+            tx.remove_relation(editor.find('alice', 'owns', 'car')[0])
+    assert editor.find('alice', 'owns', 'car')
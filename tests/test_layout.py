@@ -0,0 +1,96 @@
+from collections import deque
+from itertools import combinations
+
+import pytest
+
+from trigraph.layout import (MEDIAN, LayerPair, Trigraph, count_crossings, crossings,
+                             inversions, layer_pairs, radial_layout, total_crossings)
+
+
+def _brute_inversions(values):
+    return sum(1 for a, b in combinations(values, 2) if a > b)
+
+
+def _bfs(store, center):
+    """Shell of every trigraph node reachable from `center`, from explicit adjacency."""
+    num_white = store.num_nodes
+    adjacent = {}
+    for r, triple in enumerate(store.triples()):
+        for white in set(triple):
+            adjacent.setdefault(white, []).append(num_white + r)
+            adjacent.setdefault(num_white + r, []).append(white)
+    shell = {center: 0}
+    queue = deque([center])
+    while queue:
+        node = queue.popleft()
+        for other in adjacent.get(node, ()):
+            if other not in shell:
+                shell[other] = shell[node] + 1
+                queue.append(other)
+    return shell
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 31, 32, 33, 100, 257])
+def test_inversions_match_brute_force(rng, n):
+    for high in (3, 1000):
+        values = [rng.randrange(high) for _ in range(n)]
+        assert inversions(values) == _brute_inversions(values)
+
+
+def test_count_crossings_matches_brute_force(rng):
+    for _ in range(20):
+        inner, outer = rng.randrange(1, 15), rng.randrange(1, 15)
+        pair = LayerPair()
+        edges = {(rng.randrange(inner), 100 + rng.randrange(outer))
+                 for _ in range(rng.randrange(1, 40))}
+        for u, v in edges:
+            pair.add(u, v)
+        pos = [0] * (100 + outer)
+        for order, nodes in ((rng.sample(range(inner), inner), range(inner)),
+                             (rng.sample(range(outer), outer), range(100, 100 + outer))):
+            for i, node in zip(order, nodes):
+                pos[node] = i
+        expected = sum(1 for (u1, v1), (u2, v2) in combinations(edges, 2)
+                       if (pos[u1] - pos[u2]) * (pos[v1] - pos[v2]) < 0)
+        assert count_crossings(pair, pos, outer) == expected
+
+
+
+def test_crossings_ignore_shared_endpoints(rng):
+    # Edges sharing an inner or an outer position never cross
+    assert crossings([(0, 0), (0, 1), (1, 0), (1, 1)], 2) == 1
+    assert crossings([(0, 1), (1, 1), (2, 1)], 3) == 0
+    for _ in range(20):
+        edges = [(rng.randrange(6), rng.randrange(6)) for _ in range(rng.randrange(30))]
+        expected = sum(1 for (u1, v1), (u2, v2) in combinations(edges, 2)
+                       if (u1 - u2) * (v1 - v2) < 0)
+        assert crossings(rng.sample(edges, len(edges)), 6) == expected
+
+@pytest.mark.parametrize('method', ['barycenter', MEDIAN])
+def test_radial_layout_on_synthetic(synthetic, method):
+    center = synthetic.id('metaNType')
+    graph = Trigraph(synthetic)
+    layout = radial_layout(graph, center, method=method)
+    shell = _bfs(synthetic, center)
+    assert {v: k for k, nodes in enumerate(layout.shells) for v in nodes} == shell
+    assert sum(map(len, layout.shells)) == len(shell)
+    assert set(layout.positions) == set(shell)
+
+    # The reported count is the count of the returned ordering
+    shell_of = [-1] * len(graph)
+    for v, k in shell.items():
+        shell_of[v] = k
+    pairs = layer_pairs(graph, layout.shells, shell_of)
+    pos = [0] * len(graph)
+    for nodes in layout.shells:
+        for i, v in enumerate(nodes):
+            pos[v] = i
+    assert total_crossings(pairs, layout.shells, pos) == layout.crossings
+    assert layout.crossings <= radial_layout(graph, center, sweeps=0).crossings
+
+
+def test_black_names(core_store):
+    graph = Trigraph(core_store)
+    assert graph.name(graph.num_white) == 'r1'
+    names = [f'x{r}' for r in range(core_store.num_relations)]
+    assert Trigraph(core_store, black_names=names).name(graph.num_white + 4) == 'x4'
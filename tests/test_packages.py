@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from trigraph import packages
+from trigraph.packages import (UNREFERENCED, UNRESOLVED, VISIBILITY, discover, load_packages,
+                               parse_all, split_reference, visible)
+from trigraph.synthetic import generate, spec_for
+
+from .conftest import CORE_INFO, CORE_SHEETS
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _package(root, name, layer):
+    _write(os.path.join(root, 'package-info'),
+           f'meta:\n  name: {name}\n  layer: {layer}\n  version: 1\ndependencies:\n')
+
+
+@pytest.fixture(scope='module')
+def tree(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('tree'))
+    generate(root, spec_for(3000, layers=3), core=CORE_SHEETS, core_info=CORE_INFO)
+    return root
+
+
+def test_visibility_rules():
+    assert [visible(v, 1, 1) for v in ('public', 'public+1', 'private')] == [True] * 3
+    assert [visible(v, 1, 2) for v in ('public', 'public+1', 'private')] == [True, True, False]
+    assert [visible(v, 1, 3) for v in ('public', 'public+1', 'private')] == [True, False, False]
+    assert not visible('public', 2, 1)
+
+
+def test_split_reference():
+    assert split_reference('.types.') == ('', 'types')
+    assert split_reference(' layer-0.metametameta.metaRelations. ') == \
+        ('layer-0.metametameta', 'metaRelations')
+
+
+def test_synthetic_tree_resolves_cleanly(tree):
+    found = load_packages(tree, cache_dir=None, jobs=1)
+    assert sorted(p.name for p in found.packages) == [
+        'layer-0.bench', 'layer-0.metametameta', 'layer-1.l1p0', 'layer-2.l2p0', 'layer-3.l3p0']
+    assert found.layers == [int(s.package.split('.')[0][len('layer-'):]) for s in found.sheets]
+    core = os.path.join(tree, 'layer-0', 'metametameta')
+    # Only the core sheets' own issues, if any
+    assert all(issue.path.startswith(core) for issue in found.resolve())
+
+
+def test_parallel_parse_matches_serial(tree, monkeypatch):
+    paths = [path for path, _ in discover(tree)[1]]
+    serial = parse_all(paths, cache_dir=None, jobs=1)
+    monkeypatch.setattr(packages, 'PARALLEL_THRESHOLD', 1)
+    parallel = parse_all(paths, cache_dir=None, jobs=2)
+    assert [(s.path, s.nodes, s.relations) for s in parallel] == \
+        [(s.path, s.nodes, s.relations) for s in serial]
+
+
+def test_reference_issues(tmp_path):
+    root = str(tmp_path)
+    _package(os.path.join(root, 'base'), 'base', 0)
+    _write(os.path.join(root, 'base', 'things.sheet'), '''\
+meta:
+  name: things
+  package: layer-0.base
+public:
+  shared: visible everywhere
+public+1:
+  near: visible one layer up
+private:
+  hidden: visible in layer 0 only
+''')
+    _package(os.path.join(root, 'top'), 'top', 2)
+    _write(os.path.join(root, 'top', 'use.sheet'), '''\
+meta:
+  name: use
+  package: layer-2.top
+references:
+  shared: layer-0.base.things.
+  near: layer-0.base.things.
+  hidden: layer-0.base.things.
+  Shared: layer-0.base.thing.
+public:
+  mine: a node of the top package
+relations:
+  mine -shared-> near
+  mine -hidden-> loose
+''')
+    found = load_packages(root, cache_dir=None, jobs=1)
+    issues = {(i.kind, i.name): i.message for i in found.resolve()}
+    assert set(issues) == {(VISIBILITY, 'near'), (VISIBILITY, 'hidden'),
+                           (UNRESOLVED, 'Shared'), (UNREFERENCED, 'loose')}
+    assert 'did you mean .things.?' in issues[UNRESOLVED, 'Shared']
+    assert 'public+1 in layer 0' in issues[VISIBILITY, 'near']
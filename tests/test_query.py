@@ -0,0 +1,92 @@
+from itertools import product
+
+import pytest
+
+from trigraph.query import QueryEngine, QueryError, parse_patterns
+
+
+def _brute_match(store, bound):
+    return [r for r, triple in enumerate(store.triples())
+            if all(b is None or b == v for b, v in zip(bound, triple))]
+
+
+def _brute_solve(store, patterns):
+    """Bindings of `patterns` (names and ?variables) by nested loops over all triples."""
+    bindings = [{}]
+    triples = list(store.triples())
+    for pattern in patterns:
+        terms = [t if t.startswith('?') else store.strings.get(t) for t in pattern]
+        extended = []
+        for binding in bindings:
+            for triple in triples:
+                new = dict(binding)
+                for term, value in zip(terms, triple):
+                    if isinstance(term, str):
+                        if new.setdefault(term, value) != value:
+                            break
+                    elif term != value:
+                        break
+                else:
+                    extended.append(new)
+        bindings = extended
+    return bindings
+
+
+def _key(bindings):
+    return sorted(tuple(sorted(b.items())) for b in bindings)
+
+
+def test_match_ids_for_every_bound_combination(synthetic, rng):
+    engine = QueryEngine(synthetic)
+    for r in rng.sample(range(synthetic.num_relations), 40):
+        triple = synthetic.triple(r)
+        for mask in product((False, True), repeat=3):
+            bound = [v if keep else None for v, keep in zip(triple, mask)]
+            expected = _brute_match(synthetic, bound)
+            assert sorted(engine.match_ids(*bound)) == expected
+            assert engine.count_ids(*bound) == len(expected)
+
+
+def test_match_by_name(core_store):
+    engine = QueryEngine(core_store)
+    found = engine.match(relation='nextMetaLevel')
+    assert found and all(r == 'nextMetaLevel' for _, r, _ in found)
+    assert engine.match(source='no such node') == []
+    assert engine.count(relation='no such node') == 0
+
+
+@pytest.mark.parametrize('query', [
+    '?x -type-> ?t -type-> metaNType',
+    '?s -targetType-> metaLevelType, ?r -signature-> ?s',
+    '?x -type-> ?x',
+    '?a -nextMetaLevel-> ?b, ?b -nextMetaLevel-> ?c',
+    '?x -type-> ?t, ?y -metaLevel-> ?l',
+])
+def test_solve_matches_nested_loops(core_store, query):
+    engine = QueryEngine(core_store)
+    assert _key(engine.solve(query)) == _key(_brute_solve(core_store, parse_patterns(query)))
+
+
+def test_solve_on_synthetic(synthetic):
+    engine = QueryEngine(synthetic)
+    query = '?x -type-> ?t, ?x -metaLevel-> ?l'
+    assert _key(engine.solve(query)) == _key(_brute_solve(synthetic, parse_patterns(query)))
+
+
+def test_unknown_constant_has_no_solutions(core_store):
+    assert QueryEngine(core_store).query('?x -type-> noSuchType') == []
+
+
+def test_plan_runs_most_selective_pattern_first(core_store):
+    engine = QueryEngine(core_store)
+    patterns = engine._resolve(parse_patterns('?x -type-> ?t, ?t -type-> metaNType'))
+    plan = engine.plan(patterns)
+    estimates = [estimate for _, estimate in plan]
+    assert estimates[0] == min(estimates)
+    assert plan[0][0] == patterns[1]
+
+
+@pytest.mark.parametrize('text', ['a -r->', 'a r b', 'a -r-> b -s->'])
+def test_malformed_patterns(text):
+    with pytest.raises(QueryError):
+        parse_patterns(text)
@@ -0,0 +1,135 @@
+import pytest
+
+from trigraph.rules import DEFAULT_RULES, FactSet, Materializer, Rule, RuleError, main
+from trigraph.snapshot import open_snapshot, write_snapshot
+from trigraph.store import TripleStore
+
+from .conftest import CORE_SHEETS, core_model
+
+
+def _naive_closure(facts, rules):
+    """Fixpoint of `rules` over name triples, by re-evaluating everything each round."""
+    facts = set(facts)
+    while True:
+        new = set()
+        for rule in rules:
+            bindings = [{}]
+            for pattern in rule.body:
+                bindings = [extended for binding in bindings for fact in facts
+                            for extended in [_unify(pattern, fact, binding)] if extended]
+            for binding in bindings:
+                head = tuple(binding.get(t, t) for t in rule.head)
+                if head not in facts:
+                    new.add(head)
+        if not new:
+            return facts
+        facts |= new
+
+
+def _unify(pattern, fact, binding):
+    binding = dict(binding)
+    for term, value in zip(pattern, fact):
+        if term.startswith('?'):
+            if binding.setdefault(term, value) != value:
+                return None
+        elif term != value:
+            return None
+    return binding
+
+
+def _names(materializer):
+    return set(materializer.names(materializer.total))
+
+
+def _base(materializer):
+    return set(materializer.names(materializer.base))
+
+
+def test_run_matches_naive_fixpoint():
+    materializer = Materializer(core_model())
+    materializer.run()
+    assert _names(materializer) == _naive_closure(_base(materializer), DEFAULT_RULES)
+    assert len(materializer.derived_facts()) > 0
+    # Every default rule is transient, so nothing derived is persisted
+    assert set(materializer.persistent_facts()) == set(materializer.base)
+
+
+
+def test_read_only_store(core_store, tmp_path):
+    path = str(tmp_path / 'model.snapshot')
+    write_snapshot(core_store, path, bytes(32))
+    with open_snapshot(path) as mapped:
+        materializer = Materializer(mapped)
+        materializer.run()
+        materializer.add([('extra', 'type', 'metaNType')])
+        expected = Materializer(core_model())
+        expected.run()
+        expected.add([('extra', 'type', 'metaNType')])
+        assert _names(materializer) == _names(expected)
+        assert materializer.store.num_nodes == core_store.num_nodes
+        assert 'typeChain' in materializer.local and 'extra' in materializer.local
+
+
+def test_command_prints_derived_facts(capsys, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)              # for the snapshot cache
+    assert main([CORE_SHEETS]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert 'metaType -typeChain-> metaNType' in lines
+    assert main([CORE_SHEETS, '--persistent']) == 0
+    assert capsys.readouterr().out == ''
+
+
+def test_incremental_updates_match_recomputation(rng):
+    store = core_model()
+    materializer = Materializer(store)
+    materializer.run()
+    triples = [tuple(map(store.name, t)) for t in store.triples()]
+    chains = [t for t in triples if t[1] in ('type', 'metaLevel', 'nextMetaLevel')]
+    removed = []
+    for step in range(30):
+        if removed and (step % 3 == 2 or len(removed) > 8):
+            facts = [removed.pop(rng.randrange(len(removed)))]
+            before = set(materializer.names(materializer.derived_facts()))
+            changes = materializer.add(facts)
+            after = set(materializer.names(materializer.derived_facts()))
+            assert set(materializer.names(changes.added)) >= after - before
+        else:
+            facts = rng.sample(chains, 2)
+            removed.extend(f for f in facts if f not in removed)
+            materializer.remove(facts)
+        assert _names(materializer) == _naive_closure(_base(materializer), DEFAULT_RULES)
+
+
+def test_remove_keeps_facts_with_another_derivation():
+    store = TripleStore()
+    for fact in [('a', 'edge', 'b'), ('b', 'edge', 'c'), ('a', 'edge', 'c')]:
+        store.add(*fact)
+    rules = [Rule.parse('?x -reach-> ?y <- ?x -edge-> ?y'),
+             Rule.parse('?x -reach-> ?z <- ?x -reach-> ?y, ?y -edge-> ?z')]
+    materializer = Materializer(store, rules)
+    materializer.run()
+    changes = materializer.remove([('a', 'edge', 'b')])
+    lost = set(materializer.names(changes.removed))
+    assert lost == {('a', 'reach', 'b')}
+    assert ('a', 'reach', 'c') in _names(materializer)
+
+
+def test_fact_set():
+    facts = FactSet([(1, 2, 3), (1, 2, 4)])
+    assert not facts.add((1, 2, 3))
+    assert len(facts) == 2 and (1, 2, 4) in facts
+    assert sorted(facts.match(1, 2, None)) == [(1, 3), (1, 4)]
+    assert facts.match(None, 2, 4) == [(1, 4)]
+    assert facts.discard((1, 2, 3)) and not facts.discard((1, 2, 3))
+    assert list(facts) == [(1, 2, 4)]
+
+
+@pytest.mark.parametrize('text', [
+    '?x -r-> ?y',
+    '?x -r-> ?z <- ?x -s-> ?y',
+    '?x -?r-> ?y <- ?x -s-> ?y',
+    '?x -r-> ?y, ?y -r-> ?x <- ?x -s-> ?y',
+])
+def test_malformed_rules(text):
+    with pytest.raises(RuleError):
+        Rule.parse(text)
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import shutil
+
+import pytest
+
+from trigraph.snapshot import (MappedStore, SnapshotError, load_store, open_snapshot,
+                               snapshot_path, write_snapshot)
+from trigraph.store import ROLES
+
+from .conftest import CORE_SHEETS
+
+
+def test_snapshot_round_trip(synthetic, tmp_path):
+    path = str(tmp_path / 'model.snapshot')
+    fingerprint = hashlib.sha256(b'synthetic').digest()
+    write_snapshot(synthetic, path, fingerprint)
+    mapped = open_snapshot(path, fingerprint)
+    assert list(mapped.strings) == list(synthetic.strings)
+    assert list(mapped.triples()) == list(synthetic.triples())
+    assert [mapped.provenance(r) for r in range(0, synthetic.num_relations, 97)] == \
+        [synthetic.provenance(r) for r in range(0, synthetic.num_relations, 97)]
+    for role in ROLES:
+        assert list(mapped.by(role).row(3)) == list(synthetic.by(role).row(3))
+    with pytest.raises(SnapshotError):
+        open_snapshot(path, hashlib.sha256(b'other').digest())
+
+
+def test_mapped_store_is_read_only(core_store, tmp_path):
+    path = str(tmp_path / 'model.snapshot')
+    write_snapshot(core_store, path, bytes(32))
+    with open_snapshot(path) as mapped:
+        with pytest.raises(TypeError):
+            mapped.add('a', 'type', 'metaNType')
+        store = mapped.thaw()
+        store.add('a', 'type', 'metaNType')
+        assert store.num_relations == mapped.num_relations + 1
+
+
+def test_load_store_returns_a_mapped_store_cold_and_warm(core_store, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sheets = shutil.copytree(CORE_SHEETS, str(tmp_path / 'sheets'))
+    path = snapshot_path(sheets)
+    cold = load_store(sheets)
+    built = os.stat(path).st_mtime_ns
+    warm = load_store(sheets)
+    assert os.stat(path).st_mtime_ns == built
+    for store in (cold, warm):
+        assert isinstance(store, MappedStore)
+        assert list(store.triples()) == list(core_store.triples())
+
+    # A touched sheet makes the snapshot stale
+    sheet = os.path.join(sheets, sorted(os.listdir(sheets))[0])
+    os.utime(sheet, ns=(built, built + 10**9))
+    load_store(sheets)
+    assert os.stat(path).st_mtime_ns != built
+
+
+def test_snapshot_per_set_of_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert snapshot_path('sheets') == snapshot_path('./sheets') == snapshot_path()
+    assert snapshot_path('sheets') != snapshot_path('other')
+    assert snapshot_path('a', 'b') == snapshot_path('b', 'a')
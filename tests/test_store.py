@@ -0,0 +1,70 @@
+from array import array
+
+import pytest
+
+from trigraph.store import RELATION, ROLES, Interner, TripleStore, group_by
+
+
+def test_interner_assigns_dense_ids_once():
+    strings = Interner(['a', 'b', 'a'])
+    assert list(strings) == ['a', 'b']
+    assert strings.intern('c') == 2
+    assert strings.intern('a') == 0
+    assert strings[1] == 'b' and 'c' in strings and 'd' not in strings
+    assert strings.get('d', -1) == -1
+
+
+def test_group_by_keeps_positions_in_order(rng):
+    keys = [rng.randrange(10) for _ in range(500)]
+    csr = group_by(keys, 12)
+    assert len(csr) == 12
+    for k in range(12):
+        assert list(csr.row(k)) == [i for i, key in enumerate(keys) if key == k]
+    values = array('i', range(1000, 1500))
+    assert list(group_by(keys, 12, values).row(3)) == [values[i] for i in csr.row(3)]
+
+
+def test_by_role_rows(synthetic):
+    for role in ROLES:
+        column = synthetic.column(role)
+        expected = {}
+        for r, node in enumerate(column):
+            expected.setdefault(node, []).append(r)
+        csr = synthetic.by(role)
+        for node in synthetic.node_ids():
+            assert list(csr.row(node)) == expected.get(node, [])
+
+
+def test_incidence_lists_each_black_node_once(synthetic):
+    expected = {}
+    for r, triple in enumerate(synthetic.triples()):
+        for node in set(triple):
+            expected.setdefault(node, set()).add(r)
+    incidence = synthetic.incidence()
+    for node in synthetic.node_ids():
+        row = list(incidence.row(node))
+        assert len(row) == len(set(row))
+        assert set(row) == expected.get(node, set())
+
+
+def test_extend_ids_matches_add_ids(synthetic):
+    one, bulk = TripleStore(), TripleStore()
+    for store in (one, bulk):
+        for name in synthetic.strings:
+            store.add_node(name)
+    for triple in synthetic.triples():
+        one.add_ids(*triple)
+    assert bulk.extend_ids(synthetic.source, synthetic.relation, synthetic.target) == 0
+    assert list(bulk.triples()) == list(one.triples())
+    assert bulk.relation_sheet == one.relation_sheet
+    assert bulk.relation_line == one.relation_line
+    assert list(bulk.by(RELATION).row(5)) == list(one.by(RELATION).row(5))
+
+
+def test_extend_ids_rejects_ragged_columns():
+    store = TripleStore()
+    store.add('a', 'r', 'b')
+    with pytest.raises(ValueError):
+        store.extend_ids([0, 1], [1], [2, 0])
+    assert store.num_relations == 1
+
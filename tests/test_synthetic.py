@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from trigraph.bench import STAGES, compare, report, run_size
+from trigraph.synthetic import Spec, estimate, generate, spec_for
+
+from .conftest import CORE_INFO, CORE_SHEETS, ROOT, core_model, synthetic_store
+
+
+def _contents(files, root):
+    result = {}
+    for path in files:
+        with open(path) as f:
+            result[os.path.relpath(path, root)] = f.read()
+    return result
+
+
+def test_generator_is_deterministic(tmp_path):
+    spec = spec_for(1500)
+    first = generate(str(tmp_path / 'a'), spec, core=CORE_SHEETS, core_info=CORE_INFO)
+    second = generate(str(tmp_path / 'b'), spec, core=CORE_SHEETS, core_info=CORE_INFO)
+    assert _contents(first, str(tmp_path / 'a')) == _contents(second, str(tmp_path / 'b'))
+    other = generate(str(tmp_path / 'c'), spec._replace(seed=1), core=CORE_SHEETS,
+                     core_info=CORE_INFO)
+    assert _contents(other, str(tmp_path / 'c')) != _contents(first, str(tmp_path / 'a'))
+
+
+@pytest.mark.parametrize('relations, params', [
+    (500, {}), (5000, {}), (20000, {'layers': 3, 'fanout': 3, 'edges': 2}),
+    (5000, {'wildcards': 0.0}), (5000, {'wildcards': 1.0}),
+])
+def test_estimate_matches_generated_size(tmp_path, relations, params):
+    spec = spec_for(relations, **params)
+    store = synthetic_store(tmp_path, relations, **params)
+    generated = store.num_relations - core_model().num_relations
+    assert generated == estimate(spec)
+    assert 0.5 * relations <= generated <= 1.5 * relations
+
+
+def test_spec_for_scales_packages_or_nodes():
+    assert spec_for(10**6).packages > spec_for(10**5).packages > 1
+    small = spec_for(100)
+    assert small.packages == 1 and sum(small.nodes) < sum(Spec().nodes)
+
+
+def test_bench_runs_every_stage(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)                 # generate() copies the core from ./sheets
+    result = run_size(1000, {}, str(tmp_path), jobs=1)
+    assert set(STAGES) <= set(result['stages'])
+    assert result['relations'] > 1000 and result['shells'] > 1
+    assert all(stage['seconds'] >= 0 and stage['peak_mb'] > 0
+               for stage in result['stages'].values())
+
+    results = {'1000': result}
+    slower = {'1000': dict(result, stages={
+        name: dict(stage, seconds=stage['seconds'] * 3 + 1)
+        for name, stage in result['stages'].items()})}
+    assert compare(results, results) == []
+    regressions = compare(slower, results)
+    assert sorted(name for _, name, metric, _, _ in regressions) == sorted(STAGES)
+    assert any(line.startswith('REGRESSION 1000 relations, parse: seconds')
+               for line in report(slower, results, regressions))
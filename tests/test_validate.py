@@ -0,0 +1,52 @@
+from trigraph.store import TripleStore
+from trigraph.validate import SOURCE_TYPE, TARGET_TYPE, SignatureIndex, validate
+
+from .conftest import constrained_store
+
+
+def _brute_invalid(store):
+    """Relation ids no signature accepts, one relation at a time."""
+    index = SignatureIndex(store)
+
+    def accepts(signature, side, node):
+        allowed = set(index.allowed(signature, side))
+        return not allowed or bool(allowed.intersection(index.types(node)))
+
+    return [r for r, (s, rel, t) in enumerate(store.triples())
+            if not any(accepts(sig, SOURCE_TYPE, s) and accepts(sig, TARGET_TYPE, t)
+                       for sig in index.signatures(rel))]
+
+
+def test_validate_matches_per_relation_check(synthetic):
+    assert [v.relation for v in validate(synthetic)] == _brute_invalid(synthetic)
+
+
+def test_synthetic_tree_adds_no_violations(core_store, synthetic):
+    # Messages differ: the synthetic tree adds signatures to choose from
+    def triples(store):
+        return sorted((v.source, v.name, v.target) for v in validate(store))
+
+    assert triples(synthetic) == triples(core_store)
+
+
+def test_wrong_types_are_reported():
+    store = constrained_store([('car', 'likes', 'alice'), ('alice', 'unknown', 'bob')])
+    violations = {(v.source, v.name, v.target): v.message for v in validate(store)}
+    assert "sourceType thing is not person" in violations['car', 'likes', 'alice']
+    assert violations['alice', 'unknown', 'bob'] == "relation 'unknown' has no signature"
+    assert sorted(v.relation for v in validate(store)) == _brute_invalid(store)
+
+
+def test_masks_follow_node_types(synthetic):
+    index = SignatureIndex(synthetic)
+    for relation in list(index.signatures_of)[:20]:
+        for signature in index.signatures(relation):
+            for side in (SOURCE_TYPE, TARGET_TYPE):
+                allowed = set(index.allowed(signature, side))
+                expected = [int(not allowed or bool(allowed.intersection(index.types(n))))
+                            for n in range(synthetic.num_nodes)]
+                assert list(index.mask(signature, side)) == expected
+
+
+def test_empty_store():
+    assert validate(TripleStore()) == []
@@ -0,0 +1,66 @@
+import pytest
+
+from trigraph.packages import visible
+from trigraph.query import QueryEngine
+from trigraph.store import ROLES
+from trigraph.views import StoreView, ViewSet
+
+
+def _visible_nodes(store, layer):
+    return {n for n in store.node_ids() if visible(store.visibility(n), 0, layer)}
+
+
+@pytest.mark.parametrize('layer', [1, 2, 5])
+def test_view_matches_visibility_rules(synthetic, layer):
+    view = ViewSet(synthetic).view(layer)
+    nodes = _visible_nodes(synthetic, layer)
+    relations = [r for r, triple in enumerate(synthetic.triples()) if nodes.issuperset(triple)]
+    assert 0 < len(nodes) < synthetic.num_nodes
+    assert set(view.node_ids()) == nodes
+    assert list(view.relation_ids()) == relations
+    assert list(view.triples()) == [synthetic.triple(r) for r in relations]
+    shown = set(relations)
+    for role in ROLES:
+        for node in range(0, synthetic.num_nodes, 7):
+            assert list(view.by(role).row(node)) == \
+                [r for r in synthetic.by(role).row(node) if r in shown]
+    hidden = next(n for n in synthetic.node_ids() if n not in nodes)
+    assert synthetic.name(hidden) not in view.strings
+    assert view.strings.get(synthetic.name(hidden)) is None
+
+
+def test_views_share_masks_and_indexes(synthetic):
+    views = ViewSet(synthetic)
+    assert views.view(0) is synthetic
+    assert views.view(2).node_mask is views.view(7).node_mask
+    assert views.view(1).node_mask is not views.view(2).node_mask
+    engine = views.engine(2)
+    assert engine is views.engine(3)
+    assert engine._indexes is views.shared_engine._indexes
+    assert views.view(2).nbytes() == synthetic.num_nodes + synthetic.num_relations
+
+
+def test_view_queries_see_only_visible_relations(synthetic):
+    views = ViewSet(synthetic)
+    view = views.view(2)
+    engine = views.engine(2)
+    full = QueryEngine(synthetic)
+    shown = set(view.relation_ids())
+    type_ = synthetic.id('type')
+    assert list(engine.match_ids(relation=type_)) == \
+        [r for r in full.match_ids(relation=type_) if r in shown]
+    pattern = '?x -type-> ?t, ?x -metaLevel-> ?l'
+    expected = [s for s in full.query(pattern)
+                if all(view.strings.get(name) is not None for name in s.values())]
+    assert 0 < len(expected) < len(full.query(pattern))
+    assert sorted(map(sorted, map(dict.items, engine.query(pattern)))) == \
+        sorted(map(sorted, map(dict.items, expected)))
+
+
+def test_views_are_read_only(synthetic):
+    view = ViewSet(synthetic).view(2)
+    assert isinstance(view, StoreView)
+    with pytest.raises(TypeError):
+        view.add('a', 'type', 'metaNType')
+    with pytest.raises(TypeError):
+        view.add_node('a', 'public')
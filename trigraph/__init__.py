@@ -0,0 +1,17 @@
+"""
+Tooling for the layer-0 trigraph meta-model defined in `sheets/*.sheet`.
+"""
+
+from .sheets import (Model, Node, Relation, Sheet, SheetCache, SheetError,
+                     load_model, load_sheet, parse_sheet)
+from .store import TripleStore
+from .query import QueryEngine, QueryError
+from .validate import Violation, validate
+
+__all__ = [
+    'Model', 'Node', 'Relation', 'Sheet', 'SheetCache', 'SheetError',
+    'load_model', 'load_sheet', 'parse_sheet',
+    'TripleStore',
+    'QueryEngine', 'QueryError',
+    'Violation', 'validate',
+]
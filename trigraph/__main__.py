@@ -0,0 +1,55 @@
+"""
+Command line entry point: `python -m trigraph [--profile TRACE] <command> [args]`.
+
+`--profile` runs the command with `trigraph.tracing` spans enabled, writes
+a Chrome trace-event JSON to TRACE and prints a per-stage summary.
+`--profile-alloc` also traces Python allocations, which slows the run
+several times over.
+"""
+
+import importlib
+import sys
+
+from .tracing import profiling
+
+# command -> module providing main(argv)
+COMMANDS = {
+    'memory': 'trigraph.store',
+    'validate': 'trigraph.validate',
+    'rules': 'trigraph.rules',
+    'snapshot': 'trigraph.snapshot',
+    'emit': 'trigraph.emit',
+    'build': 'trigraph.build',
+    'packages': 'trigraph.packages',
+    'views': 'trigraph.views',
+    'analytics': 'trigraph.analytics',
+    'edit': 'trigraph.edit',
+    'daemon': 'trigraph.daemon',
+    'ask': 'trigraph.client',
+    'clusters': 'trigraph.clusters',
+    'synthetic': 'trigraph.synthetic',
+    'bench': 'trigraph.bench',
+    'convert': 'trigraph.convert',
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    trace = None
+    option = argv[0].partition('=')[0] if argv else None
+    if option in ('--profile', '--profile-alloc'):
+        if '=' in argv[0]:
+            trace, argv = argv[0].partition('=')[2], argv[1:]
+        elif len(argv) > 1:
+            trace, argv = argv[1], argv[2:]
+    if not argv or argv[0] not in COMMANDS:
+        print('usage: python -m trigraph [--profile[-alloc] TRACE] {%s} [args]'
+              % ','.join(COMMANDS), file=sys.stderr)
+        return 2
+    module = importlib.import_module(COMMANDS[argv[0]])
+    with profiling(trace, memory=option == '--profile-alloc'):
+        return module.main(argv[1:])
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
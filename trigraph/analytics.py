@@ -0,0 +1,382 @@
+"""
+Shell, distance and degree analytics over the trigraph.
+
+The trigraph is held as one CSR adjacency over white nodes (store node ids)
+and black nodes (`num_nodes + relation id`), built once from the store's
+incidence.  On top of it:
+
+`multi_source_bfs`
+    Bit-parallel BFS from many sources at once: every node carries one
+    Python int whose bit i says "reached from source i", and a level step
+    ORs the frontier's bits into its neighbours.  Per-source shell sizes
+    are accumulated in bit-sliced counters (one int per bit of the count),
+    so a level costs a few big-int operations per reached node no matter
+    how many sources share the batch.
+
+`shell_counts`, `eccentricities`
+    The same for any number of sources, in batches (or as plain BFS runs
+    for a handful of sources).
+
+`find_centers`
+    The center (minimum eccentricity white nodes) of the largest
+    component, using the eccentricity bounds of Takes and Kosters: every
+    BFS from v tightens max(d(v,w), ecc(v) - d(v,w)) <= ecc(w) <=
+    ecc(v) + d(v,w) for all w, and nodes whose lower bound exceeds the
+    best upper bound are dropped.  On hierarchical models a few BFS runs
+    settle most nodes; whatever the bounds cannot settle is measured with
+    batched BFS.
+
+`degree_stats`
+    Degree distributions of white nodes per role (red source, green
+    target, blue relation), from one counting pass per column.
+
+Results are rows for `write_table`, which writes tab-separated tables.
+"""
+
+import math
+from array import array
+from collections import Counter, namedtuple
+from itertools import accumulate, chain, compress, repeat
+from operator import add, and_, ne
+
+from .store import CSR, ROLES
+
+# Fewer sources than this are cheaper as separate plain BFS runs
+SMALL_BATCH = 8
+
+ShellCounts = namedtuple('ShellCounts', 'source eccentricity white black')
+DegreeStats = namedtuple('DegreeStats', 'role nodes nonzero total min max mean median p90 p99')
+Centers = namedtuple('Centers', 'radius centers eccentricity bfs_runs component unresolved')
+
+
+def adjacency(store):
+    """CSR over white and black trigraph nodes; each black node lists a white node once.
+
+    Black rows are (source, target, relation) with repeats left out, built
+    by interleaving the three columns under a keep mask.
+    """
+    num_white = store.num_nodes
+    incidence = store.incidence()
+    sources, relations, targets = store.source, store.relation, store.target
+    keep_target = list(map(ne, targets, sources))
+    keep_relation = list(map(and_, map(ne, relations, sources), map(ne, relations, targets)))
+    offsets = array('i', incidence.offsets)
+    ends = accumulate(map(add, map(add, keep_target, keep_relation), repeat(1)),
+                      initial=offsets[-1])
+    next(ends)
+    offsets.extend(ends)
+    indices = array('i', map(num_white.__add__, incidence.indices))
+    indices.extend(compress(chain.from_iterable(zip(sources, targets, relations)),
+                            chain.from_iterable(zip(repeat(True), keep_target, keep_relation))))
+    return CSR(offsets, indices)
+
+
+def _add_bits(planes, bits):
+    """Add 1 to the bit-sliced counters `planes` at every position set in `bits`."""
+    j = 0
+    while bits:
+        if j == len(planes):
+            planes.append(0)
+        carry = planes[j] & bits
+        planes[j] ^= bits
+        bits = carry
+        j += 1
+
+
+def _unslice(planes, k):
+    """Per-position counts from bit-sliced counters."""
+    counts = [0] * k
+    for j, plane in enumerate(planes):
+        weight = 1 << j
+        for i in _bit_positions(plane):
+            counts[i] += weight
+    return counts
+
+
+def _bit_positions(bits):
+    """Positions of the set bits of `bits`, lowest first."""
+    digits = bin(bits)[:1:-1]
+    i = digits.find('1')
+    while i != -1:
+        yield i
+        i = digits.find('1', i + 1)
+
+
+def multi_source_bfs(adj, sources, num_white):
+    """`ShellCounts` per source: eccentricity and white/black nodes per shell."""
+    sources = list(sources)
+    k = len(sources)
+    offsets, indices = adj.offsets, adj.indices
+    n = len(offsets) - 1
+    seen = [0] * n       # node -> bits of the sources that reached it
+    pending = [0] * n    # node -> bits first reaching it in the current step
+    for i, s in enumerate(sources):
+        seen[s] |= 1 << i
+    frontier = list(dict.fromkeys(sources))
+    bits_of = seen[:]
+    shells = []          # per level: (white planes, black planes)
+    active = []          # per level: sources that reached something new
+    planes = ([], [])
+    for s in frontier:
+        _add_bits(planes[s >= num_white], seen[s])
+    shells.append(planes)
+    active.append((1 << k) - 1)
+    while frontier:
+        touched = []
+        for v in frontier:
+            bits = bits_of[v]
+            for u in indices[offsets[v]:offsets[v + 1]]:
+                new = bits & ~seen[u]
+                if new:
+                    if not pending[u]:
+                        touched.append(u)
+                    pending[u] |= new
+        planes = ([], [])
+        level_active = 0
+        for u in touched:
+            new = bits_of[u] = pending[u]
+            pending[u] = 0
+            seen[u] |= new
+            _add_bits(planes[u >= num_white], new)
+            level_active |= new
+        if touched:
+            shells.append(planes)
+            active.append(level_active)
+        frontier = touched
+
+    eccentricity = [0] * k
+    remaining = (1 << k) - 1
+    for level in range(len(active) - 1, -1, -1):
+        hit = active[level] & remaining
+        if hit:
+            for i in _bit_positions(hit):
+                eccentricity[i] = level
+            remaining &= ~hit
+    white = [_unslice(w, k) for w, _ in shells]
+    black = [_unslice(b, k) for _, b in shells]
+    return [ShellCounts(s, eccentricity[i],
+                        [level[i] for level in white[:eccentricity[i] + 1]],
+                        [level[i] for level in black[:eccentricity[i] + 1]])
+            for i, s in enumerate(sources)]
+
+
+def shell_counts(adj, sources, num_white, batch=1024):
+    """`ShellCounts` per source, `batch` sources per bit-parallel BFS.
+
+    Each bit-parallel level rescans the neighbours of every node some source
+    newly reached, so below `SMALL_BATCH` sources plain BFS runs are cheaper.
+    """
+    sources = list(sources)
+    if len(sources) < SMALL_BATCH:
+        result = []
+        for s in sources:
+            dist, ecc = bfs(adj, s)
+            white, black = Counter(dist[:num_white]), Counter(dist[num_white:])
+            levels = range(ecc + 1)
+            result.append(ShellCounts(s, ecc, [white[d] for d in levels],
+                                      [black[d] for d in levels]))
+        return result
+    return [counts for start in range(0, len(sources), batch)
+            for counts in multi_source_bfs(adj, sources[start:start + batch], num_white)]
+
+
+def eccentricities(adj, nodes, num_white, batch=1024):
+    """{node: eccentricity (within its component)} for `nodes`."""
+    return {c.source: c.eccentricity for c in shell_counts(adj, nodes, num_white, batch)}
+
+
+def bfs(adj, source):
+    """(distances array, eccentricity) of one BFS; unreachable nodes stay -1."""
+    offsets, indices = adj.offsets, adj.indices
+    dist = array('i', [-1]) * (len(offsets) - 1)
+    dist[source] = 0
+    frontier = [source]
+    depth = 0
+    while frontier:
+        following = []
+        for v in frontier:
+            for u in indices[offsets[v]:offsets[v + 1]]:
+                if dist[u] < 0:
+                    dist[u] = depth + 1
+                    following.append(u)
+        if following:
+            depth += 1
+        frontier = following
+    return dist, depth
+
+
+def components(adj):
+    """array of component labels (0, 1, ...) per node, labelled in id order."""
+    n = len(adj.offsets) - 1
+    label = array('i', [-1]) * n
+    offsets, indices = adj.offsets, adj.indices
+    current = 0
+    for start in range(n):
+        if label[start] >= 0:
+            continue
+        label[start] = current
+        stack = [start]
+        while stack:
+            v = stack.pop()
+            for u in indices[offsets[v]:offsets[v + 1]]:
+                if label[u] < 0:
+                    label[u] = current
+                    stack.append(u)
+        current += 1
+    return label
+
+
+def find_centers(adj, num_white, batch=1024, max_runs=None):
+    """`Centers` of the component with the most white nodes.
+
+    Candidates are white nodes; eccentricities count black nodes too (a
+    white-to-white distance is twice the number of relations crossed).
+    Single BFS runs tighten the bounds while each one still rules out a
+    good share of the candidates; the rest are measured exactly with
+    batched BFS, `batch` at a time.
+
+    With `max_runs`, the search stops after that many BFS runs (single or
+    batched); `radius` and `centers` then only cover the nodes measured so
+    far and `unresolved` counts the candidates that could still be centers.
+    """
+    if max_runs is not None:
+        max_runs = max(max_runs, 1)
+    label = components(adj)
+    sizes = Counter(label[:num_white])
+    if not sizes:
+        return Centers(0, [], {}, 0, None, 0)
+    component = max(sizes, key=lambda c: (sizes[c], -c))
+    candidates = set(compress(range(num_white), map(component.__eq__, label[:num_white])))
+    lower = dict.fromkeys(candidates, 0)
+    upper = dict.fromkeys(candidates, math.inf)
+    exact = {}
+    best = math.inf                  # smallest upper bound seen: radius <= best
+    runs = 0
+    pick_low = True
+    while len(candidates) > batch and runs != max_runs:
+        # Alternate: most promising center, then the least constrained node
+        if pick_low:
+            v = min(candidates, key=lambda w: (lower[w], w))
+        else:
+            v = max(candidates, key=lambda w: (upper[w], -w))
+        pick_low = not pick_low
+        dist, ecc = bfs(adj, v)
+        runs += 1
+        exact[v] = ecc
+        best = min(best, ecc)
+        for w in candidates:
+            d = dist[w]
+            lo = lower[w] = max(lower[w], d, ecc - d)
+            hi = upper[w] = min(upper[w], ecc + d)
+            if lo == hi:
+                exact[w] = lo
+            if hi < best:
+                best = hi
+        before = len(candidates)
+        candidates = {w for w in candidates if w not in exact and lower[w] <= best}
+        if before - len(candidates) < batch // 32:
+            break                    # bounds have stalled; measure the rest
+    remaining = sorted(candidates, key=lambda w: (lower[w], w))
+    while remaining and runs != max_runs:
+        chunk = remaining[:batch]
+        for counts in shell_counts(adj, chunk, num_white, batch):
+            exact[counts.source] = counts.eccentricity
+            best = min(best, counts.eccentricity)
+        runs += 1
+        remaining = [w for w in remaining[batch:] if lower[w] <= best]
+    radius = min(exact.values())
+    centers = sorted(w for w, e in exact.items() if e == radius)
+    unresolved = sum(1 for w in remaining if lower[w] <= radius)
+    return Centers(radius, centers, exact, runs, component, unresolved)
+
+
+def _percentile(histogram, n, q):
+    """q-th percentile of a degree distribution given as sorted (degree, count) pairs."""
+    rank = max(math.ceil(q * n) - 1, 0)
+    seen = 0
+    for degree, count in histogram:
+        seen += count
+        if seen > rank:
+            return degree
+    return 0
+
+
+def degree_stats(store, roles=ROLES):
+    """`DegreeStats` of white nodes per role, zero degrees included."""
+    n = store.num_nodes
+    stats = []
+    for role in roles:
+        degrees = Counter(store.column(role))
+        histogram = Counter(degrees.values())
+        if n > len(degrees):
+            histogram[0] = n - len(degrees)
+        histogram = sorted(histogram.items())
+        total = sum(d * c for d, c in histogram)
+        stats.append(DegreeStats(role, n, len(degrees), total,
+                                 histogram[0][0] if histogram else 0,
+                                 histogram[-1][0] if histogram else 0,
+                                 total / n if n else 0.0,
+                                 _percentile(histogram, n, 0.5),
+                                 _percentile(histogram, n, 0.9),
+                                 _percentile(histogram, n, 0.99)))
+    return stats
+
+
+def shell_rows(store, counts):
+    """Rows (center, shell, white, black, cumulative) for `ShellCounts`."""
+    name = store.name
+    for c in counts:
+        for shell, cumulative in zip(range(len(c.white)),
+                                     accumulate(map(int.__add__, c.white, c.black))):
+            yield name(c.source), shell, c.white[shell], c.black[shell], cumulative
+
+
+def write_table(out, name, header, rows):
+    """Write one table as `# name`, a header line and tab-separated rows."""
+    out.write(f'# {name}\n')
+    out.write('\t'.join(header) + '\n')
+    for row in rows:
+        out.write('\t'.join(f'{x:.3f}' if isinstance(x, float) else str(x) for x in row))
+        out.write('\n')
+    out.write('\n')
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    from .snapshot import load_store
+
+    parser = argparse.ArgumentParser(prog='trigraph analytics',
+                                     description='Shell, eccentricity and degree tables.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    parser.add_argument('--center', action='append', default=[],
+                        help='node to compute shells around (repeatable; default: the centers)')
+    parser.add_argument('--all', action='store_true',
+                        help='eccentricity of every white node (batched BFS)')
+    parser.add_argument('--batch', type=int, default=1024, help='sources per batched BFS')
+    parser.add_argument('--max-runs', type=int, default=None,
+                        help='stop the center search after this many BFS runs')
+    parser.add_argument('-o', '--output', help='write tables here instead of stdout')
+    args = parser.parse_args(argv)
+
+    store = load_store(*args.paths)
+    num_white = store.num_nodes
+    adj = adjacency(store)
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        centers = find_centers(adj, num_white, args.batch, args.max_runs)
+        write_table(out, 'centers', ('node', 'eccentricity', 'bfs_runs', 'unresolved'),
+                    ((store.name(c), centers.radius, centers.bfs_runs, centers.unresolved)
+                     for c in centers.centers))
+        sources = [store.id(c) for c in args.center] or centers.centers
+        counts = shell_counts(adj, sources, num_white, args.batch)
+        write_table(out, 'shells', ('center', 'shell', 'white', 'black', 'cumulative'),
+                    shell_rows(store, counts))
+        if args.all:
+            ecc = eccentricities(adj, range(num_white), num_white, args.batch)
+            write_table(out, 'eccentricity', ('node', 'eccentricity'),
+                        ((store.name(w), e) for w, e in sorted(ecc.items())))
+        write_table(out, 'degrees', DegreeStats._fields, degree_stats(store))
+    finally:
+        if out is not sys.stdout:
+            out.close()
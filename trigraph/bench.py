@@ -0,0 +1,225 @@
+"""
+Benchmark the pipeline on synthetic models and flag regressions.
+
+For each size (in relations) a tree is written with `trigraph.synthetic`
+and the stages run one after the other, the way the generators use them:
+
+    parse      parse_all over every sheet (no on-disk cache)
+    build      Model and TripleStore.from_model
+    bfs        Trigraph and bfs_shells around metaNType
+    order      radial_layout: shells ordered by barycenter sweeps
+    validate   signature validation and relation constraints
+    emit       DOT and PlantUML through one `emit` pass
+
+Every size runs in a fresh process, so the peak RSS recorded after each
+stage belongs to that size alone (it is a high-water mark: a stage that
+allocates less than an earlier one shows the earlier peak).  Results are
+compared with a baseline (`--save-baseline` stores one); a stage is a
+regression when its time or peak memory grows by more than the tolerance
+and by more than a noise floor:
+
+    python -m trigraph bench --sizes 1e3,1e4,1e5 --save-baseline
+    python -m trigraph bench --sizes 1e3,1e4,1e5 -o bench_output.txt
+"""
+
+import json
+import os
+import sys
+import time
+from multiprocessing import get_context
+
+from .sheets import DEFAULT_CACHE_DIR
+from .tracing import peak_rss_mb
+
+STAGES = ('parse', 'build', 'bfs', 'order', 'validate', 'emit')
+DEFAULT_SIZES = (10**3, 10**4, 10**5)
+DEFAULT_BASELINE = os.path.join(DEFAULT_CACHE_DIR, 'bench-baseline.json')
+DEFAULT_TOLERANCE = 0.25
+CENTER = 'metaNType'
+
+# Differences below these are noise, whatever the relative change
+MIN_SECONDS = 0.02
+MIN_MB = 4.0
+
+
+def run_size(relations, params, workdir, jobs=None):
+    """Generate a tree of about `relations` relations and time every stage."""
+    from .constraints import check_constraints
+    from .emit import Dot, PlantUml, emit
+    from .layout import Trigraph, bfs_shells, radial_layout
+    from .packages import parse_all
+    from .sheets import Model
+    from .store import TripleStore
+    from .synthetic import generate, spec_for
+    from .validate import validate
+
+    stages = {}
+    state = {}
+
+    def stage(name, run):
+        start = time.perf_counter()
+        state[name] = run()
+        stages[name] = {'seconds': time.perf_counter() - start, 'peak_mb': peak_rss_mb()}
+
+    spec = spec_for(relations, **params)
+    root = os.path.join(workdir, f'tree-{relations}')
+    stage('generate', lambda: generate(root, spec))
+    stage('parse', lambda: parse_all(state['generate'], cache_dir=None, jobs=jobs))
+    stage('build', lambda: TripleStore.from_model(Model(state['parse'])))
+    store = state['build']
+    del state['parse']
+    center = store.id(CENTER)
+
+    def shells():
+        graph = Trigraph(store)
+        return graph, bfs_shells(graph, center)[0]
+
+    stage('bfs', shells)
+    graph, bfs = state['bfs']
+    stage('order', lambda: radial_layout(graph, center))
+    stage('validate', lambda: validate(store) + check_constraints(store))
+    stage('emit', lambda: emit(store, [Dot(os.path.join(workdir, 'bench.dot')),
+                                       PlantUml(os.path.join(workdir, 'bench.puml'))]))
+    return {
+        'relations': store.num_relations,
+        'nodes': store.num_nodes,
+        'sheets': len(store.sheets),
+        'shells': len(bfs),
+        'crossings': state['order'].crossings,
+        'violations': len(state['validate']),
+        'spec': spec._asdict(),
+        'stages': stages,
+    }
+
+
+def _child(conn, relations, params, workdir, jobs):
+    try:
+        conn.send(run_size(relations, params, workdir, jobs))
+    except BaseException as e:
+        conn.send({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        conn.close()
+
+
+def run_isolated(relations, params, workdir, jobs=None):
+    """`run_size` in a fresh process; {'error': ...} if it fails or dies."""
+    context = get_context('spawn')
+    receive, send = context.Pipe(duplex=False)
+    process = context.Process(target=_child, args=(send, relations, params, workdir, jobs))
+    process.start()
+    send.close()
+    try:
+        result = receive.recv()
+    except EOFError:
+        result = None
+    process.join()
+    if result is None:
+        result = {'error': f'benchmark process exited with code {process.exitcode}'}
+    return result
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """(size, stage, metric, baseline value, value) of every regression."""
+    regressions = []
+    for size, result in results.items():
+        base = baseline.get(size)
+        if not base or 'stages' not in base or 'stages' not in result:
+            continue
+        for name in STAGES:
+            old, new = base['stages'].get(name), result['stages'].get(name)
+            if not old or not new:
+                continue
+            for metric, floor in (('seconds', MIN_SECONDS), ('peak_mb', MIN_MB)):
+                if (new[metric] > old[metric] * (1 + tolerance)
+                        and new[metric] - old[metric] > floor):
+                    regressions.append((size, name, metric, old[metric], new[metric]))
+    return regressions
+
+
+def _change(new, old):
+    return f'{(new - old) / old:+.0%}' if old else ''
+
+
+def report(results, baseline, regressions):
+    """The results table and regression list as lines of text."""
+    lines = [f'{"relations":>10}  {"stage":9} {"seconds":>9} {"peak MB":>9}  '
+             f'{"vs baseline (time / memory)"}']
+    for size, result in results.items():
+        if 'error' in result:
+            lines.append(f'{size:>10}  failed: {result["error"]}')
+            continue
+        base = (baseline.get(size) or {}).get('stages', {})
+        for name, values in result['stages'].items():
+            old = base.get(name)
+            change = (f'{_change(values["seconds"], old["seconds"]):>6} / '
+                      f'{_change(values["peak_mb"], old["peak_mb"])}') if old else ''
+            lines.append(f'{result["relations"] if name == "generate" else "":>10}  '
+                         f'{name:9} {values["seconds"]:9.3f} {values["peak_mb"]:9.1f}  {change}')
+        lines.append(f'{"":10}  {result["nodes"]} nodes, {result["sheets"]} sheets, '
+                     f'{result["shells"]} shells, {result["crossings"]} crossings, '
+                     f'{result["violations"]} violations')
+    if regressions:
+        lines.append('')
+        for size, name, metric, old, new in regressions:
+            lines.append(f'REGRESSION {size} relations, {name}: {metric} {old:.3f} -> {new:.3f} '
+                         f'({_change(new, old)})')
+    return lines
+
+
+def _sizes(text):
+    return [int(float(size)) for size in text.split(',')]
+
+
+def main(argv=None):
+    import argparse
+    import shutil
+    import tempfile
+    from .synthetic import add_arguments, spec_params
+
+    parser = argparse.ArgumentParser(prog='trigraph bench',
+                                     description='Time every pipeline stage on synthetic '
+                                                 'models and compare with a baseline.')
+    parser.add_argument('--sizes', type=_sizes, default=list(DEFAULT_SIZES),
+                        help='relation counts, e.g. 1e3,1e4,1e5 (up to 1e7)')
+    add_arguments(parser)
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='parser processes')
+    parser.add_argument('--workdir', help='keep generated trees here (default: a temp dir)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative growth (default %(default)s)')
+    parser.add_argument('-o', '--output', help='also write the report to this file')
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+    workdir = args.workdir or tempfile.mkdtemp(prefix='trigraph-bench-')
+    params = spec_params(args)
+    results = {}
+    try:
+        for size in args.sizes:
+            print(f'{size} relations ...', file=sys.stderr, flush=True)
+            results[str(size)] = run_isolated(size, params, workdir, args.jobs)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = compare(results, baseline, args.tolerance)
+    lines = report(results, baseline, regressions)
+    print('\n'.join(lines))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+    if args.save_baseline:
+        baseline.update((size, result) for size, result in results.items()
+                        if 'error' not in result)
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=1)
+        print(f'Saved baseline {args.baseline}')
+    failed = any('error' in result for result in results.values())
+    return 1 if regressions or failed else 0
@@ -0,0 +1,297 @@
+"""
+Incremental build of the generated artifacts.
+
+The pipeline is a small dependency graph of `Stage`s, each a command with
+declared input and output files:
+
+    sheets/*.sheet ─> model snapshot ─> complete-graph-grouped.dot ─> .png/.svg
+                                    └─> mnt-radial.dot ─────────────> .png/.svg
+    doc/overview.puml ─────────────────────────────────────────────> .png
+
+A stage's key is the SHA-256 of its command and the content hashes of its
+inputs.  It runs only if that key differs from the one recorded in the
+manifest (`.trigraph-cache/build-manifest.json`) or one of its outputs is
+missing or was changed by hand, so touching a sheet without changing it
+rebuilds nothing.  Content hashes are memoized by (size, mtime), which
+makes a no-op build one `stat` per file.
+
+A stage may list a file as both input and output when it updates it in
+place, as the radial stage does with its `BlackIds` file: its key is then
+taken after the run, so the update itself does not make the stage stale,
+but deleting or editing the file does.
+
+Stages run level by level; stale stages of one level (e.g. the independent
+renders) run in a process pool.  Renders whose tool (`dot`, `neato`,
+`plantuml`) is not installed are skipped and retried on the next build.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .convert import black_ids_path
+from .sheets import DEFAULT_CACHE_DIR, find_sheets
+from .snapshot import snapshot_path
+
+MANIFEST = os.path.join(DEFAULT_CACHE_DIR, 'build-manifest.json')
+MANIFEST_VERSION = 1
+
+Stage = namedtuple('Stage', 'name command inputs outputs')
+
+# Result states reported per stage
+BUILT, UP_TO_DATE, SKIPPED, FAILED = 'built', 'up to date', 'skipped', 'failed'
+
+
+class BuildError(Exception):
+    """The stage graph is inconsistent (e.g. a cycle or two producers)."""
+
+
+def package_sources():
+    here = os.path.relpath(os.path.dirname(os.path.abspath(__file__)))
+    return sorted(os.path.join(here, f) for f in os.listdir(here) if f.endswith('.py'))
+
+
+def default_stages(sheets='sheets'):
+    """The stages producing the artifacts checked in at the repository root."""
+    python = sys.executable or 'python3'
+    files = find_sheets(sheets)
+    code = package_sources()
+    snapshot = snapshot_path(sheets)
+    black_ids = black_ids_path(sheets)
+    stages = [
+        Stage('model', [python, '-m', 'trigraph', 'snapshot', sheets],
+              files + code, [snapshot]),
+        Stage('grouped', [python, 'generate_grouped_graph.py', '--sheets', sheets],
+              [snapshot, 'generate_grouped_graph.py'] + code,
+              ['complete-graph-grouped.dot']),
+        Stage('radial', [python, 'analyze_trigraph.py', '--sheets', sheets],
+              [snapshot, black_ids, 'analyze_trigraph.py'] + code,
+              ['mnt-radial.dot', black_ids]),
+    ]
+    for fmt in ('png', 'svg'):
+        stages.append(Stage(f'grouped.{fmt}',
+                            ['dot', f'-T{fmt}', 'complete-graph-grouped.dot',
+                             '-o', f'complete-graph-grouped.{fmt}'],
+                            ['complete-graph-grouped.dot'], [f'complete-graph-grouped.{fmt}']))
+        stages.append(Stage(f'radial.{fmt}',
+                            ['neato', f'-T{fmt}', 'mnt-radial.dot', '-o', f'mnt-radial.{fmt}'],
+                            ['mnt-radial.dot'], [f'mnt-radial.{fmt}']))
+    stages.append(Stage('overview.png', ['plantuml', '-tpng', 'doc/overview.puml'],
+                        ['doc/overview.puml'], ['doc/overview.png']))
+    return stages
+
+
+class FileHashes:
+    """SHA-256 of file contents, memoized by (size, mtime_ns)."""
+
+    def __init__(self, memo=None):
+        self.memo = dict(memo or {})    # path -> [size, mtime_ns, hexdigest]
+
+    def digest(self, path):
+        """Content hash of `path`, or None if it does not exist."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.memo.pop(path, None)
+            return None
+        entry = self.memo.get(path)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self.memo[path] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+
+def levels(stages):
+    """Stages grouped so each one only depends on stages of earlier levels."""
+    producer = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producer:
+                raise BuildError(f'{output} is produced by both {producer[output].name} '
+                                 f'and {stage.name}')
+            producer[output] = stage
+    level = {}
+
+    def depth(stage, visiting=()):
+        if stage.name in level:
+            return level[stage.name]
+        if stage.name in visiting:
+            raise BuildError(f'dependency cycle through {stage.name}')
+        deps = [producer[i] for i in stage.inputs if producer.get(i, stage) is not stage]
+        level[stage.name] = d = 1 + max((depth(s, visiting + (stage.name,)) for s in deps),
+                                        default=-1)
+        return d
+
+    for stage in stages:
+        depth(stage)
+    grouped = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for stage in stages:
+        grouped[level[stage.name]].append(stage)
+    return grouped
+
+
+def stage_key(stage, hashes):
+    h = hashlib.sha256(json.dumps(stage.command).encode())
+    for path in stage.inputs:
+        h.update(f'\0{path}\0{hashes.digest(path)}'.encode())
+    return h.hexdigest()
+
+
+def run_command(command):
+    """Run one stage command; (returncode, output).  Runs in a worker process."""
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    return result.returncode, result.stdout
+
+
+class Builder:
+    """Runs stale stages and records their keys in the manifest."""
+
+    def __init__(self, stages, manifest=MANIFEST, jobs=None):
+        self.stages = list(stages)
+        self.manifest = manifest
+        self.jobs = jobs
+        self.state = self._load_manifest()
+        self.hashes = FileHashes(self.state['files'])
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest) as f:
+                state = json.load(f)
+            if state.get('version') == MANIFEST_VERSION:
+                return state
+        except (FileNotFoundError, ValueError):
+            pass
+        return {'version': MANIFEST_VERSION, 'files': {}, 'stages': {}}
+
+    def _save_manifest(self):
+        self.state['files'] = self.hashes.memo
+        os.makedirs(os.path.dirname(self.manifest) or '.', exist_ok=True)
+        tmp = f'{self.manifest}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest)
+
+    def is_stale(self, stage, key):
+        recorded = self.state['stages'].get(stage.name)
+        if recorded is None or recorded['key'] != key:
+            return True
+        return any(self.hashes.digest(path) != digest
+                   for path, digest in recorded['outputs'].items())
+
+    def build(self, targets=None, force=False, dry_run=False, log=print):
+        """Bring `targets` (stage names, default all) up to date; {name: state}."""
+        wanted = self._closure(targets)
+        results = {}
+        try:
+            for group in levels(self.stages):
+                stale = []
+                for stage in group:
+                    if stage.name not in wanted:
+                        continue
+                    if any(results.get(dep) in (SKIPPED, FAILED) for dep in self._deps(stage)):
+                        results[stage.name] = SKIPPED
+                        log(f'{stage.name}: skipped (an input was not built)')
+                        continue
+                    key = stage_key(stage, self.hashes)
+                    if not force and not self.is_stale(stage, key):
+                        results[stage.name] = UP_TO_DATE
+                    elif shutil.which(stage.command[0]) is None:
+                        results[stage.name] = SKIPPED
+                        log(f'{stage.name}: skipped ({stage.command[0]} not found)')
+                    else:
+                        stale.append((stage, key))
+                if dry_run:
+                    for stage, _ in stale:
+                        results[stage.name] = BUILT
+                        log(f'{stage.name}: would run {" ".join(stage.command)}')
+                    continue
+                for (stage, key), (code, output) in zip(stale, self._run(stale)):
+                    if code == 0:
+                        if not set(stage.inputs).isdisjoint(stage.outputs):
+                            key = stage_key(stage, self.hashes)     # updated in place
+                        self.state['stages'][stage.name] = {
+                            'key': key,
+                            'outputs': {p: self.hashes.digest(p) for p in stage.outputs},
+                        }
+                        results[stage.name] = BUILT
+                        log(f'{stage.name}: built')
+                    else:
+                        self.state['stages'].pop(stage.name, None)
+                        results[stage.name] = FAILED
+                        log(f'{stage.name}: failed (exit {code})\n{output.rstrip()}')
+        finally:
+            if not dry_run:
+                self._save_manifest()
+        return results
+
+    def _run(self, stale):
+        commands = [stage.command for stage, _ in stale]
+        if len(commands) <= 1 or self.jobs == 1:
+            return [run_command(c) for c in commands]
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            return list(pool.map(run_command, commands))
+
+    def _deps(self, stage):
+        producer = {o: s.name for s in self.stages for o in s.outputs}
+        return [producer[i] for i in stage.inputs if producer.get(i, stage.name) != stage.name]
+
+    def _closure(self, targets):
+        """Names of `targets` and everything they depend on."""
+        names = {s.name for s in self.stages}
+        if not targets:
+            return names
+        unknown = set(targets) - names
+        if unknown:
+            raise BuildError(f'unknown targets: {", ".join(sorted(unknown))}')
+        by_name = {s.name: s for s in self.stages}
+        wanted, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in wanted:
+                wanted.add(name)
+                todo.extend(self._deps(by_name[name]))
+        return wanted
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(prog='trigraph build',
+                                     description='Rebuild generated artifacts whose inputs changed.')
+    parser.add_argument('targets', nargs='*', help='stage names (default: all)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='parallel renders')
+    parser.add_argument('-f', '--force', action='store_true', help='rebuild everything')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='only show what would run')
+    parser.add_argument('--sheets', default='sheets',
+                        help='sheet directory for the model and both generators')
+    parser.add_argument('--list', action='store_true', help='list stages and exit')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    stages = default_stages(args.sheets)
+    if args.list:
+        for group in levels(stages):
+            for stage in group:
+                print(f'{stage.name:16s} {" ".join(stage.outputs)}')
+        return 0
+    try:
+        results = Builder(stages, jobs=args.jobs).build(args.targets, args.force, args.dry_run)
+    except BuildError as e:
+        parser.error(str(e))
+    counts = {}
+    for state in results.values():
+        counts[state] = counts.get(state, 0) + 1
+    summary = ', '.join(f'{n} {state}' for state, n in counts.items())
+    print(f'{summary} in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+    return 1 if FAILED in counts else 0
@@ -0,0 +1,119 @@
+"""
+Client for the model daemon (see `trigraph.daemon` for the protocol).
+
+    with Client() as client:
+        client.call('lookup', name='metaType')
+        client.call('export', format='dot')
+
+One connection carries any number of requests; `call` raises
+`DaemonError` for an error response and returns the result otherwise.
+"""
+
+import json
+import socket
+
+from .daemon import DEFAULT_SOCKET
+
+
+class DaemonError(Exception):
+    """The daemon answered a request with an error."""
+
+
+class Client:
+    """Blocking JSON-lines connection to a running daemon."""
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.stream = self.sock.makefile('rwb')
+        self.next_id = 0
+        self.generation = None
+
+    def call(self, op, **params):
+        """Send one request and return its result."""
+        self.next_id += 1
+        request = dict(params, op=op, id=self.next_id)
+        self.stream.write(json.dumps(request).encode() + b'\n')
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError('daemon closed the connection')
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise DaemonError(response.get('error'))
+        self.generation = response.get('generation')
+        return response.get('result')
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _print(op, result):
+    if op == 'export':
+        print(result, end='')
+    elif op == 'validate':
+        from .validate import Violation, format_violation
+        for v in result:
+            print(format_violation(Violation(**v)))
+    elif op in ('match', 'query'):
+        for row in result:
+            print(' '.join(row) if isinstance(row, list) else
+                  ', '.join(f'{k}={v}' for k, v in row.items()))
+    else:
+        print(json.dumps(result, indent=2))
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(prog='trigraph ask',
+                                     description='Send one request to the model daemon.')
+    parser.add_argument('op', help='ping, status, lookup, match, query, validate, export, '
+                                   'reload or stop')
+    parser.add_argument('params', nargs='*', metavar='key=value',
+                        help='request parameters, e.g. name=metaType or format=dot')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--json', action='store_true', help='print the raw result as JSON')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='send the request this many times and report the latency')
+    args = parser.parse_args(argv)
+    params = {}
+    for param in args.params:
+        key, sep, value = param.partition('=')
+        if not sep:
+            parser.error(f'parameter {param!r} is not key=value')
+        params[key] = value
+
+    try:
+        client = Client(args.socket)
+    except OSError as e:
+        print(f'trigraph ask: no daemon on {args.socket} ({e.strerror or e}); '
+              f'start one with `python -m trigraph daemon`', file=sys.stderr)
+        return 2
+    with client:
+        try:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                result = client.call(args.op, **params)
+            elapsed = time.perf_counter() - start
+        except DaemonError as e:
+            print(f'trigraph ask: {e}', file=sys.stderr)
+            return 1
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print(args.op, result)
+    if args.repeat > 1:
+        print(f'{args.repeat} requests, {elapsed / args.repeat * 1e6:.0f}us each',
+              file=sys.stderr)
+    return 0
@@ -0,0 +1,334 @@
+"""
+Per-sheet layout of the grouped graph, computed in parallel and stitched.
+
+Graphviz lays out `complete-graph-grouped.dot` as one job, so its time
+grows with the whole graph even though most edges stay inside one sheet.
+Here every sheet cluster is laid out on its own -- top-down layers, like
+`dot`: cycles broken by reversing DFS back edges, nodes ranked by longest
+path, ranks ordered by barycenter sweeps -- in a process pool, the largest
+clusters first.  The clusters are then placed by the same layered layout
+run on the cluster graph, whose edges are the cross-sheet relations, and
+every node gets pinned coordinates:
+
+    layout = grouped_layout(store)
+    emit(store, [PinnedDot('complete-graph-pinned.dot', layout)])
+
+`neato -n2` renders the result without any layout of its own, so the
+whole pipeline costs about as much as the largest cluster plus one pass
+over the edges.
+
+Coordinates are in points, y up, with the origin at the bottom left.
+Node sizes are estimated from the label length at Graphviz's default
+14pt font, so boxes come out close to the size `neato` gives them.
+"""
+
+import math
+import os
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .emit import LABELS, ClusteredDot
+from .layout import crossings
+from .store import NO_SHEET, group_by
+from .tracing import count, span
+
+PARALLEL_THRESHOLD = 64     # clusters; fewer are laid out in-process
+
+NODE_HEIGHT = 36.0          # Graphviz default height, 0.5in
+MIN_WIDTH = 54.0            # default width, 0.75in
+CHAR_WIDTH = 7.5            # average glyph width at 14pt
+NODE_SEP = 18.0
+RANK_SEP = 54.0
+CLUSTER_PAD = 12.0          # inside a cluster box
+CLUSTER_LABEL = 24.0        # room for the sheet name above the nodes
+CLUSTER_SEP = 36.0          # between cluster boxes
+
+Layered = namedtuple('Layered', 'width height x y')
+GroupedLayout = namedtuple('GroupedLayout', 'x y boxes width height')
+
+
+def node_width(label):
+    return max(MIN_WIDTH, CHAR_WIDTH * len(label) + 2 * CLUSTER_PAD)
+
+
+def _acyclic(n, edges):
+    """Successor lists of `edges` with DFS back edges reversed."""
+    succ = [[] for _ in range(n)]
+    for u, v in edges:
+        if u != v:
+            succ[u].append(v)
+    dag = [[] for _ in range(n)]
+    state = bytearray(n)            # 0 unseen, 1 on the DFS stack, 2 finished
+    for root in range(n):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(succ[root]))]
+        while stack:
+            u, it = stack[-1]
+            for v in it:
+                if state[v] == 1:
+                    dag[v].append(u)
+                    continue
+                dag[u].append(v)
+                if not state[v]:
+                    state[v] = 1
+                    stack.append((v, iter(succ[v])))
+                    break
+            else:
+                state[u] = 2
+                stack.pop()
+    return dag
+
+
+def _ranks(dag):
+    """Longest-path rank of every node of an acyclic graph, and nodes by rank."""
+    n = len(dag)
+    indegree = [0] * n
+    for targets in dag:
+        for v in targets:
+            indegree[v] += 1
+    order = [u for u in range(n) if not indegree[u]]
+    rank = [0] * n
+    for u in order:                 # grows while iterating: Kahn's algorithm
+        next_rank = rank[u] + 1
+        for v in dag[u]:
+            if rank[v] < next_rank:
+                rank[v] = next_rank
+            indegree[v] -= 1
+            if not indegree[v]:
+                order.append(v)
+    layers = [[] for _ in range(max(rank, default=-1) + 1)]
+    for u in order:
+        layers[rank[u]].append(u)
+    return rank, layers
+
+
+def _crossings(layers, succ, rank, pos):
+    """Crossings between neighbouring ranks (longer edges are not counted)."""
+    total = 0
+    for k, layer in enumerate(layers[:-1]):
+        total += crossings(((pos[u], pos[v]) for u in layer for v in succ[u]
+                            if rank[v] == k + 1), len(layers[k + 1]))
+    return total
+
+
+def layered(widths, heights, edges, sweeps=4, node_sep=NODE_SEP, rank_sep=RANK_SEP,
+            max_ranks=None):
+    """Top-down layered layout of one graph; `Layered` box size and node centers.
+
+    `widths` and `heights` give the size of each node, `edges` are (u, v)
+    index pairs.  Ranks are ordered by alternating down and up sweeps that
+    sort each rank by the mean normalized position of its neighbours in the
+    other ranks; the ordering with the fewest crossings is kept.  Ranks are
+    then packed left to right with `node_sep` gaps and centered on the
+    widest one.  With `max_ranks`, deeper graphs have neighbouring ranks
+    merged so edges still point down (or sideways) but the box stays short.
+    """
+    n = len(widths)
+    if not n:
+        return Layered(0.0, 0.0, array('d'), array('d'))
+    succ = _acyclic(n, set(edges))
+    pred = [[] for _ in range(n)]
+    for u, targets in enumerate(succ):
+        for v in targets:
+            pred[v].append(u)
+    rank, layers = _ranks(succ)
+    if max_ranks and len(layers) > max_ranks:
+        depth = len(layers)
+        rank = [k * max_ranks // depth for k in rank]
+        merged = [[] for _ in range(max_ranks)]
+        for layer in layers:
+            for u in layer:
+                merged[rank[u]].append(u)
+        layers = merged
+
+    pos = [0] * n                   # index inside the rank
+    where = [0.0] * n               # normalized position, comparable across ranks
+    for layer in layers:
+        for i, u in enumerate(layer):
+            pos[u] = i
+            where[u] = (i + 0.5) / len(layer)
+    best = _crossings(layers, succ, rank, pos), [list(layer) for layer in layers]
+    for sweep in range(sweeps):
+        down = not sweep % 2
+        for layer in (layers[1:] if down else reversed(layers[:-1])):
+            nbrs = pred if down else succ
+            keyed = sorted((sum(map(where.__getitem__, nbrs[u])) / len(nbrs[u])
+                            if nbrs[u] else where[u], i, u)
+                           for i, u in enumerate(layer))
+            for i, (_, _, u) in enumerate(keyed):
+                layer[i] = u
+                pos[u] = i
+                where[u] = (i + 0.5) / len(layer)
+        crossings = _crossings(layers, succ, rank, pos)
+        if crossings < best[0]:
+            best = crossings, [list(layer) for layer in layers]
+        if not crossings:
+            break
+    layers = best[1]
+
+    spans = [sum(map(widths.__getitem__, layer)) + node_sep * (len(layer) - 1)
+             for layer in layers]
+    width = max(spans)
+    xs = array('d', bytes(8 * n))
+    ys = array('d', bytes(8 * n))
+    top = 0.0
+    for layer, span in zip(layers, spans):
+        row = max(map(heights.__getitem__, layer))
+        x = (width - span) / 2
+        for u in layer:
+            xs[u] = x + widths[u] / 2
+            ys[u] = top + row / 2
+            x += widths[u] + node_sep
+        top += row + rank_sep
+    return Layered(width, top - rank_sep, xs, ys)
+
+
+def _layout_cluster(job):
+    widths, edges = job
+    return layered(widths, [NODE_HEIGHT] * len(widths), edges)
+
+
+def layout_clusters(jobs, workers=None):
+    """`Layered` results for (widths, edges) jobs, using a process pool for many."""
+    workers = workers or os.cpu_count() or 1
+    if len(jobs) < PARALLEL_THRESHOLD or workers == 1:
+        return list(map(_layout_cluster, jobs))
+    # Largest first, so one big cluster is not left running alone at the end
+    order = sorted(range(len(jobs)), key=lambda i: -len(jobs[i][0]))
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, result in zip(order, pool.map(_layout_cluster, [jobs[i] for i in order],
+                                              chunksize=4)):
+            results[i] = result
+    return results
+
+
+def grouped_layout(store, jobs=None, labels=None):
+    """`GroupedLayout` of a store: node centers, cluster boxes and total size.
+
+    `x` and `y` are indexed by node id; `boxes` maps each sheet index (or
+    `NO_SHEET` for undeclared nodes) to its (x0, y0, x1, y1) bounding box.
+    """
+    labels = LABELS if labels is None else labels
+    num_sheets = len(store.sheets)
+    node_sheet = store.node_sheet
+    nodes = array('i', store.node_ids())
+    group_of = array('i', [0]) * store.num_nodes
+    for n in nodes:
+        group_of[n] = num_sheets if node_sheet[n] == NO_SHEET else node_sheet[n]
+    by_sheet = group_by([group_of[n] for n in nodes], num_sheets + 1, nodes)
+    groups = [g for g in range(num_sheets + 1) if by_sheet.row(g)]
+    if not groups:
+        empty = bytes(8 * store.num_nodes)
+        return GroupedLayout(array('d', empty), array('d', empty), {}, 0.0, 0.0)
+    index_of = {g: i for i, g in enumerate(groups)}
+
+    local = array('i', [0]) * store.num_nodes
+    jobs_ = []
+    for g in groups:
+        members = by_sheet.row(g)
+        for i, node in enumerate(members):
+            local[node] = i
+        widths = [node_width(labels.get(name, name))
+                  for name in map(store.name, members)]
+        jobs_.append((widths, set()))
+    cross = set()
+    for r in store.relation_ids():
+        s, _, t = store.triple(r)
+        gs, gt = group_of[s], group_of[t]
+        if gs == gt:
+            jobs_[index_of[gs]][1].add((local[s], local[t]))
+        else:
+            cross.add((index_of[gs], index_of[gt]))
+    with span('cluster_layout', clusters=len(groups)):
+        results = layout_clusters([(w, list(e)) for w, e in jobs_], jobs)
+    count('clusters', len(groups))
+
+    box_w = [max(c.width, CHAR_WIDTH * len(f'{store.sheets[g]}.sheet' if g < num_sheets else ''))
+             + 2 * CLUSTER_PAD for g, c in zip(groups, results)]
+    box_h = [c.height + 2 * CLUSTER_PAD + CLUSTER_LABEL for c in results]
+    # Cross-sheet edges of real models are anything but acyclic; a long chain
+    # of clusters would give a page miles high, so keep it about square
+    with span('stitch'):
+        placed = layered(box_w, box_h, cross, node_sep=CLUSTER_SEP, rank_sep=CLUSTER_SEP,
+                         max_ranks=math.isqrt(len(groups) - 1) + 1)
+
+    # Clusters and nodes were laid out y down; flip so the first rank is on top
+    height = placed.height
+    xs = array('d', bytes(8 * store.num_nodes))
+    ys = array('d', bytes(8 * store.num_nodes))
+    boxes = {}
+    for i, (g, cluster) in enumerate(zip(groups, results)):
+        x0 = placed.x[i] - box_w[i] / 2
+        top = placed.y[i] - box_h[i] / 2
+        boxes[NO_SHEET if g == num_sheets else g] = (
+            x0, height - top - box_h[i], x0 + box_w[i], height - top)
+        dx = x0 + CLUSTER_PAD + (box_w[i] - 2 * CLUSTER_PAD - cluster.width) / 2
+        dy = top + CLUSTER_PAD + CLUSTER_LABEL
+        for node in by_sheet.row(g):
+            xs[node] = dx + cluster.x[local[node]]
+            ys[node] = height - (dy + cluster.y[local[node]])
+    return GroupedLayout(xs, ys, boxes, placed.width, height)
+
+
+class PinnedDot(ClusteredDot):
+    """`ClusteredDot` with pinned node positions and cluster boxes, for `neato -n2`.
+
+    The legend is left out: it has no place in a pinned layout.
+    """
+
+    graph = 'complete_graph_pinned'
+
+    def __init__(self, path, layout, labels=None, colors=None):
+        super().__init__(path, labels, colors)
+        self.layout = layout
+
+    def begin(self):
+        super().begin()
+        width, height = self.layout.width, self.layout.height
+        self.line('  layout=neato;')
+        self.line(f'  bb="0,0,{width:.1f},{height:.1f}";')
+        self.line('  node [style=filled];')
+        self.line('  ')
+
+    def sheet(self, sheet):
+        super().sheet(sheet)
+        if self.clustered:
+            self.line('    bb="%.1f,%.1f,%.1f,%.1f";' % self.layout.boxes[sheet])
+
+    def attributes(self, node):
+        return f', pos="{self.layout.x[node]:.1f},{self.layout.y[node]:.1f}!"'
+
+    def end(self):
+        self.line('}')
+
+
+def main(argv=None):
+    import argparse
+    import time
+    from .emit import emit
+    from .snapshot import load_store
+
+    parser = argparse.ArgumentParser(prog='trigraph clusters',
+                                     description='Lay out each sheet cluster in parallel and '
+                                                 'write a pinned grouped DOT graph.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    parser.add_argument('-o', '--output', default='complete-graph-pinned.dot')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    store = load_store(*args.paths)
+    start = time.perf_counter()
+    layout = grouped_layout(store, args.jobs)
+    laid_out = time.perf_counter() - start
+    emit(store, [PinnedDot(args.output, layout)])
+    print(f'Laid out {len(layout.boxes)} clusters of {store.num_nodes} nodes '
+          f'in {laid_out:.2f}s')
+    print(f'Wrote {args.output}')
+    stem = args.output.rsplit('.', 1)[0]
+    print(f'To render: neato -n2 -Tsvg {args.output} -o {stem}.svg')
+    return 0
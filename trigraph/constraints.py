@@ -0,0 +1,220 @@
+"""
+Enforce the `unique` and `mandatory` relation properties.
+
+`relationProperties.sheet` defines properties that are attached to a
+relation signature with `relationPropertyRelation`:
+
+    unique     no two relations of the type with the same source and target
+    mandatory  every node the signature allows as source has at least one
+               outgoing relation of the type
+
+`check_constraints` checks a whole store in bulk: relations of each
+constrained type are keyed as integers (source * num_nodes + target) and
+compared as a set, and mandatory sources are found with whole-vector byte
+mask arithmetic, so a store with millions of relations is checked in one
+pass over the constrained relations only.
+
+`ConstraintIndex` keeps hash indexes on (relation, source, target) and
+(relation, source) for the constrained relation types, so single inserts
+and removals are checked in O(1).  Violations are returned as
+`trigraph.validate.Violation` records; `ConstraintError` carries them when
+loading has to stop (see `trigraph.snapshot.load_store`).
+"""
+
+from array import array
+from itertools import compress, repeat
+from operator import add, mul
+
+from .store import NO_SHEET
+from .tracing import span
+from .validate import SOURCE_TYPE, SignatureIndex, Violation
+
+UNIQUE = 'unique'
+MANDATORY = 'mandatory'
+
+_DECLARED = bytes([1] * 255 + [0])
+
+
+class ConstraintError(ValueError):
+    """Relations violate `unique` or `mandatory`; `violations` lists them."""
+
+    def __init__(self, violations):
+        self.violations = violations
+        count = len(violations)
+        first = violations[0].message if violations else ''
+        super().__init__(f'{count} relation constraint violation{"s" * (count != 1)}: {first}')
+
+
+def constrained(index):
+    """({unique relation ids}, {mandatory relation id: [signatures]}) of a store."""
+    store = index.store
+    names = {UNIQUE: store.strings.get(UNIQUE), MANDATORY: store.strings.get(MANDATORY)}
+    unique, mandatory = set(), {}
+    if names[UNIQUE] is None and names[MANDATORY] is None:
+        return unique, mandatory
+    for relation, signatures in index.signatures_of.items():
+        for signature in signatures:
+            properties = index.properties_of.get(signature, ())
+            if names[UNIQUE] in properties:
+                unique.add(relation)
+            if names[MANDATORY] in properties:
+                mandatory.setdefault(relation, []).append(signature)
+    return unique, mandatory
+
+
+def _violation(store, r, message):
+    source, relation, target = store.triple(r)
+    sheet, line = store.provenance(r)
+    name = store.name
+    return Violation(r, name(source), name(relation), name(target), sheet, line, message)
+
+
+def _missing(store, node, relation, signature):
+    sheet = store.node_sheet[node]
+    name = store.name
+    return Violation(None, name(node), name(relation), None,
+                     store.sheets[sheet] if sheet >= 0 else None, 0,
+                     f'{MANDATORY}: {name(node)!r} has no outgoing {name(relation)!r} relation '
+                     f'(required by {name(signature)})')
+
+
+def _duplicate(store, relation, first):
+    name = store.name
+    return (f'{UNIQUE}: duplicate {name(relation)!r} relation '
+            f'(first at {":".join(map(str, store.provenance(first)))})')
+
+
+def _select(store, relation):
+    """(ids, sources, targets) of the relations of type `relation`.
+
+    One filtering pass over the relation column; cheaper than building the
+    full by-relation CSR when only a few relation types are constrained.
+    """
+    selected = list(map(relation.__eq__, store.relation))
+    return (array('i', compress(range(len(selected)), selected)),
+            array('i', compress(store.source, selected)),
+            array('i', compress(store.target, selected)))
+
+
+def check_constraints(store, index=None):
+    """All `unique` and `mandatory` violations of `store`."""
+    with span('constraints'):
+        index = index or SignatureIndex(store)
+        unique, mandatory = constrained(index)
+        if not unique and not mandatory:
+            return []
+        n = store.num_nodes
+        violations = []
+        selections = {r: _select(store, r) for r in unique | mandatory.keys()}
+
+        for relation in sorted(unique):
+            ids, sources, targets = selections[relation]
+            keys = list(map(add, map(mul, sources, repeat(n)), targets))
+            if len(set(keys)) == len(keys):
+                continue
+            first = {}
+            for r, key in zip(ids, keys):
+                seen = first.setdefault(key, r)
+                if seen != r:
+                    violations.append(_violation(store, r, _duplicate(store, relation, seen)))
+
+        # 1 per declared node: visibility codes are small, undeclared is -1 (0xff)
+        codes = store.node_visibility
+        raw = codes.tobytes() if isinstance(codes, array) else bytes(codes)
+        declared = int.from_bytes(raw.translate(_DECLARED), 'little')
+        for relation, signatures in sorted(mandatory.items()):
+            has = bytearray(n)
+            for s in selections[relation][1]:
+                has[s] = 1
+            lacking = declared & ~int.from_bytes(has, 'little')
+            for signature in signatures:
+                allowed = int.from_bytes(index.mask(signature, SOURCE_TYPE), 'little')
+                flags = (allowed & lacking).to_bytes(n, 'little')
+                i = flags.find(1)
+                while i != -1:
+                    violations.append(_missing(store, i, relation, signature))
+                    i = flags.find(1, i + 1)
+        return violations
+
+
+class ConstraintIndex:
+    """Hash indexes for O(1) constraint checks of single inserts and removals.
+
+    (relation, source, target) counts are kept for `unique` relation types
+    and (relation, source) counts for `mandatory` ones; other relations are
+    not indexed at all.
+    """
+
+    def __init__(self, store, index=None):
+        self.store = store
+        self.index = index or SignatureIndex(store)
+        self.unique, self.mandatory = constrained(self.index)
+        self.triples = {}      # (relation, source, target) -> first relation id
+        self.copies = {}       # (relation, source, target) -> number of relations
+        self.sources = {}      # (relation, source) -> number of relations
+        for r in store.relation_ids():
+            self._add(r, *store.triple(r))
+
+    def _add(self, r, source, relation, target):
+        if relation in self.unique:
+            key = relation, source, target
+            self.triples.setdefault(key, r)
+            self.copies[key] = self.copies.get(key, 0) + 1
+        if relation in self.mandatory:
+            key = relation, source
+            self.sources[key] = self.sources.get(key, 0) + 1
+
+    def check_insert(self, source, relation, target):
+        """Violations adding `source -relation-> target` (ids) would cause."""
+        if relation not in self.unique:
+            return []
+        first = self.triples.get((relation, source, target))
+        if first is None:
+            return []
+        name = self.store.name
+        return [Violation(None, name(source), name(relation), name(target), None, 0,
+                          _duplicate(self.store, relation, first))]
+
+    def check_remove(self, source, relation, target):
+        """Violations removing one `source -relation-> target` (ids) would cause."""
+        if self.sources.get((relation, source), 0) != 1:
+            return []
+        return [_missing(self.store, source, relation, signature)
+                for signature in self.mandatory[relation]
+                if self.index.mask(signature, SOURCE_TYPE)[source]]
+
+    def insert(self, source, relation, target, sheet=NO_SHEET, line=0):
+        """Add a relation (node ids) to the store; raises `ConstraintError` first if invalid."""
+        violations = self.check_insert(source, relation, target)
+        if violations:
+            raise ConstraintError(violations)
+        r = self.store.add_ids(source, relation, target, sheet, line)
+        self._add(r, source, relation, target)
+        return r
+
+    def remove(self, source, relation, target):
+        """Record that one such relation was removed; returns the violations it causes."""
+        violations = self.check_remove(source, relation, target)
+        key = relation, source, target
+        if key in self.copies:
+            self.copies[key] -= 1
+            if not self.copies[key]:
+                del self.copies[key], self.triples[key]
+        key = relation, source
+        if key in self.sources:
+            self.sources[key] -= 1
+            if not self.sources[key]:
+                del self.sources[key]
+        return violations
+
+    def restore(self, r):
+        """Index relation `r` again, e.g. when its removal is undone."""
+        self._add(r, *self.store.triple(r))
+
+
+def enforce(store):
+    """Raise `ConstraintError` if `store` violates `unique` or `mandatory`."""
+    violations = check_constraints(store)
+    if violations:
+        raise ConstraintError(violations)
+    return store
@@ -0,0 +1,342 @@
+"""
+Convert between the complete graph and the trigraph as bulk column operations.
+
+The complete graph has one labelled edge `source -relation-> target` per
+relation.  The trigraph replaces each of them by a black node joined to
+the source (red), the target (green) and the relation node (blue); white
+nodes are the same in both.  Both forms are parallel integer columns:
+
+    Labelled(names, source, relation, target)           one row per relation
+    Bipartite(names, num_black, black, white, roles)    one row per edge
+
+`to_trigraph` and `from_trigraph` work with whole-column `map`, `compress`
+and C-level sorts, never a Python statement per edge, so large layers
+convert in linear time (plus one sort when the edges are not grouped by
+role).  By default a black node joins a white node once even when the
+white node plays several roles, as `emit.black_edges` draws it; `roles`
+is then the bit mask of every role the edge stands for (red 1, green 2,
+blue 4), so the conversion stays lossless.
+
+Black node `r` is relation `r`, which moves when relations are added or
+removed earlier in the load order.  `BlackIds` keeps the numbers in a file
+between runs, keyed by the (source, relation, target) names and the
+occurrence of duplicates, so a relation keeps its `rN`; new relations get
+numbers never handed out before.  Each set of sheet paths has its own
+file (`black_ids_path`), and `stable_black_names` is what the DOT and
+PlantUML outputs use, so both name a relation alike.
+
+    python -m trigraph convert to-trigraph sheets -o trigraph.tsv
+    python -m trigraph convert to-complete trigraph.tsv -o complete.tsv
+"""
+
+import hashlib
+import os
+from array import array
+from collections import Counter, namedtuple
+from itertools import chain, compress, repeat
+from operator import and_, eq, is_, lshift, not_, or_
+
+from .sheets import DEFAULT_CACHE_DIR
+from .store import RELATION, ROLES, SOURCE, TARGET, TripleStore, group_by
+from .tracing import count, span
+
+
+# Role bits of `Bipartite.roles`, and the role an edge is drawn with: its
+# first role in red, green, blue order
+ROLE_BITS = {SOURCE: 1, TARGET: 2, RELATION: 4}
+COLORS = (None, SOURCE, TARGET, SOURCE, RELATION, SOURCE, TARGET, SOURCE)
+ROLE_TEXT = tuple('+'.join(role for role in ROLES if mask & ROLE_BITS[role])
+                  for mask in range(8))
+
+Labelled = namedtuple('Labelled', 'names source relation target')
+Bipartite = namedtuple('Bipartite', 'names num_black black white roles')
+
+
+def labelled(store):
+    """The complete graph of a store or `StoreView`, sharing full columns."""
+    ids = store.relation_ids()
+    if ids == range(len(store.source)):
+        return Labelled(store.strings, store.source, store.relation, store.target)
+    ids = array('i', ids)
+    return Labelled(store.strings, *(array('i', map(column.__getitem__, ids))
+                                     for column in (store.source, store.relation,
+                                                    store.target)))
+
+
+def from_edges(edges):
+    """`Labelled` graph of (source, label, target) name triples, names interned in order."""
+    flat = list(chain.from_iterable(edges))
+    names = list(dict.fromkeys(flat))
+    ids = array('i', map(dict(zip(names, range(len(names)))).__getitem__, flat))
+    return Labelled(names, ids[0::3], ids[1::3], ids[2::3])
+
+
+def to_store(graph):
+    """A `TripleStore` holding `graph`; nodes are undeclared (no sheet or visibility)."""
+    store = TripleStore()
+    for name in graph.names:
+        store.add_node(name)
+    store.extend_ids(graph.source, graph.relation, graph.target)
+    return store
+
+
+def to_trigraph(graph, dedup=True):
+    """`Bipartite` trigraph of a `Labelled` graph: red edges, then green, then blue.
+
+    Without `dedup` every black node has exactly three edges, one per role.
+    """
+    with span('to_trigraph', dedup=dedup):
+        source, relation, target = graph.source, graph.relation, graph.target
+        n = len(source)
+        blacks = range(n)
+        black = array('i', blacks)
+        white = array('i', source)
+        if not dedup:
+            black *= 3
+            white.extend(target)
+            white.extend(relation)
+            roles = (array('B', [ROLE_BITS[SOURCE]]) * n + array('B', [ROLE_BITS[TARGET]]) * n
+                     + array('B', [ROLE_BITS[RELATION]]) * n)
+            return Bipartite(graph.names, n, black, white, roles)
+
+        # A target equal to the source, or a relation equal to either, folds
+        # into the earlier edge as an extra role bit
+        same_target = list(map(eq, target, source))
+        keep_target = list(map(not_, same_target))
+        relation_is_source = list(map(eq, relation, source))
+        relation_is_target = list(map(and_, map(eq, relation, target), keep_target))
+        keep_relation = list(map(not_, map(or_, relation_is_source, relation_is_target)))
+
+        roles = array('B', map(or_, map(or_, repeat(ROLE_BITS[SOURCE]),
+                                        map(lshift, same_target, repeat(1))),
+                               map(lshift, relation_is_source, repeat(2))))
+        roles.extend(map(or_, repeat(ROLE_BITS[TARGET]),
+                         map(lshift, compress(relation_is_target, keep_target), repeat(2))))
+        black.extend(compress(blacks, keep_target))
+        white.extend(compress(target, keep_target))
+        first_blue = len(black)
+        black.extend(compress(blacks, keep_relation))
+        white.extend(compress(relation, keep_relation))
+        roles.extend(repeat(ROLE_BITS[RELATION], len(black) - first_blue))
+        count('edges_deduped', 3 * n - len(black))
+    return Bipartite(graph.names, n, black, white, roles)
+
+
+def from_trigraph(trigraph):
+    """`Labelled` graph of a `Bipartite` trigraph, in any edge order.
+
+    Raises ValueError unless every black node has each role exactly once.
+    """
+    with span('from_trigraph'):
+        black, white, roles = trigraph.black, trigraph.white, trigraph.roles
+        n = trigraph.num_black
+        expected = array('i', range(n))
+        columns = {}
+        for role, bit in ROLE_BITS.items():
+            has = list(map(and_, roles, repeat(bit)))
+            blacks = array('i', compress(black, has))
+            whites = array('i', compress(white, has))
+            if blacks != expected:
+                order = sorted(range(len(blacks)), key=blacks.__getitem__)
+                blacks = array('i', map(blacks.__getitem__, order))
+                whites = array('i', map(whites.__getitem__, order))
+                if blacks != expected:
+                    raise ValueError(_role_error(blacks, n, role))
+            columns[role] = whites
+    return Labelled(trigraph.names, columns[SOURCE], columns[RELATION], columns[TARGET])
+
+
+def _role_error(blacks, n, role):
+    counts = Counter(blacks)
+    for b in range(n):
+        if counts[b] != 1:
+            return f'black node {b} has {counts[b]} {role} edges'
+    b = next(b for b in counts if not 0 <= b < n)
+    return f'{role} edge of black node {b}, outside 0..{n - 1}'
+
+
+def by_black(trigraph):
+    """CSR from black node to the positions of its edges, in edge order."""
+    return group_by(trigraph.black, trigraph.num_black)
+
+
+class BlackIds:
+    """Black node numbers that stay put across runs, kept in a TSV file.
+
+    The file starts with `# next N` and holds one `number, source, relation,
+    target, occurrence` line per relation.  `assign` numbers a graph and
+    adds its new relations to the map, `number` does the same for one
+    relation, and `save` writes the map.  Relations
+    that disappear keep their entry, so one that comes back gets its old
+    number again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.numbers = {}        # ((source, relation, target), occurrence) -> number
+        self.next = 1
+        try:
+            with open(path, encoding='utf-8') as f:
+                header = f.readline()
+                text = f.read()
+        except FileNotFoundError:
+            return
+        self.next = int(header.split()[-1])
+        fields = text.replace('\n', '\t').split('\t')[:-1]
+        keys = zip(zip(fields[1::5], fields[2::5], fields[3::5]), map(int, fields[4::5]))
+        self.numbers = dict(zip(keys, map(int, fields[0::5])))
+
+    def assign(self, graph):
+        """array of the black node number of every relation of a `Labelled` graph."""
+        with span('black_ids'):
+            names = graph.names
+            names = list(map(names.__getitem__, range(len(names))))
+            triples = list(zip(map(names.__getitem__, graph.source),
+                               map(names.__getitem__, graph.relation),
+                               map(names.__getitem__, graph.target)))
+            occurrences = array('i', bytes(4 * len(triples)))
+            repeated = Counter(triples)
+            if len(repeated) < len(triples):
+                repeated = {triple for triple, n in repeated.items() if n > 1}
+                seen = Counter()
+                for r in compress(range(len(triples)), map(repeated.__contains__, triples)):
+                    occurrences[r] = seen[triples[r]]
+                    seen[triples[r]] += 1
+            keys = list(zip(triples, occurrences))
+            numbers = list(map(self.numbers.get, keys))
+            new = list(compress(range(len(numbers)), map(is_, numbers, repeat(None))))
+            for r in new:
+                numbers[r] = self.next
+                self.next += 1
+            count('black_ids_new', len(new))
+            self.numbers.update(zip(map(keys.__getitem__, new), map(numbers.__getitem__, new)))
+        return array('i', numbers)
+
+    def number(self, triple, occurrence=0):
+        """Number of one relation, given as a name triple, adding it if it is new."""
+        key = tuple(triple), occurrence
+        number = self.numbers.get(key)
+        if number is None:
+            number = self.numbers[key] = self.next
+            self.next += 1
+        return number
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lines = [f'{number}\t{s}\t{r}\t{t}\t{k}'
+                 for ((s, r, t), k), number in sorted(self.numbers.items(),
+                                                      key=lambda item: item[1])]
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(f'# next {self.next}\n')
+            f.writelines(line + '\n' for line in lines)
+        os.replace(tmp, self.path)
+
+
+def black_names(numbers):
+    """`rN` name of every black node, from `BlackIds.assign` numbers."""
+    return list(map('r{}'.format, numbers))
+
+
+def black_ids_path(*paths):
+    """The `BlackIds` file of the model loaded from the sheet `paths`."""
+    key = '\0'.join(sorted(map(os.path.normpath, paths or ('sheets',))))
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(DEFAULT_CACHE_DIR, f'black-ids-{digest}.tsv')
+
+
+def stable_black_names(store, path):
+    """`rN` names of the relations of a full store, kept stable through `path`."""
+    ids = BlackIds(path)
+    names = black_names(ids.assign(labelled(store)))
+    ids.save()
+    return names
+
+
+def write_trigraph(path, trigraph, numbers=None):
+    """Write `black, white, roles` TSV lines, e.g. `r7  metaNType  red+green`."""
+    names = trigraph.names
+    blacks = black_names(range(1, trigraph.num_black + 1) if numbers is None else numbers)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(map('{}\t{}\t{}\n'.format, map(blacks.__getitem__, trigraph.black),
+                         map(names.__getitem__, trigraph.white),
+                         map(ROLE_TEXT.__getitem__, trigraph.roles)))
+
+
+def read_trigraph(path):
+    """(`Bipartite`, black node numbers) of a file written by `write_trigraph`."""
+    with open(path, encoding='utf-8') as f:
+        fields = f.read().replace('\n', '\t').split('\t')[:-1]
+    if len(fields) % 3:
+        raise ValueError('expected black, white, roles on every line')
+    labels = fields[0::3]
+    numbers = sorted(set(map(int, map(str.lstrip, labels, repeat('r')))))
+    index = dict(zip(black_names(numbers), range(len(numbers))))
+    names = list(dict.fromkeys(fields[1::3]))
+    masks = {text: mask for mask, text in enumerate(ROLE_TEXT)}
+    try:
+        roles = array('B', map(masks.__getitem__, fields[2::3]))
+    except KeyError as e:
+        raise ValueError(f'unknown roles {e.args[0]!r}') from None
+    trigraph = Bipartite(names, len(numbers), array('i', map(index.__getitem__, labels)),
+                         array('i', map(dict(zip(names, range(len(names)))).__getitem__,
+                                        fields[1::3])),
+                         roles)
+    return trigraph, array('i', numbers)
+
+
+def write_labelled(path, graph):
+    """Write `source, relation, target` TSV lines, one per relation."""
+    names = graph.names
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(map('{}\t{}\t{}\n'.format, map(names.__getitem__, graph.source),
+                         map(names.__getitem__, graph.relation),
+                         map(names.__getitem__, graph.target)))
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    from .snapshot import load_store
+
+    parser = argparse.ArgumentParser(prog='trigraph convert',
+                                     description='Convert between the complete graph and '
+                                                 'the trigraph as TSV edge lists.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    forward = commands.add_parser('to-trigraph', help='sheets -> black, white, roles lines')
+    forward.add_argument('paths', nargs='*', default=['sheets'])
+    forward.add_argument('-o', '--output', default='trigraph.tsv')
+    forward.add_argument('--black-ids',
+                         help="stable black node numbers (default: black_ids_path of the "
+                              "sheets; '' numbers by load order)")
+    forward.add_argument('--no-dedup', action='store_true',
+                         help='three edges per black node, even when white nodes repeat')
+    backward = commands.add_parser('to-complete',
+                                   help='black, white, roles lines -> source, relation, '
+                                        'target lines')
+    backward.add_argument('input')
+    backward.add_argument('-o', '--output', default='complete.tsv')
+    args = parser.parse_args(argv)
+
+    if args.command == 'to-trigraph':
+        graph = labelled(load_store(*args.paths))
+        numbers = None
+        path = black_ids_path(*args.paths) if args.black_ids is None else args.black_ids
+        if path:
+            ids = BlackIds(path)
+            numbers = ids.assign(graph)
+            ids.save()
+        trigraph = to_trigraph(graph, dedup=not args.no_dedup)
+        write_trigraph(args.output, trigraph, numbers)
+        print(f'{trigraph.num_black} black nodes, {len(trigraph.black)} edges -> {args.output}')
+        return 0
+
+    try:
+        trigraph, numbers = read_trigraph(args.input)
+        graph = from_trigraph(trigraph)
+    except ValueError as e:
+        print(f'{args.input}: {e}', file=sys.stderr)
+        return 1
+    write_labelled(args.output, graph)
+    print(f'{len(graph.source)} relations -> {args.output}')
+    return 0
@@ -0,0 +1,381 @@
+"""
+Resident model service on a Unix domain socket.
+
+`python -m trigraph daemon` loads the sheets once, polls them for changes
+(re-parsing only sheets whose size or mtime changed) and answers requests
+from any number of concurrent clients (`python -m trigraph ask`,
+`trigraph.client.Client`) until it is stopped.
+
+Protocol: JSON lines over the socket.  A request is one JSON object per
+line, with an operation and its parameters; every request gets exactly one
+response line, in order per connection:
+
+    -> {"id": 1, "op": "lookup", "name": "metaType"}
+    <- {"id": 1, "ok": true, "generation": 3, "result": {...}}
+    <- {"id": 2, "ok": false, "error": "unknown node 'x'"}
+
+`id` is optional and echoed back; `generation` counts model reloads, so a
+client can tell whether two answers came from the same model.
+
+    op         parameters                     result
+    ping                                      "pong"
+    status                                    sheets, nodes, relations, load errors, ...
+    lookup     name                           visibility, sheet, description, relations
+    match      source, relation, target       [[source, relation, target], ...]
+                 (names, each optional)
+    query      pattern                        [{variable: name}, ...]
+    validate                                  [{relation, source, name, target,
+                                                sheet, line, message}, ...]
+    export     format (dot, clustered,        the text of the diagram
+                 puml, trigraph-puml)
+    reload                                    paths re-parsed ([] if nothing changed)
+    stop                                      null; the daemon exits afterwards
+
+A sheet that fails to parse keeps the previous model in service; the error
+is listed by `status` until the sheet is fixed.  Validation results and
+exports are computed once per generation.
+"""
+
+import asyncio
+import io
+import json
+import os
+import time
+
+from .emit import FORMATS, emit
+from .query import QueryEngine
+from .sheets import DEFAULT_CACHE_DIR, Model, SheetCache, SheetError, find_sheets, load_sheet
+from .store import TripleStore
+
+DEFAULT_SOCKET = os.path.join(DEFAULT_CACHE_DIR, 'daemon.sock')
+DEFAULT_INTERVAL = 1.0
+
+# Requests may carry long query patterns, exports are only sent
+LINE_LIMIT = 1 << 20
+
+# Answered in a worker thread so they don't hold up lookups of other clients
+SLOW_OPS = {'query', 'validate', 'export'}
+
+
+class RequestError(Exception):
+    """A request the daemon cannot answer; reported to the client, not raised."""
+
+
+class Loaded:
+    """One generation of the model: sheets, store and per-generation results."""
+
+    def __init__(self, generation, sheets, errors):
+        self.generation = generation
+        self.sheets = sheets
+        self.errors = errors
+        self.model = Model(sheets)
+        self.store = TripleStore.from_model(self.model)
+        self.engine = QueryEngine(self.store)
+        self.results = {}            # validate / export results of this generation
+
+
+class ModelState:
+    """The sheets below `paths`, re-parsed per file when they change."""
+
+    def __init__(self, *paths, cache_dir=DEFAULT_CACHE_DIR):
+        self.paths = paths or ('sheets',)
+        self.cache = SheetCache(cache_dir)
+        self.stats = {}              # path -> (size, mtime_ns)
+        self.sheets = {}             # path -> Sheet
+        self.errors = {}             # path -> message of the last failed parse
+        self.current = None
+        self.refresh()
+
+    def refresh(self):
+        """Re-parse added or changed sheets; paths whose state changed."""
+        changed = []
+        seen = set()
+        for path in find_sheets(*self.paths):
+            seen.add(path)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            key = st.st_size, st.st_mtime_ns
+            if self.stats.get(path) == key:
+                continue
+            self.stats[path] = key
+            changed.append(path)
+            try:
+                self.sheets[path] = load_sheet(path, self.cache)
+                self.errors.pop(path, None)
+            except (SheetError, UnicodeDecodeError, OSError) as e:
+                self.errors[path] = str(e)
+        for path in set(self.stats) - seen:
+            changed.append(path)
+            del self.stats[path]
+            self.sheets.pop(path, None)
+            self.errors.pop(path, None)
+        if changed or self.current is None:
+            self._swap()
+        return sorted(changed)
+
+    def _swap(self):
+        generation = self.current.generation + 1 if self.current else 1
+        sheets = [self.sheets[p] for p in sorted(self.sheets)]
+        errors = dict(self.errors)
+        try:
+            loaded = Loaded(generation, sheets, errors)
+        except SheetError as e:
+            # E.g. a node declared twice across sheets: keep the last good model
+            if self.current is None:
+                raise
+            errors[e.path or '<model>'] = str(e)
+            self.current.errors = errors
+            return
+        # One assignment, so concurrent requests see either generation whole
+        self.current = loaded
+
+
+def _lookup(loaded, name):
+    store = loaded.store
+    node = store.strings.get(name)
+    if node is None:
+        raise RequestError(f'unknown node {name!r}')
+    declared = loaded.model.nodes.get(name)
+    names = store.name
+    return {
+        'name': name,
+        'visibility': store.visibility(node),
+        'sheet': declared.sheet if declared else None,
+        'description': declared.description if declared else None,
+        'out': [[names(store.relation[r]), names(store.target[r])]
+                for r in store.out_relations(node)],
+        'in': [[names(store.source[r]), names(store.relation[r])]
+               for r in store.in_relations(node)],
+    }
+
+
+def _validate(loaded):
+    from .constraints import check_constraints
+    from .validate import validate
+
+    violations = loaded.results.get('validate')
+    if violations is None:
+        store = loaded.store
+        violations = loaded.results['validate'] = [
+            v._asdict() for v in validate(store) + check_constraints(store)]
+    return violations
+
+
+def _export(loaded, fmt):
+    if fmt not in FORMATS:
+        raise RequestError(f'unknown format {fmt!r}; one of {", ".join(FORMATS)}')
+    key = 'export', fmt
+    text = loaded.results.get(key)
+    if text is None:
+        out = io.StringIO()
+        emit(loaded.store, [FORMATS[fmt](out)])
+        text = loaded.results[key] = out.getvalue()
+    return text
+
+
+class Daemon:
+    """asyncio server answering JSON-line requests about one `ModelState`."""
+
+    def __init__(self, state, socket_path=DEFAULT_SOCKET, interval=DEFAULT_INTERVAL, log=None):
+        self.state = state
+        self.socket_path = socket_path
+        self.interval = interval
+        self.log = log or (lambda message: None)
+        self.started = time.time()
+        self.requests = 0
+        self._stopped = None         # asyncio primitives, created by `serve`
+        self._refresh_lock = None
+
+    def stop(self):
+        if self._stopped is not None:
+            self._stopped.set()
+
+    def handle(self, request):
+        """The result of one decoded request; raises `RequestError`."""
+        op = request.get('op')
+        loaded = self.state.current
+        if op == 'ping':
+            return 'pong'
+        if op == 'lookup':
+            return _lookup(loaded, self._param(request, 'name'))
+        if op == 'match':
+            terms = (self._param(request, name, optional=True)
+                     for name in ('source', 'relation', 'target'))
+            return [list(t) for t in loaded.engine.match(*terms)]
+        if op == 'query':
+            return loaded.engine.query(self._param(request, 'pattern'))
+        if op == 'validate':
+            return _validate(loaded)
+        if op == 'export':
+            return _export(loaded, self._param(request, 'format'))
+        if op == 'status':
+            return {
+                'generation': loaded.generation,
+                'sheets': len(loaded.sheets),
+                'nodes': loaded.store.num_nodes,
+                'relations': loaded.store.num_relations,
+                'errors': loaded.errors,
+                'requests': self.requests,
+                'uptime': round(time.time() - self.started, 3),
+                'pid': os.getpid(),
+            }
+        raise RequestError(f'unknown op {op!r}')
+
+    @staticmethod
+    def _param(request, name, optional=False):
+        value = request.get(name)
+        if optional and value is None:
+            return None
+        if not isinstance(value, str):
+            missing = 'missing' if value is None else 'non-string'
+            raise RequestError(f'{request.get("op")}: {missing} string parameter {name!r}')
+        return value
+
+    async def respond(self, line):
+        """Response object for one raw request line."""
+        self.requests += 1
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {'id': None, 'ok': False, 'error': f'bad request: {e}'}
+        if not isinstance(request, dict):
+            return {'id': None, 'ok': False, 'error': 'bad request: not a JSON object'}
+        response = {'id': request.get('id')}
+        try:
+            op = request.get('op')
+            if op == 'reload':
+                result = await self.refresh()
+            elif op == 'stop':
+                self.stop()
+                result = None
+            elif op in SLOW_OPS:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(None, self.handle, request)
+            else:
+                result = self.handle(request)
+        except RequestError as e:
+            response.update(ok=False, error=str(e))
+        except ValueError as e:          # e.g. QueryError for a malformed pattern
+            response.update(ok=False, error=f'{type(e).__name__}: {e}')
+        except Exception as e:           # a bug, but the client still gets its line
+            self.log(f'request {request.get("op")!r} failed: {type(e).__name__}: {e}')
+            response.update(ok=False, error=f'internal error: {type(e).__name__}: {e}')
+        else:
+            response.update(ok=True, generation=self.state.current.generation, result=result)
+        return response
+
+    async def client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    response = {'id': None, 'ok': False, 'error': 'request line too long'}
+                    writer.write(json.dumps(response).encode() + b'\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self.respond(line)
+                writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass                         # client went away, or the daemon is stopping
+        finally:
+            writer.close()
+
+    async def refresh(self):
+        """Re-scan the sheets in a worker thread, one scan at a time."""
+        async with self._refresh_lock:
+            loop = asyncio.get_running_loop()
+            changed = await loop.run_in_executor(None, self.state.refresh)
+        if changed:
+            self.log(f'generation {self.state.current.generation}: '
+                     f'{len(changed)} sheet(s) changed ({", ".join(changed)})')
+        return changed
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:       # keep watching; the old model stays in service
+                self.log(f'refresh failed: {e}')
+
+    async def serve(self):
+        _claim_socket(self.socket_path)
+        self._stopped = asyncio.Event()
+        self._refresh_lock = asyncio.Lock()
+        server = await asyncio.start_unix_server(self.client, self.socket_path,
+                                                 limit=LINE_LIMIT)
+        watcher = asyncio.ensure_future(self.watch()) if self.interval > 0 else None
+        self.log(f'serving {self.socket_path} (pid {os.getpid()})')
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+
+def _claim_socket(path):
+    """Remove a stale socket file; fail if a daemon is still listening on it."""
+    import socket
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+    else:
+        raise RuntimeError(f'a daemon is already listening on {path}')
+    finally:
+        probe.close()
+
+
+def main(argv=None):
+    import argparse
+    import signal
+    import sys
+
+    parser = argparse.ArgumentParser(prog='trigraph daemon',
+                                     description='Serve the model over a Unix socket, '
+                                                 'reloading sheets as they change.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help='seconds between change polls (0: only on "reload")')
+    args = parser.parse_args(argv)
+
+    def log(message):
+        print(f'trigraph daemon: {message}', file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    state = ModelState(*args.paths)
+    loaded = state.current
+    log(f'{len(loaded.sheets)} sheets, {loaded.store.num_relations} relations '
+        f'loaded in {time.perf_counter() - start:.2f}s')
+    daemon = Daemon(state, args.socket, args.interval, log)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, daemon.stop)
+        await daemon.serve()
+
+    try:
+        asyncio.run(run())
+    except RuntimeError as e:
+        log(str(e))
+        return 1
+    return 0
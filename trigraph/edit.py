@@ -0,0 +1,557 @@
+"""
+Transactional edits of a store, with incremental radial layout updates.
+
+An `Editor` wraps a `TripleStore` and applies edits in transactions:
+
+    editor = Editor(store)
+    layout = LiveLayout(editor, store.id('metaNType'))
+    dot = RadialDot(layout)
+    with editor.transaction() as tx:
+        tx.add_relation('class', 'type', 'metaType')
+        tx.remove_relation(17)
+    for fragment in dot.patch():        # only what the edit changed
+        ...
+
+The store stays append-only: added nodes and relations are appended,
+removed ones are dropped from the editor's alive masks (which make
+`editor.view()` a `StoreView` of the current state for `emit`, queries and
+validation).  Edits are checked against `unique`/`mandatory` as they are
+made, and a transaction that raises is rolled back.  Committed changes are
+appended to `editor.log` and passed to the editor's listeners as a `Delta`.
+
+`LiveLayout` keeps shells, ring order and positions of a radial layout
+(see `trigraph.layout`) up to date from those deltas, touching only what the
+edit reaches:
+
+- Removing a black node can only push nodes outward.  Nodes whose every
+  parent (neighbour one shell further in) is gone are invalidated,
+  nearest first, and only their children are examined next.
+- Invalidated and new nodes are then settled by a BFS seeded from their
+  valid neighbours, which also pulls nodes inward when an added relation
+  is a shortcut.
+- A node that changed shell is taken off its old ring and inserted into
+  the new one at the (circular) mean angle of its parents, between its ring
+  neighbours.  Nothing else moves, so the cost is proportional to the
+  nodes whose distance changed.
+
+Rings fill unevenly over many edits; `relayout()` recomputes everything.
+Node keys are white node ids and `~r` (negative) for the black node of
+relation `r`, so they stay valid while nodes are added.
+
+Black nodes are named `rN` by their `BlackIds` number when the editor has
+one (`trigraph edit` uses the file `analyze_trigraph.py` does), so patched
+fragments name a relation as the full render does, and names do not shift
+when relations are removed.
+"""
+
+import math
+from bisect import bisect_left
+from collections import namedtuple
+from heapq import heapify, heappop, heappush
+from itertools import chain
+
+from .constraints import ConstraintError, ConstraintIndex
+from .convert import labelled
+from .emit import black_edges, black_name
+from .layout import BARYCENTER, Trigraph, radial_layout
+from .store import NO_SHEET
+from .views import StoreView
+
+ADD, REMOVE = 'add', 'remove'
+NODE, RELATION = 'node', 'relation'
+
+# `name` is the node name, or (source, relation, target) names for relations
+Change = namedtuple('Change', 'transaction op kind id name')
+Delta = namedtuple('Delta', 'transaction changes')
+Fragment = namedtuple('Fragment', 'kind name text')    # text None: fragment removed
+
+TWO_PI = 2 * math.pi
+
+# Edge colors of the radial diagram per role, as in analyze_trigraph.py
+ROLE_COLORS = {'red': '#FF0000', 'green': '#00AA00', 'blue': '#0000FF'}
+
+
+class Editor:
+    """Mutations of one store, grouped in transactions.
+
+    A snapshot-mapped store is read-only; the editor works on a `thaw()`ed
+    copy of it (`editor.store`).  With `black_ids` (a `convert.BlackIds`),
+    black nodes are named by their stable numbers; the caller saves it.
+    """
+
+    def __init__(self, store, check=True, black_ids=None):
+        store = self.store = store.thaw() if hasattr(store, 'thaw') else store
+        self.index = ConstraintIndex(store) if check else None
+        self.black_ids = black_ids
+        self.black_numbers = black_ids.assign(labelled(store)) if black_ids else None
+        self.node_alive = bytearray(b'\x01') * store.num_nodes
+        self.relation_alive = bytearray(b'\x01') * store.num_relations
+        self.log = []
+        self.transactions = 0
+        self.listeners = []          # called with every committed `Delta`
+        self._open = None
+        self.rebase()
+
+    def rebase(self):
+        """Take the store's incidence as the base again, dropping per-node additions."""
+        self.incidence = self.store.incidence()
+        self.base_nodes = self.store.num_nodes
+        self.added = {}              # white node -> relations added since the base
+
+    def transaction(self):
+        if self._open is not None:
+            raise RuntimeError('a transaction is already open')
+        self._open = Transaction(self, self.transactions + 1)
+        return self._open
+
+    def relations_of(self, node):
+        """Live relation ids touching white `node`, in any role."""
+        rows = self.incidence.row(node) if node < self.base_nodes else ()
+        alive = self.relation_alive
+        return [r for r in chain(rows, self.added.get(node, ())) if alive[r]]
+
+    def neighbors(self, key):
+        """Trigraph neighbours of a node key (white id, or ~r for black)."""
+        if key < 0:
+            return list(dict.fromkeys(self.store.triple(~key)))
+        return [~r for r in self.relations_of(key)]
+
+    def find(self, source, relation, target):
+        """Ids of the live relations `source -relation-> target` (names)."""
+        get = self.store.strings.get
+        s, rel, t = get(source), get(relation), get(target)
+        if s is None or not self.node_alive[s]:
+            return []
+        return [r for r in self.relations_of(s) if self.store.triple(r) == (s, rel, t)]
+
+    def view(self):
+        """The current state as a read-only `StoreView`."""
+        return StoreView(self.store, self.node_alive, self.relation_alive)
+
+    def black_name(self, r):
+        """Node name of relation `r`'s black node."""
+        if self.black_numbers is None:
+            return black_name(r)
+        return f'r{self.black_numbers[r]}'
+
+
+class Transaction:
+    """Edits applied to the store as they are made, undone unless committed."""
+
+    def __init__(self, editor, number):
+        self.editor = editor
+        self.number = number
+        self.changes = []
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if self.closed:
+            return False
+        if kind is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def _record(self, op, kind, id, name):
+        if self.closed:
+            raise RuntimeError(f'transaction {self.number} is closed')
+        self.changes.append(Change(self.number, op, kind, id, name))
+
+    def add_node(self, name, visibility=None, sheet=NO_SHEET):
+        """Id of node `name`, declaring (or reviving) it if needed."""
+        editor, store = self.editor, self.editor.store
+        existing = store.strings.get(name)
+        if existing is not None and editor.node_alive[existing]:
+            return existing
+        self._record(ADD, NODE, existing if existing is not None else store.num_nodes, name)
+        node = store.add_node(name, visibility, sheet)
+        if node == len(editor.node_alive):
+            editor.node_alive.append(1)
+        else:
+            editor.node_alive[node] = 1
+        return node
+
+    def add_relation(self, source, relation, target, sheet=NO_SHEET, line=0):
+        """Add `source -relation-> target` (names); returns the relation id."""
+        editor = self.editor
+        s, rel, t = self.add_node(source), self.add_node(relation), self.add_node(target)
+        if editor.index is not None:
+            r = editor.index.insert(s, rel, t, sheet, line)
+        else:
+            r = editor.store.add_ids(s, rel, t, sheet, line)
+        editor.relation_alive.append(1)
+        for node in dict.fromkeys((s, t, rel)):
+            editor.added.setdefault(node, []).append(r)
+        if editor.black_numbers is not None:
+            # Numbered like the same relation in a reloaded model: by its
+            # occurrence among the live copies of the triple
+            occurrence = len(editor.find(source, relation, target)) - 1
+            editor.black_numbers.append(
+                editor.black_ids.number((source, relation, target), occurrence))
+        self._record(ADD, RELATION, r, (source, relation, target))
+        return r
+
+    def remove_relation(self, r, check=True):
+        """Remove relation `r`; raises `ConstraintError` if that breaks `mandatory`."""
+        editor = self.editor
+        if r >= len(editor.relation_alive) or not editor.relation_alive[r]:
+            raise KeyError(f'no relation {black_name(r)}')
+        triple = editor.store.triple(r)
+        if editor.index is not None:
+            if check:
+                violations = editor.index.check_remove(*triple)
+                if violations:
+                    raise ConstraintError(violations)
+            editor.index.remove(*triple)
+        editor.relation_alive[r] = 0
+        self._record(REMOVE, RELATION, r, tuple(map(editor.store.name, triple)))
+
+    def remove_node(self, name):
+        """Remove node `name` and every relation touching it."""
+        editor = self.editor
+        node = editor.store.strings.get(name)
+        if node is None or not editor.node_alive[node]:
+            raise KeyError(name)
+        for r in editor.relations_of(node):
+            # Its own outgoing relations go with it; `mandatory` no longer applies
+            self.remove_relation(r, check=editor.store.source[r] != node)
+        editor.node_alive[node] = 0
+        self._record(REMOVE, NODE, node, name)
+
+    def commit(self):
+        """Close the transaction and notify the editor's listeners; returns the `Delta`."""
+        if self.closed:
+            raise RuntimeError(f'transaction {self.number} is closed')
+        self.closed = True
+        editor = self.editor
+        editor._open = None
+        editor.transactions = self.number
+        delta = Delta(self.number, tuple(self.changes))
+        editor.log.extend(delta.changes)
+        for listener in editor.listeners:
+            listener(delta)
+        return delta
+
+    def rollback(self):
+        """Undo every change of the transaction, newest first."""
+        editor = self.editor
+        index = editor.index
+        for change in reversed(self.changes):
+            if change.kind == RELATION:
+                alive = change.op == REMOVE
+                editor.relation_alive[change.id] = alive
+                if index is not None:
+                    if alive:
+                        index.restore(change.id)
+                    else:
+                        index.remove(*editor.store.triple(change.id))
+            else:
+                editor.node_alive[change.id] = change.op == REMOVE
+        self.changes = []
+        self.closed = True
+        editor._open = None
+
+
+class LiveLayout:
+    """Radial layout of an `Editor`'s store, updated from committed deltas."""
+
+    def __init__(self, editor, center, sweeps=4, method=BARYCENTER, base_radius=2.0):
+        self.editor = editor
+        self.center = center
+        self.sweeps = sweeps
+        self.method = method
+        self.base_radius = base_radius
+        self.relayout()
+        editor.listeners.append(self.apply)
+
+    def relayout(self):
+        """Compute the whole layout again (and rebase the editor)."""
+        editor = self.editor
+        editor.rebase()
+        if not editor.node_alive[self.center]:
+            raise ValueError(f'center {editor.store.name(self.center)!r} was removed')
+        graph = Trigraph(editor.view())
+        layout = radial_layout(graph, self.center, self.sweeps, self.method, self.base_radius)
+        num_white = graph.num_white
+        self.shell_of = {}
+        self.angle = {}
+        self.positions = {}
+        self.rings = []              # per shell: [(angle, key)] in ring order
+        self.radius = []
+        for k, nodes in enumerate(layout.shells):
+            ring = []
+            for v in nodes:
+                key = v if v < num_white else ~(v - num_white)
+                x, y = self.positions[key] = layout.positions[v]
+                angle = math.atan2(y, x) % TWO_PI if k else 0.0
+                self.shell_of[key] = k
+                self.angle[key] = angle
+                ring.append((angle, key))
+            ring.sort()
+            self.rings.append(ring)
+            self.radius.append(max(self.base_radius * k, len(nodes) / TWO_PI))
+        self.crossings = layout.crossings
+        self.rebuilt = True          # every fragment is stale
+        self.dirty = set()           # node keys placed, moved or dropped since the last patch
+        self.dirty_relations = set()
+
+    def apply(self, delta):
+        """Bring the layout up to date with one committed `Delta`."""
+        alive = self.editor.relation_alive
+        dropped, added = [], []
+        for change in delta.changes:
+            if change.kind == RELATION:
+                self.dirty_relations.add(change.id)
+                key = ~change.id
+                if change.op == REMOVE and not alive[change.id] and key in self.shell_of:
+                    dropped.append(key)
+                elif change.op == ADD and alive[change.id]:
+                    added.append(key)
+            elif change.op == REMOVE and change.id == self.center:
+                raise ValueError(f'center {change.name!r} was removed')
+        # Removed white nodes lost all their relations, and so all their parents
+        self._update(dict.fromkeys(dropped), dict.fromkeys(added))
+
+    def _update(self, dropped, added):
+        shell_of = self.shell_of
+        neighbors = self.editor.neighbors
+        previous = {}                # key -> shell before the update (None: not placed)
+
+        # Nodes whose every parent was dropped or invalidated, nearest first
+        heap = []
+        for key in dropped:
+            d = previous[key] = shell_of.pop(key)
+            heap.extend((d + 1, w) for w in neighbors(key) if shell_of.get(w) == d + 1)
+        heapify(heap)
+        invalid = set()
+        while heap:
+            d, u = heappop(heap)
+            if u in invalid or shell_of.get(u) != d:
+                continue
+            if any(shell_of.get(w) == d - 1 and w not in invalid for w in neighbors(u)):
+                continue
+            invalid.add(u)
+            for w in neighbors(u):
+                if shell_of.get(w) == d + 1:
+                    heappush(heap, (d + 1, w))
+        for u in invalid:
+            previous[u] = shell_of.pop(u)
+
+        # Settle invalidated and new nodes from their placed neighbours; a
+        # shortcut through a new node also moves placed nodes inward
+        heap = []
+        for u in chain(invalid, added):
+            previous.setdefault(u, None)
+            d = min((shell_of[w] for w in neighbors(u) if w in shell_of), default=None)
+            if d is not None:
+                heap.append((d + 1, u))
+        heapify(heap)
+        while heap:
+            d, u = heappop(heap)
+            current = shell_of.get(u)
+            if current is not None and current <= d:
+                continue
+            previous.setdefault(u, current)
+            shell_of[u] = d
+            for w in neighbors(u):
+                c = shell_of.get(w)
+                if c is None or c > d + 1:
+                    heappush(heap, (d + 1, w))
+
+        moved = [u for u, d in previous.items() if shell_of.get(u) != d]
+        for u in moved:
+            if previous[u] is not None:
+                self._unplace(u, previous[u])
+        for u in sorted((u for u in moved if u in shell_of), key=shell_of.__getitem__):
+            self._place(u, shell_of[u])
+        while len(self.rings) > 1 and not self.rings[-1]:
+            self.rings.pop()
+            self.radius.pop()
+        self.dirty.update(moved)
+        return moved
+
+    def _unplace(self, key, shell):
+        ring = self.rings[shell]
+        del ring[bisect_left(ring, (self.angle.pop(key), key))]
+        del self.positions[key]
+
+    def _place(self, key, shell):
+        """Insert `key` into ring `shell` at the mean angle of its parents."""
+        while len(self.rings) <= shell:
+            self.rings.append([])
+            self.radius.append(self.base_radius * len(self.radius))
+        ring = self.rings[shell]
+        parents = [self.angle[w] for w in self.editor.neighbors(key)
+                   if self.shell_of.get(w) == shell - 1] if shell > 1 else ()
+        if parents:
+            angle = math.atan2(sum(map(math.sin, parents)), sum(map(math.cos, parents))) % TWO_PI
+        elif ring:
+            # Around the center: the middle of the widest gap
+            gaps = [(b[0] - a[0], a[0]) for a, b in zip(ring, ring[1:])]
+            gaps.append((ring[0][0] + TWO_PI - ring[-1][0], ring[-1][0]))
+            width, start = max(gaps)
+            angle = (start + width / 2) % TWO_PI
+        else:
+            angle = 0.0
+        i = bisect_left(ring, (angle, key))
+        if ring:
+            # Stay strictly between the ring neighbours, away from both
+            low = ring[i - 1][0] if i else ring[-1][0] - TWO_PI
+            high = ring[i][0] if i < len(ring) else ring[0][0] + TWO_PI
+            room = (high - low) / 4
+            if not low + room <= angle <= high - room:
+                angle = ((low + high) / 2) % TWO_PI
+                i = bisect_left(ring, (angle, key))
+        ring.insert(i, (angle, key))
+        self.angle[key] = angle
+        radius = self.radius[shell]
+        self.positions[key] = (radius * math.cos(angle), radius * math.sin(angle))
+
+    def name(self, key):
+        return self.editor.black_name(~key) if key < 0 else self.editor.store.name(key)
+
+    def shells(self):
+        """Node keys per shell, in ring order."""
+        return [[key for _, key in ring] for ring in self.rings]
+
+
+class RadialDot:
+    """DOT text of a `LiveLayout`, kept as one fragment per node and black node's edges."""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.store = layout.editor.store
+
+    def node(self, key):
+        """The node's line, or None if it is not placed."""
+        layout = self.layout
+        position = layout.positions.get(key)
+        if position is None:
+            return None
+        name = layout.name(key)
+        x, y = position
+        if key < 0:
+            return f'  "{name}" [pos="{x:.2f},{y:.2f}!", label="", fillcolor=black, width=0.3, height=0.3];'
+        return f'  "{name}" [pos="{x:.2f},{y:.2f}!", label="{name.replace("Type", "")}"];'
+
+    def edges(self, r):
+        """The edge lines of relation `r`'s black node, or None if it was removed."""
+        if not self.layout.editor.relation_alive[r]:
+            return None
+        black, name = self.layout.editor.black_name(r), self.store.name
+        return '\n'.join(f'  {black} -- "{name(white)}" [color="{ROLE_COLORS[role]}"];'
+                         for white, role in black_edges(self.store, r))
+
+    def write(self, out):
+        """The whole diagram, in shell and ring order."""
+        out.write('graph trigraph_radial {\n  layout=neato;\n  overlap=false;\n  splines=true;\n')
+        out.write('  node [shape=circle, style=filled, fillcolor=white, fontcolor=black, '
+                  'width=0.5, height=0.5];\n')
+        for shell in self.layout.shells():
+            for key in shell:
+                out.write(self.node(key))
+                out.write('\n')
+        alive = self.layout.editor.relation_alive
+        for r in range(len(alive)):
+            if alive[r]:
+                out.write(self.edges(r))
+                out.write('\n')
+        out.write('}\n')
+        self._clean()
+
+    def patch(self):
+        """`Fragment`s changed since the last `write` or `patch`, or None after a relayout."""
+        layout = self.layout
+        if layout.rebuilt:
+            self._clean()
+            return None
+        fragments = [Fragment(NODE, layout.name(key), self.node(key)) for key in layout.dirty]
+        fragments.extend(Fragment(RELATION, layout.editor.black_name(r), self.edges(r))
+                         for r in sorted(layout.dirty_relations))
+        self._clean()
+        return fragments
+
+    def _clean(self):
+        layout = self.layout
+        layout.rebuilt = False
+        layout.dirty.clear()
+        layout.dirty_relations.clear()
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    import time
+    from .convert import BlackIds, black_ids_path
+    from .snapshot import load_store
+
+    parser = argparse.ArgumentParser(
+        prog='trigraph edit',
+        description='Apply edit scripts in transactions and keep a radial diagram up to date. '
+                    'Script lines: "+ source relation target", "- source relation target", '
+                    '"+node name", "-node name", "commit".')
+    parser.add_argument('script', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
+    parser.add_argument('--sheets', default='sheets')
+    parser.add_argument('--center', default='metaNType')
+    parser.add_argument('-o', '--output', help='write the final diagram here')
+    parser.add_argument('--black-ids',
+                        help='stable black node names, shared with analyze_trigraph.py '
+                             "(default: one file per --sheets; '' names them by load order)")
+    args = parser.parse_args(argv)
+
+    store = load_store(args.sheets)
+    black_ids = black_ids_path(args.sheets) if args.black_ids is None else args.black_ids
+    start = time.perf_counter()
+    editor = Editor(store, black_ids=BlackIds(black_ids) if black_ids else None)
+    layout = LiveLayout(editor, store.id(args.center))
+    dot = RadialDot(layout)
+    print(f'layout: {len(layout.shell_of)} nodes in {len(layout.rings)} shells '
+          f'in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+    dot.patch()
+
+    tx = None
+    for lineno, line in enumerate(chain(args.script, ['commit']), 1):
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        try:
+            if words[0] == 'commit':
+                if tx is not None:
+                    start = time.perf_counter()
+                    tx.commit()
+                    fragments = dot.patch()
+                    print(f'transaction {tx.number}: {len(tx.changes)} changes, '
+                          f'{len(fragments)} fragments in {time.perf_counter() - start:.4f}s')
+                    tx = None
+                continue
+            tx = tx or editor.transaction()
+            op, operands = words[0], words[1:]
+            if op == '+node' and len(operands) == 1:
+                tx.add_node(operands[0])
+            elif op == '-node' and len(operands) == 1:
+                tx.remove_node(operands[0])
+            elif op == '+' and len(operands) == 3:
+                tx.add_relation(*operands)
+            elif op == '-' and len(operands) == 3:
+                found = editor.find(*operands)
+                if not found:
+                    raise KeyError(' '.join(operands))
+                tx.remove_relation(found[0])
+            else:
+                raise ValueError(f'cannot parse {line.strip()!r}')
+        except (KeyError, ValueError) as e:
+            if tx is not None:
+                tx.rollback()
+                tx = None
+            print(f'{args.script.name}:{lineno}: {e}; transaction rolled back', file=sys.stderr)
+            return 1
+    if args.output:
+        with open(args.output, 'w') as f:
+            dot.write(f)
+    if editor.black_ids:
+        editor.black_ids.save()
+    return 0
@@ -0,0 +1,478 @@
+"""
+Stream a `TripleStore` to several graph formats in one pass.
+
+`emit` walks the store once -- nodes sheet by sheet, then relations in
+load order -- and hands every element to each writer, which formats it and
+writes it to its own buffered file.  Nothing is collected per format, so
+memory does not grow with the size of the output:
+
+    emit(store, [Dot('complete-graph.dot'),
+                 ClusteredDot('complete-graph-grouped.dot'),
+                 PlantUml('complete-graph.puml'),
+                 TrigraphPlantUml('trigraph.puml')])
+
+Duplicate relations (the same source, relation and target stated twice)
+are drawn once in the directed formats.  They are found per source node,
+so dedup needs one flag byte per relation plus a set the size of the
+largest out-degree instead of a set of every edge.  In the trigraph
+formats each black node deduplicates its own (at most three) edges.
+"""
+
+import re
+from array import array
+
+from .store import NO_SHEET, SOURCE, TARGET, RELATION, group_by
+from .tracing import count, span
+
+BUFFER_SIZE = 1 << 20
+
+# Short display labels; nodes not listed here are labelled with their name
+LABELS = {
+    'metaType': 'mt',
+    'metaLevelType': 'mlt',
+    'metaRelation': 'mr',
+    'metaRelationSignature': 'mrs',
+    'metaNType': 'mnt',
+    'relationSignature': 'rs',
+    'relationProperty': 'rp',
+    'metaLevel-0': 'ml0',
+    'metaLevel-1': 'ml1',
+    'metaLevel-2': 'ml2',
+    'metaLevel-3': 'ml3',
+    'metaLevel-N': 'mlN',
+    'metaLevel': 'ml',
+    'signature': 'sig',
+    'sourceType': 'st',
+    'targetType': 'tt',
+    'nextMetaLevel': 'nml',
+    'relationPropertyRelation': 'rpr',
+    'any-to-anyType': 'a2at',
+    'any-to-metaLevelType': 'a2mlt',
+    'metaNType-to-metaNType': 'mnt2mnt',
+    'metaLevelType-to-metaLevelType': 'ml2ml',
+    'metaRelation-to-metaRelationSignature': 'mr2mrs',
+    'metaRelationSignature-to-metaType': 'mrs2mt',
+    'relationSignature-to-relationProperty': 'rs2rp',
+    'relation-to-relationSignature': 'r2rs',
+}
+
+# Edge colors per relation; relation nodes are filled with the same color
+EDGE_COLORS = {
+    'type': '#0000FF',
+    'metaLevel': '#00AA00',
+    'signature': '#FF0000',
+    'sourceType': '#FF8800',
+    'targetType': '#AA00FF',
+    'nextMetaLevel': '#8B4513',
+    'relationPropertyRelation': '#008B8B',
+}
+DEFAULT_COLOR = '#000000'
+
+# Node shapes per visibility
+DOT_SHAPES = {'public': 'box', 'public+1': 'hexagon', 'private': 'ellipse'}
+PUML_SHAPES = {'public': 'rectangle', 'public+1': 'hexagon', 'private': None}
+
+_ALIAS_RE = re.compile(r'\W')
+
+
+def first_occurrences(store):
+    """bytearray over relation ids: 1 for the first of equal (s, r, t) relations.
+
+    The incidence row of a node lists the relations it is the source of
+    first and in load order, so duplicates are found one source at a time.
+    """
+    source, relation, target = store.source, store.relation, store.target
+    incidence = store.incidence()
+    first = bytearray(b'\x01') * store.num_relations
+    for node in range(store.num_nodes):
+        seen = set()
+        for r in incidence.row(node):
+            if source[r] != node:
+                break
+            key = relation[r], target[r]
+            if key in seen:
+                first[r] = 0
+            else:
+                seen.add(key)
+    return first
+
+
+def black_edges(store, r):
+    """(white node, role) edges of black node `r`, each white node once."""
+    s, rel, t = store.triple(r)
+    edges = [(s, SOURCE)]
+    if t != s:
+        edges.append((t, TARGET))
+    if rel != s and rel != t:
+        edges.append((rel, RELATION))
+    return edges
+
+
+def black_name(r):
+    return f'r{r + 1}'
+
+
+class Writer:
+    """Base class: one output file, fed by `emit`.
+
+    Subclasses override the hooks they need; `line` writes to the buffered
+    sink.  `path` may also be an open text stream, which is left open.
+    `labels` and `colors` default to `LABELS` and `EDGE_COLORS`.
+    """
+
+    def __init__(self, path, labels=None, colors=None):
+        self.path = path
+        self.labels = LABELS if labels is None else labels
+        self.colors = EDGE_COLORS if colors is None else colors
+        self.out = None
+        self.store = None
+
+    def open(self, store):
+        self.store = store
+        if hasattr(self.path, 'write'):
+            self.out = self.path        # a stream the caller owns and closes
+        else:
+            self.out = open(self.path, 'w', encoding='utf-8', buffering=BUFFER_SIZE)
+        self.begin()
+
+    def close(self):
+        self.end()
+        if self.out is not self.path:
+            self.out.close()
+
+    def line(self, text=''):
+        self.out.write(text)
+        self.out.write('\n')
+
+    def label(self, node):
+        name = self.store.name(node)
+        return self.labels.get(name, name)
+
+    def color(self, relation):
+        return self.colors.get(self.store.name(relation), DEFAULT_COLOR)
+
+    # Hooks, called by `emit` in this order
+    def begin(self):
+        pass
+
+    def sheet(self, sheet):
+        """Start the nodes of sheet id `sheet` (NO_SHEET: undeclared nodes)."""
+
+    def node(self, node):
+        pass
+
+    def end_sheet(self):
+        pass
+
+    def edges(self):
+        """Called once between the last node and the first relation."""
+
+    def relation(self, r, source, relation, target, first):
+        """Relation `r`; `first` is false for a repeated (s, r, t)."""
+
+    def end(self):
+        pass
+
+
+class Dot(Writer):
+    """Directed DOT graph: one node per white node, one edge per relation."""
+
+    graph = 'complete_graph'
+
+    def begin(self):
+        self.line(f'digraph {self.graph} {{')
+        self.line('  rankdir=TB;')
+        self.line('  splines=true;')
+        self.line('  overlap=false;')
+        self.line('  node [style=filled];')
+        self.line('  ')
+
+    def sheet(self, sheet):
+        name = self.store.sheets[sheet] if sheet != NO_SHEET else 'undeclared'
+        self.line(f'  // {name}')
+
+    def node(self, node, indent='  '):
+        shape = DOT_SHAPES.get(self.store.visibility(node), 'ellipse')
+        name = self.store.name(node)
+        extra = self.attributes(node)
+        if name in self.colors:
+            self.line(f'{indent}"{name}" [label="{self.label(node)}", shape={shape}, '
+                      f'fillcolor="{self.colors[name]}", fontcolor=white{extra}];')
+        else:
+            self.line(f'{indent}"{name}" [label="{self.label(node)}", shape={shape}, '
+                      f'fillcolor=white{extra}];')
+
+    def attributes(self, node):
+        """Extra `, key=value` attributes for a node line."""
+        return ''
+
+    def end_sheet(self):
+        self.line('  ')
+
+    def edges(self):
+        self.line('  // Edges')
+
+    def relation(self, r, source, relation, target, first):
+        if first:
+            name = self.store.name
+            self.line(f'  "{name(source)}" -> "{name(target)}" [color="{self.color(relation)}"];')
+
+    def end(self):
+        self.line('}')
+
+
+class ClusteredDot(Dot):
+    """Directed DOT graph with one `cluster_N` subgraph per sheet and a legend."""
+
+    graph = 'complete_graph_grouped'
+
+    def begin(self):
+        self.line(f'digraph {self.graph} {{')
+        self.line('  rankdir=TB;')
+        self.line('  compound=true;')
+        self.line('  newrank=true;')
+        self.line('  splines=true;')
+        self.line('  overlap=false;')
+        self.line('  ')
+        self.clustered = False
+
+    def sheet(self, sheet):
+        self.clustered = sheet != NO_SHEET
+        if self.clustered:
+            self.line(f'  subgraph cluster_{sheet} {{')
+            self.line(f'    label="{self.store.sheets[sheet]}.sheet";')
+            self.line('    style=filled;')
+            self.line('    color=lightgrey;')
+            self.line('    node [style=filled];')
+            self.line('    ')
+
+    def node(self, node):
+        super().node(node, '    ' if self.clustered else '  ')
+
+    def end_sheet(self):
+        if self.clustered:
+            self.line('  }')
+        self.line('  ')
+
+    def end(self):
+        self.line('  ')
+        self.line('  // Legend')
+        self.line('  subgraph cluster_legend {')
+        self.line('    label="Legend";')
+        self.line('    style=filled;')
+        self.line('    color=lightyellow;')
+        self.line('    ')
+        self.line('    legend_shape [label="Shapes:", shape=plaintext];')
+        self.line('    legend_public [label="public", shape=box, fillcolor=white, style=filled];')
+        self.line('    legend_public1 [label="public+1", shape=hexagon, fillcolor=white, style=filled];')
+        self.line('    legend_private [label="private", shape=ellipse, fillcolor=white, style=filled];')
+        self.line('    ')
+        self.line('    legend_edges [label="Edge Colors:", shape=plaintext];')
+        for name, color in self.colors.items():
+            self.line(f'    legend_{name} [label="{name}", shape=plaintext, fontcolor="{color}"];')
+        self.line('    ')
+        self.line('    {rank=same; legend_shape; legend_public; legend_public1; legend_private;}')
+        # Three colors share the row with the "Edge Colors:" title, then rows of four
+        names = [f'legend_{name}' for name in self.colors]
+        rows = [['legend_edges'] + names[:3]]
+        rows.extend(names[i:i + 4] for i in range(3, len(names), 4))
+        for row in rows:
+            self.line('    {rank=same; ' + ' '.join(f'{n};' for n in row) + '}')
+        self.line('  }')
+        self.line('}')
+
+
+def puml_alias(name):
+    """PlantUML alias for a node name (names like `metaLevel-0` are not identifiers)."""
+    return name if name.isidentifier() else _ALIAS_RE.sub('_', name) + '_'
+
+
+class PlantUml(Writer):
+    """Directed PlantUML diagram; node shapes follow visibility."""
+
+    title = 'Complete MetaMeta Graph'
+
+    def begin(self):
+        self.line(f'@startuml {self.title}')
+        self.line('skinparam nodesep 15')
+        self.line('skinparam ranksep 20')
+        self.line()
+
+    def sheet(self, sheet):
+        name = self.store.sheets[sheet] if sheet != NO_SHEET else 'undeclared'
+        self.line(f"' Nodes from {name}.sheet")
+
+    def node(self, node):
+        name = self.store.name(node)
+        label = self.label(node)
+        color = ''
+        if name in self.colors:
+            label = f'<color:white>{label}</color>'
+            color = f' {self.colors[name]}'
+        shape = PUML_SHAPES.get(self.store.visibility(node))
+        if shape is None:
+            self.line(f'({label}) as {puml_alias(name)}{color}')
+        else:
+            self.line(f'{shape} "{label}" as {puml_alias(name)}{color}')
+
+    def end_sheet(self):
+        self.line()
+
+    def edges(self):
+        self.line("' Relations")
+
+    def relation(self, r, source, relation, target, first):
+        if first:
+            name = self.store.name
+            self.line(f'{puml_alias(name(source))} -[{self.color(relation)}]-> '
+                      f'{puml_alias(name(target))}')
+
+    def end(self):
+        self.line()
+        self.line('@enduml')
+
+
+class TrigraphPlantUml(Writer):
+    """Bipartite trigraph: white nodes, and per relation a black node with
+    red (source), green (target) and blue (relation) edges.
+
+    Black nodes are `r1`, `r2`, ... in relation order unless `black_names`
+    (indexed by relation id, see `convert.stable_black_names`) names them.
+    """
+
+    title = 'Trigraph'
+
+    def __init__(self, path, labels=None, colors=None, black_names=None):
+        super().__init__(path, labels, colors)
+        self.black_names = black_names
+
+    def begin(self):
+        self.line(f'@startuml {self.title}')
+        self.line('skinparam nodesep 20')
+        self.line('skinparam ranksep 30')
+        self.line()
+        self.line("' White nodes")
+
+    def sheet(self, sheet):
+        name = self.store.sheets[sheet] if sheet != NO_SHEET else 'undeclared'
+        self.line(f"' Nodes from {name}.sheet")
+
+    def node(self, node):
+        self.line(f'({self.label(node)}) as {puml_alias(self.store.name(node))}')
+
+    def end_sheet(self):
+        self.line()
+
+    def edges(self):
+        self.line("' Black nodes (one per relation) and their edges")
+
+    def relation(self, r, source, relation, target, first):
+        black = black_name(r) if self.black_names is None else self.black_names[r]
+        name = self.store.name
+        self.line(f"' {name(source)} -{name(relation)}-> {name(target)}")
+        self.line(f'( ) as {black} #black')
+        # Roles are named after their edge colors
+        for white, role in black_edges(self.store, r):
+            alias = puml_alias(name(white))
+            if role == SOURCE:
+                self.line(f'{alias} -[#{role}]- {black}')
+            else:
+                self.line(f'{black} -[#{role}]- {alias}')
+
+    def end(self):
+        self.line()
+        self.line('legend right')
+        self.line('  |= Pattern |')
+        self.line('  | For a -t-> b: |')
+        self.line('  | a -red- (relation) |')
+        self.line('  | (relation) -green- b |')
+        self.line('  | (relation) -blue- t |')
+        self.line('endlegend')
+        self.line()
+        self.line('@enduml')
+
+
+def emit(store, writers):
+    """Write `store` through every writer in one walk over nodes and relations.
+
+    `store` may be a `trigraph.views.StoreView`; only what it shows is written.
+    """
+    writers = list(writers)
+    with span('emit', writers=len(writers)):
+        for writer in writers:
+            writer.open(store)
+        try:
+            # Declared nodes sheet by sheet, then nodes no sheet declares
+            num_sheets = len(store.sheets)
+            node_sheet = store.node_sheet
+            nodes = array('i', store.node_ids())
+            by_sheet = group_by([num_sheets if node_sheet[n] == NO_SHEET else node_sheet[n]
+                                 for n in nodes], num_sheets + 1, nodes)
+            for sheet in range(num_sheets + 1):
+                nodes = by_sheet.row(sheet)
+                if sheet == num_sheets:
+                    if not nodes:
+                        break
+                    sheet = NO_SHEET
+                for writer in writers:
+                    writer.sheet(sheet)
+                for node in nodes:
+                    for writer in writers:
+                        writer.node(node)
+                for writer in writers:
+                    writer.end_sheet()
+
+            for writer in writers:
+                writer.edges()
+            with span('dedup'):
+                first = first_occurrences(store)
+            count('edges_deduped', first.count(0))
+            for r in store.relation_ids():
+                s, rel, t = store.triple(r)
+                is_first = first[r]
+                for writer in writers:
+                    writer.relation(r, s, rel, t, is_first)
+        finally:
+            for writer in writers:
+                writer.close()
+
+
+FORMATS = {
+    'dot': Dot,
+    'clustered': ClusteredDot,
+    'puml': PlantUml,
+    'trigraph-puml': TrigraphPlantUml,
+}
+
+
+def main(argv=None):
+    import argparse
+    from .convert import black_ids_path, stable_black_names
+    from .snapshot import load_store
+
+    parser = argparse.ArgumentParser(prog='trigraph emit',
+                                     description='Write DOT and PlantUML exports in one pass.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    for name in FORMATS:
+        parser.add_argument(f'--{name}', metavar='PATH', help=f'write {name} output to PATH')
+    parser.add_argument('--black-ids',
+                        help='stable trigraph black node names, shared with analyze_trigraph.py '
+                             "(default: one file per sheet paths; '' names them by load order)")
+    args = parser.parse_args(argv)
+    writers = []
+    for name, cls in FORMATS.items():
+        path = getattr(args, name.replace('-', '_'))
+        if path is not None:
+            writers.append(cls(path))
+    if not writers:
+        parser.error('no output requested')
+    store = load_store(*args.paths)
+    black_ids = black_ids_path(*args.paths) if args.black_ids is None else args.black_ids
+    if black_ids and any(isinstance(writer, TrigraphPlantUml) for writer in writers):
+        names = stable_black_names(store, black_ids)
+        for writer in writers:
+            if isinstance(writer, TrigraphPlantUml):
+                writer.black_names = names
+    emit(store, writers)
+    for writer in writers:
+        print(f'Wrote {writer.path}')
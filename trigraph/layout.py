@@ -0,0 +1,277 @@
+"""
+Crossing-minimizing radial layout of the bipartite trigraph.
+
+Trigraph nodes are integers: white node `w` is the store's node id, black
+node `r` (relation `r`) is `num_nodes + r`.  The layout puts a center node
+in shell 0 and every other node in the shell of its BFS distance.  Since
+the trigraph is bipartite, edges only join neighbouring shells, so each
+pair of shells is a two-layer crossing problem.
+
+Orderings are improved with alternating outward and inward sweeps that sort
+each shell by the barycenter (or median) of its neighbours' positions in
+the shell swept from.  After every round the crossings between all shell
+pairs are counted with a Fenwick tree over outer positions in O(E log V),
+and the best ordering seen is kept.  Shells are treated as cut open at angle 0 for counting, the
+usual linearization of radial layouts.
+"""
+
+import math
+from array import array
+from collections import namedtuple
+
+from .tracing import count, span
+
+BARYCENTER = 'barycenter'
+MEDIAN = 'median'
+
+RadialLayout = namedtuple('RadialLayout', 'center shells positions crossings sweeps')
+
+
+class Trigraph:
+    """Bipartite white/black adjacency over a `TripleStore`.
+
+    Black nodes are named `r1`, `r2`, ... in relation order, or by
+    `black_names` (one per relation, e.g. from `convert.BlackIds`).
+    """
+
+    def __init__(self, store, black_names=None):
+        self.store = store
+        self.num_white = store.num_nodes
+        self.incidence = store.incidence()
+        self.black_names = black_names
+
+    def __len__(self):
+        return self.num_white + self.store.num_relations
+
+    def is_black(self, node):
+        return node >= self.num_white
+
+    def name(self, node):
+        if node >= self.num_white:
+            if self.black_names is not None:
+                return self.black_names[node - self.num_white]
+            return f'r{node - self.num_white + 1}'
+        return self.store.name(node)
+
+    def neighbors(self, node):
+        if node >= self.num_white:
+            return set(self.store.triple(node - self.num_white))
+        num_white = self.num_white
+        return [num_white + r for r in self.incidence.row(node)]
+
+
+def bfs_shells(graph, center):
+    """Nodes grouped by BFS distance from `center`, in discovery order."""
+    with span('bfs'):
+        shell = array('i', [-1]) * len(graph)
+        shell[center] = 0
+        shells = [[center]]
+        frontier = shells[0]
+        while frontier:
+            following = []
+            depth = len(shells)
+            for node in frontier:
+                for neighbor in graph.neighbors(node):
+                    if shell[neighbor] < 0:
+                        shell[neighbor] = depth
+                        following.append(neighbor)
+            if following:
+                shells.append(following)
+            frontier = following
+    count('shells', len(shells))
+    return shells, shell
+
+
+class LayerPair:
+    """Edges between shell i (inner) and shell i + 1 (outer)."""
+
+    __slots__ = ('inner', 'outer', 'inner_of', 'outer_of')
+
+    def __init__(self):
+        self.inner = array('i')    # parallel edge arrays
+        self.outer = array('i')
+        self.inner_of = {}         # outer node -> its inner neighbours
+        self.outer_of = {}         # inner node -> its outer neighbours
+
+    def add(self, u, v):
+        self.inner.append(u)
+        self.outer.append(v)
+        self.inner_of.setdefault(v, []).append(u)
+        self.outer_of.setdefault(u, []).append(v)
+
+
+def layer_pairs(graph, shells, shell_of):
+    """One `LayerPair` per pair of neighbouring shells."""
+    pairs = []
+    for i in range(len(shells) - 1):
+        pair = LayerPair()
+        for v in shells[i + 1]:
+            for u in graph.neighbors(v):
+                if shell_of[u] == i:
+                    pair.add(u, v)
+        pairs.append(pair)
+    return pairs
+
+
+def _count_greater(groups, width):
+    """Pairs of values in different `groups` where the earlier one is greater.
+
+    Values are ints in range(width).  A Fenwick tree counts the values of
+    earlier groups up to each value, so n values take O(n log width).
+    """
+    tree = [0] * (width + 1)
+    total = seen = 0
+    for group in groups:
+        for v in group:
+            i, not_greater = v + 1, 0
+            while i:
+                not_greater += tree[i]
+                i &= i - 1
+            total += seen - not_greater
+        for v in group:
+            i = v + 1
+            while i <= width:
+                tree[i] += 1
+                i += i & -i
+        seen += len(group)
+    return total
+
+
+def inversions(values, width=None):
+    """Number of pairs i < j with values[i] > values[j], for ints in range(width)."""
+    if width is None:
+        width = max(values, default=-1) + 1
+    return _count_greater(zip(values), width)
+
+
+def crossings(edges, width):
+    """Crossings of (inner position, outer position) edges between two ordered layers.
+
+    Edges are grouped by inner position, in order; every edge of an earlier
+    group with a larger outer position crosses an edge.  Edges sharing an
+    inner node never cross, so a group is counted before it is added.
+    Outer positions are in range(width); O(E log width).
+    """
+    groups = {}
+    for inner, outer in edges:
+        groups.setdefault(inner, []).append(outer)
+    return _count_greater(map(groups.__getitem__, sorted(groups)), width)
+
+
+def count_crossings(pair, pos, width):
+    """Crossings of a `LayerPair` under positions `pos`; `width` bounds outer positions."""
+    at = pos.__getitem__
+    return crossings(zip(map(at, pair.inner), map(at, pair.outer)), width)
+
+
+def total_crossings(pairs, shells, pos):
+    return sum(count_crossings(pair, pos, max(len(shells[i + 1]), 1))
+               for i, pair in enumerate(pairs))
+
+
+def _reorder(nodes, neighbors, pos, fixed_size, method):
+    """Sort `nodes` by the barycenter/median of `neighbors` in the fixed layer.
+
+    Positions are normalized to [0, 1) so layers of different size are
+    comparable; nodes without neighbours keep their current relative
+    position.  `nodes` must be in current position order.
+    """
+    n = len(nodes)
+    scale = 1.0 / max(fixed_size, 1)
+    at = pos.__getitem__
+    keyed = []
+    for i, v in enumerate(nodes):
+        nbrs = neighbors.get(v)
+        if not nbrs:
+            score = (i + 0.5) / n
+        elif method == MEDIAN:
+            values = sorted(map(at, nbrs))
+            k = len(values)
+            mid = values[k // 2] if k % 2 else (values[k // 2 - 1] + values[k // 2]) / 2
+            score = (mid + 0.5) * scale
+        else:
+            score = (sum(map(at, nbrs)) / len(nbrs) + 0.5) * scale
+        keyed.append((score, i, v))
+    keyed.sort()
+    for i, (_, _, v) in enumerate(keyed):
+        nodes[i] = v
+        pos[v] = i
+
+
+def radial_layout(graph, center, sweeps=4, method=BARYCENTER, base_radius=2.0,
+                  tolerance=0.01):
+    """Shells, ordering, positions and crossing count for a radial layout.
+
+    `graph` is a `Trigraph` (or a store, which is wrapped in one).  Up to
+    `sweeps` rounds of one outward and one inward sweep are run; it stops
+    early once a round reduces crossings by less than `tolerance` (relative).
+    """
+    if not isinstance(graph, Trigraph):
+        graph = Trigraph(graph)
+    shells, shell_of = bfs_shells(graph, center)
+    with span('layer_pairs'):
+        pairs = layer_pairs(graph, shells, shell_of)
+    pos = array('i', [0]) * len(graph)
+    for nodes in shells:
+        for i, v in enumerate(nodes):
+            pos[v] = i
+
+    with span('order'):
+        best = total_crossings(pairs, shells, pos)
+        best_order = [list(nodes) for nodes in shells]
+        rounds = 0
+        for _ in range(sweeps):
+            rounds += 1
+            for i in range(1, len(shells)):
+                _reorder(shells[i], pairs[i - 1].inner_of, pos, len(shells[i - 1]), method)
+            for i in range(len(shells) - 2, 0, -1):
+                _reorder(shells[i], pairs[i].outer_of, pos, len(shells[i + 1]), method)
+            crossings = total_crossings(pairs, shells, pos)
+            if crossings < best:
+                improvement = (best - crossings) / best
+                best = crossings
+                best_order = [list(nodes) for nodes in shells]
+                if improvement >= tolerance:
+                    continue
+            break
+        shells = best_order
+        for nodes in shells:
+            for i, v in enumerate(nodes):
+                pos[v] = i
+    count('crossings', best)
+    count('sweeps', rounds)
+
+    with span('place'):
+        positions = place_shells(shells, pairs, pos, base_radius)
+    return RadialLayout(center, shells, positions, best, rounds)
+
+
+def place_shells(shells, pairs, pos, base_radius=2.0, pull=0.5):
+    """(x, y) per node: rings of growing radius, angles pulled toward parents.
+
+    Each node's angle blends its uniform slot on the ring with the mean angle
+    of its neighbours on the inner ring (weight `pull`), while keeping the
+    ring order and at least half a uniform slot between neighbours.
+    """
+    positions = {shells[0][0]: (0.0, 0.0)}
+    angles = {shells[0][0]: 0.0}
+    two_pi = 2 * math.pi
+    for k in range(1, len(shells)):
+        nodes = shells[k]
+        n = len(nodes)
+        slot = two_pi / n
+        inner_of = pairs[k - 1].inner_of
+        radius = max(base_radius * k, n / two_pi)
+        previous = -slot / 2
+        for i, v in enumerate(nodes):
+            uniform = slot * (i + 0.5)
+            angle = uniform
+            parents = inner_of.get(v) if k > 1 else None
+            if parents:
+                mean = sum(map(angles.__getitem__, parents)) / len(parents)
+                angle = (1 - pull) * uniform + pull * mean
+            # Keep ring order and spacing, leaving room for the rest of the ring
+            angle = min(max(angle, previous + slot / 2), two_pi - slot / 2 * (n - i))
+            previous = angles[v] = angle
+            positions[v] = (radius * math.cos(angle), radius * math.sin(angle))
+    return positions
@@ -0,0 +1,262 @@
+"""
+Load sheets of many packages in parallel and resolve their references.
+
+A package is a directory with a `package-info` file (`meta:` name, layer
+and version, plus `dependencies:` and `subpackages:`); its sheets are the
+`.sheet` files below it that are not inside a nested package.  A sheet
+names its package in `meta.package` as `layer-<n>.<name>`.
+
+A sheet's `references:` section says where a node it uses is declared:
+
+    metaLevelType: .types.                       # sheet `types`, same package
+    type: layer-0.metametameta.metaRelations.    # sheet of another package
+
+`load_packages` discovers every sheet under a set of roots, parses them in
+a process pool (through the on-disk `SheetCache`, so unchanged sheets are
+not parsed again), builds one symbol index of (package, sheet) -> sheet and
+node -> declaring sheets, and resolves every reference with one dictionary
+lookup each.  References are checked against the visibility rules:
+
+    public     visible to the same and every higher layer
+    public+1   visible to the same and the next layer only
+    private    visible inside its own layer only
+
+Missing sheets or nodes, visibility violations and nodes a sheet uses in
+relations without declaring or referencing them are reported as
+`ReferenceIssue`s instead of raised, so one run reports all of them.
+"""
+
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from difflib import get_close_matches
+
+from .sheets import DEFAULT_CACHE_DIR, SECTIONS, Model, SheetCache, SheetError, load_sheet
+from .tracing import span
+
+PACKAGE_INFO = 'package-info'
+
+# Below this many sheets a process pool costs more than it saves
+PARALLEL_THRESHOLD = 64
+
+UNRESOLVED = 'unresolved'
+VISIBILITY = 'visibility'
+UNREFERENCED = 'unreferenced'
+
+_SECTION_RE = re.compile(r'^([A-Za-z][\w+.-]*):\s*$')
+_LAYER_RE = re.compile(r'^layer-(\d+)\.(.+)$')
+
+Package = namedtuple('Package', 'name layer version root dependencies')
+ReferenceIssue = namedtuple('ReferenceIssue', 'kind sheet path name target message')
+
+
+def read_package_info(path):
+    """`Package` described by a `package-info` file."""
+    meta, dependencies = {}, []
+    section = None
+    with open(path, encoding='utf-8') as f:
+        for lineno, raw in enumerate(f, 1):
+            line = raw.rstrip('\r\n')
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            match = _SECTION_RE.match(line)
+            if match and not line[0].isspace():
+                section = match.group(1)
+                if section not in SECTIONS:
+                    raise SheetError(f'unknown section {section!r}', path, lineno)
+                continue
+            key, _, value = stripped.partition(':')
+            if section == 'meta':
+                meta[key.strip()] = value.strip()
+            elif section == 'dependencies':
+                dependencies.append(key.strip())
+    try:
+        layer = int(meta.get('layer', 0))
+    except ValueError:
+        raise SheetError(f'layer must be an integer, got {meta["layer"]!r}', path) from None
+    name = meta.get('name') or os.path.basename(os.path.dirname(os.path.abspath(path)))
+    return Package(f'layer-{layer}.{name}', layer, meta.get('version', ''),
+                   os.path.dirname(path) or '.', dependencies)
+
+
+def discover(*roots):
+    """(packages, [(sheet path, package index)]) below `roots`.
+
+    Each sheet belongs to the nearest enclosing directory with a
+    `package-info`; sheets outside any package get package index -1.
+    """
+    packages = []
+    sheets = []
+    for root in roots or ('.',):
+        stack = [(root, -1)]
+        while stack:
+            directory, package = stack.pop()
+            names = sorted(os.listdir(directory))
+            if PACKAGE_INFO in names:
+                packages.append(read_package_info(os.path.join(directory, PACKAGE_INFO)))
+                package = len(packages) - 1
+            subdirs = []
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.endswith('.sheet') and os.path.isfile(path):
+                    sheets.append((path, package))
+                elif os.path.isdir(path) and not name.startswith('.'):
+                    subdirs.append((path, package))
+            stack.extend(reversed(subdirs))
+    return packages, sheets
+
+
+def _load_chunk(paths, cache_dir):
+    """Parse a chunk of sheets in a worker process."""
+    cache = SheetCache(cache_dir)
+    return [load_sheet(path, cache) for path in paths]
+
+
+def parse_all(paths, cache_dir=DEFAULT_CACHE_DIR, jobs=None):
+    """Parsed `Sheet`s for `paths`, in order, using a process pool for many sheets."""
+    with span('parse', sheets=len(paths)):
+        jobs = jobs or os.cpu_count() or 1
+        if len(paths) < PARALLEL_THRESHOLD or jobs == 1:
+            return _load_chunk(paths, cache_dir)
+        size = max(16, len(paths) // (jobs * 4))
+        chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parsed = pool.map(_load_chunk, chunks, [cache_dir] * len(chunks))
+            return [sheet for chunk in parsed for sheet in chunk]
+
+
+def split_reference(reference):
+    """('package', 'sheet') of a reference like `.types.` or `layer-0.pkg.types.`.
+
+    An empty package means the referencing sheet's own package.
+    """
+    body = reference.strip()
+    if body.endswith('.'):
+        body = body[:-1]
+    package, _, sheet = body.rpartition('.')
+    return package, sheet
+
+
+def layer_of(package, default=0):
+    match = _LAYER_RE.match(package)
+    return int(match.group(1)) if match else default
+
+
+def visible(visibility, declaring_layer, using_layer):
+    """Whether a node of `visibility` in `declaring_layer` is visible from `using_layer`."""
+    distance = using_layer - declaring_layer
+    if distance == 0:
+        return True
+    if distance < 0 or visibility == 'private':
+        return False
+    return visibility == 'public' or distance == 1
+
+
+class PackageSet:
+    """Sheets of several packages plus the symbol index over them."""
+
+    def __init__(self, packages, sheets, sheet_packages):
+        self.packages = packages
+        self.sheets = sheets
+        self.layers = []
+        self.by_key = {}       # (package, sheet name) -> sheet index
+        self.symbols = {}      # node name -> [sheet index] declaring it
+        for i, (sheet, package) in enumerate(zip(sheets, sheet_packages)):
+            info = packages[package] if package >= 0 else None
+            if not sheet.package and info is not None:
+                sheet.package = info.name
+            self.layers.append(layer_of(sheet.package, info.layer if info else 0))
+            self.by_key[sheet.package, sheet.name] = i
+            for name in sheet.nodes:
+                self.symbols.setdefault(name, []).append(i)
+
+    def lookup(self, sheet, reference):
+        """Index of the sheet `reference` points to from sheet index `sheet`, or None."""
+        package, name = split_reference(reference)
+        return self.by_key.get((package or self.sheets[sheet].package, name))
+
+    def resolve(self):
+        """All `ReferenceIssue`s, in sheet order."""
+        issues = []
+        for i, sheet in enumerate(self.sheets):
+            for name, reference in sheet.references.items():
+                issue = self._check(i, name, reference)
+                if issue is not None:
+                    issues.append(issue)
+            used = set()
+            for s, r, t, _ in sheet.relations:
+                used.update((s, r, t))
+            for name in sorted(used - sheet.nodes.keys() - sheet.references.keys()):
+                declared = ', '.join(self.sheets[j].name for j in self.symbols.get(name, ()))
+                where = f' (declared in {declared})' if declared else ''
+                issues.append(ReferenceIssue(UNREFERENCED, sheet.name, sheet.path, name, None,
+                                             f'{name!r} is used but neither declared nor '
+                                             f'referenced{where}'))
+        return issues
+
+    def _check(self, i, name, reference):
+        sheet = self.sheets[i]
+        target = self.lookup(i, reference)
+
+        def issue(kind, message):
+            return ReferenceIssue(kind, sheet.name, sheet.path, name, reference, message)
+
+        if target is None:
+            package, wanted = split_reference(reference)
+            package = package or sheet.package
+            names = [n for p, n in self.by_key if p == package]
+            hint = get_close_matches(wanted, names, 1)
+            hint = f'; did you mean .{hint[0]}.?' if hint else ''
+            return issue(UNRESOLVED, f'{name!r}: no sheet {reference!r} in package {package}{hint}')
+        declaring = self.sheets[target]
+        declared = declaring.nodes.get(name)
+        if declared is None:
+            lower = {n.lower(): n for n in declaring.nodes}
+            hint = lower.get(name.lower()) or next(iter(get_close_matches(name, declaring.nodes, 1)),
+                                                  None)
+            hint = f'; did you mean {hint!r}?' if hint else ''
+            return issue(UNRESOLVED, f'{name!r} is not declared in {reference}{hint}')
+        visibility = declared[0]
+        if not visible(visibility, self.layers[target], self.layers[i]):
+            return issue(VISIBILITY, f'{name!r} is {visibility} in layer {self.layers[target]} '
+                                     f'and not visible from layer {self.layers[i]}')
+        return None
+
+    def model(self):
+        """All sheets merged into one `Model`."""
+        return Model(self.sheets)
+
+
+def load_packages(*roots, cache_dir=DEFAULT_CACHE_DIR, jobs=None):
+    """Discover, parse (in parallel) and index every sheet below `roots`."""
+    packages, found = discover(*roots)
+    sheets = parse_all([path for path, _ in found], cache_dir, jobs)
+    return PackageSet(packages, sheets, [package for _, package in found])
+
+
+def format_issue(issue):
+    return f'{issue.path}: {issue.kind}: {issue.message}'
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(prog='trigraph packages',
+                                     description='Load package roots and check sheet references.')
+    parser.add_argument('roots', nargs='*', default=['.'])
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='parser processes')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    packages = load_packages(*args.roots, jobs=args.jobs)
+    issues = packages.resolve()
+    for issue in issues:
+        print(format_issue(issue))
+    references = sum(len(sheet.references) for sheet in packages.sheets)
+    print(f'{len(packages.packages)} packages, {len(packages.sheets)} sheets, '
+          f'{references} references, {len(issues)} issues '
+          f'in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+    return 1 if issues else 0
@@ -0,0 +1,245 @@
+"""
+Indexed pattern matching over the relations of a `TripleStore`.
+
+Three permutation indexes cover every combination of bound terms:
+
+    SPO  source, then relation, then target
+    POS  relation, then target, then source
+    OSP  target, then source, then relation
+
+Each index is a CSR over its first term whose rows are sorted by the second
+and third term, so any lookup is an offset fetch plus at most two binary
+searches -- never a scan.  Indexes are built lazily on first use.
+
+Patterns use the sheet relation syntax with `?variables`:
+
+    engine.query('?x -type-> ?t -type-> metaNType')
+    engine.query('?s -targetType-> metaLevelType, ?r -signature-> ?s')
+
+A chain `a -r1-> b -r2-> c` is the two patterns `a -r1-> b` and
+`b -r2-> c`; comma separated chains are joined on shared variables.  Joins
+are index nested loops, ordered so the most selective pattern (smallest
+index range for its constants) runs first and every following pattern is
+looked up with the variables already bound.
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import accumulate
+
+_ARROW_RE = re.compile(r'^-(\S+?)->$')
+
+# Term positions inside a pattern tuple (source, relation, target)
+S, P, O = 0, 1, 2
+
+# (first, second, third) term positions of each permutation
+PERMUTATIONS = {
+    'spo': (S, P, O),
+    'pos': (P, O, S),
+    'osp': (O, S, P),
+}
+
+
+class QueryError(ValueError):
+    """A pattern could not be parsed."""
+
+
+class Permutation:
+    """Relation ids sorted by three columns, with CSR offsets over the first."""
+
+    def __init__(self, store, order):
+        columns = (store.source, store.relation, store.target)
+        first, second, third = (columns[i] for i in order)
+        n = store.num_nodes
+        bits = max(n.bit_length(), 1)
+        key = [(a << bits | b) << bits | c for a, b, c in zip(first, second, third)]
+        ids = sorted(range(len(key)), key=key.__getitem__)
+        self.order = order
+        self.ids = array('i', ids)
+        self.second = array('i', map(second.__getitem__, ids))
+        self.third = array('i', map(third.__getitem__, ids))
+        counts = Counter(first)
+        self.offsets = array('i', [0])
+        self.offsets.extend(accumulate(counts.get(k, 0) for k in range(n)))
+
+    def range(self, a, b=None, c=None):
+        """Half-open range of `ids` matching the bound prefix (a, b, c)."""
+        lo, hi = self.offsets[a], self.offsets[a + 1]
+        if b is not None and lo < hi:
+            lo, hi = bisect_left(self.second, b, lo, hi), bisect_right(self.second, b, lo, hi)
+            if c is not None and lo < hi:
+                lo, hi = bisect_left(self.third, c, lo, hi), bisect_right(self.third, c, lo, hi)
+        return lo, hi
+
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.ids, self.second, self.third, self.offsets))
+
+
+def parse_patterns(text):
+    """Parse comma separated pattern chains into (source, relation, target) tuples."""
+    patterns = []
+    for chain in text.split(','):
+        tokens = chain.split()
+        if len(tokens) < 3 or len(tokens) % 2 == 0:
+            raise QueryError(f'malformed pattern {chain.strip()!r}')
+        for i in range(0, len(tokens) - 2, 2):
+            match = _ARROW_RE.match(tokens[i + 1])
+            if not match:
+                raise QueryError(f'expected "-relation->", got {tokens[i + 1]!r}')
+            patterns.append((tokens[i], match.group(1), tokens[i + 2]))
+    return patterns
+
+
+def is_variable(term):
+    return isinstance(term, str) and term.startswith('?')
+
+
+class QueryEngine:
+    """Pattern queries over a `TripleStore`."""
+
+    def __init__(self, store):
+        self.store = store
+        self._indexes = {}
+
+    def index(self, name):
+        index = self._indexes.get(name)
+        if index is None:
+            index = self._indexes[name] = Permutation(self.store, PERMUTATIONS[name])
+        return index
+
+    def _lookup(self, s, p, o):
+        """(index, lo, hi) for a triple of ids where None means unbound."""
+        if s is not None:
+            if p is not None or o is None:
+                index = self.index('spo')
+                return (index,) + index.range(s, p, o if p is not None else None)
+            index = self.index('osp')
+            return (index,) + index.range(o, s)
+        if p is not None:
+            index = self.index('pos')
+            return (index,) + index.range(p, o)
+        if o is not None:
+            index = self.index('osp')
+            return (index,) + index.range(o)
+        return None, 0, self.store.num_relations
+
+    def match_ids(self, source=None, relation=None, target=None):
+        """Ids of relations matching the given node ids (None matches anything)."""
+        index, lo, hi = self._lookup(source, relation, target)
+        if index is None:
+            return range(lo, hi)
+        return index.ids[lo:hi]
+
+    def count_ids(self, source=None, relation=None, target=None):
+        _, lo, hi = self._lookup(source, relation, target)
+        return hi - lo
+
+    def _ids(self, *names):
+        """Node ids for names, None for None; False if a name is unknown."""
+        ids = []
+        for name in names:
+            if name is None:
+                ids.append(None)
+                continue
+            i = self.store.strings.get(name)
+            if i is None:
+                return False
+            ids.append(i)
+        return ids
+
+    def match(self, source=None, relation=None, target=None):
+        """Relations matching the given node names, as (source, relation, target) names."""
+        ids = self._ids(source, relation, target)
+        if ids is False:
+            return []
+        name, triple = self.store.name, self.store.triple
+        return [tuple(map(name, triple(r))) for r in self.match_ids(*ids)]
+
+    def count(self, source=None, relation=None, target=None):
+        ids = self._ids(source, relation, target)
+        return 0 if ids is False else self.count_ids(*ids)
+
+    # Joins
+
+    def _resolve(self, patterns):
+        """Replace constant names by ids; None if a constant is unknown."""
+        resolved = []
+        for pattern in patterns:
+            terms = []
+            for term in pattern:
+                if is_variable(term):
+                    terms.append(term)
+                else:
+                    i = self.store.strings.get(term)
+                    if i is None:
+                        return None
+                    terms.append(i)
+            resolved.append(tuple(terms))
+        return resolved
+
+    def _estimate(self, pattern):
+        bound = [None if is_variable(t) else t for t in pattern]
+        return self.count_ids(*bound)
+
+    def plan(self, patterns):
+        """Order resolved patterns for evaluation, most selective first.
+
+        The first pattern is the one with the smallest index range for its
+        constants.  After that, patterns sharing a bound variable are
+        preferred (they become index lookups per binding), again smallest
+        first; disconnected patterns only come last.
+        """
+        estimates = {i: self._estimate(p) for i, p in enumerate(patterns)}
+        remaining = set(estimates)
+        bound = set()
+        order = []
+        while remaining:
+            connected = [i for i in remaining
+                         if any(t in bound for t in patterns[i] if is_variable(t))]
+            i = min(connected or remaining, key=lambda i: (estimates[i], i))
+            remaining.remove(i)
+            order.append((patterns[i], estimates[i]))
+            bound.update(t for t in patterns[i] if is_variable(t))
+        return order
+
+    def solve(self, patterns):
+        """Yield bindings {variable: node id} satisfying all patterns."""
+        if isinstance(patterns, str):
+            patterns = parse_patterns(patterns)
+        resolved = self._resolve(patterns)
+        if resolved is None:
+            return
+        plan = [pattern for pattern, _ in self.plan(resolved)]
+        yield from self._solve(plan, 0, {})
+
+    def _solve(self, plan, depth, binding):
+        if depth == len(plan):
+            yield dict(binding)
+            return
+        pattern = plan[depth]
+        bound = [binding.get(t) if is_variable(t) else t for t in pattern]
+        columns = (self.store.source, self.store.relation, self.store.target)
+        free = [(i, t) for i, t in enumerate(pattern) if is_variable(t) and bound[i] is None]
+        for r in self.match_ids(*bound):
+            added = []
+            for i, var in free:
+                value = columns[i][r]
+                current = binding.get(var)
+                if current is None:
+                    binding[var] = value
+                    added.append(var)
+                elif current != value:
+                    # The same variable twice in one pattern, e.g. ?x -r-> ?x
+                    break
+            else:
+                yield from self._solve(plan, depth + 1, binding)
+            for var in added:
+                del binding[var]
+
+    def query(self, patterns):
+        """All solutions of `patterns` as {variable: node name} dicts."""
+        name = self.store.name
+        return [{var: name(value) for var, value in binding.items()}
+                for binding in self.solve(patterns)]
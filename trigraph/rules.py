@@ -0,0 +1,357 @@
+"""
+Materialize implicit relations with semi-naive rule evaluation.
+
+`relationProperties.sheet` calls a relation *implicit* when it is derived
+by rules from other relations, and *transient* when it is not persisted but
+recreated on load.  A `Rule` derives one relation from a conjunction of
+patterns, written in the sheet relation syntax:
+
+    Rule.parse('?x -typeChain-> ?u <- ?x -typeChain-> ?t, ?t -type-> ?u')
+
+`Materializer` computes the fixpoint of a rule set over the relations of a
+`TripleStore` with semi-naive evaluation: every round only joins the facts
+that were new in the previous round against everything known so far.
+
+Changes to base relations are incremental.  `add` propagates only from the
+new facts.  `remove` uses delete-and-rederive: it first over-deletes every
+derived fact that had a derivation through a removed fact, then rederives
+those that still have another derivation, and propagates from them.  Work
+is proportional to the affected part of the closure, not to its size.
+
+The store is never modified, so a read-only snapshot store works as well.
+Names the store does not know (derived relations such as `typeChain`, or
+nodes of added facts) get negative ids from a side table of the
+materializer; `name` and `names` resolve both kinds.
+
+Persisted outputs -- snapshots, emitted diagrams -- are written from the
+store, which holds base relations only, so transient facts never reach
+them.  A writer that wants the closure too takes `persistent_facts()`.
+`python -m trigraph rules` prints the derived facts of a model.
+"""
+
+from collections import defaultdict, namedtuple
+
+from .query import is_variable, parse_patterns
+from .validate import SignatureIndex
+
+TRANSIENT = 'transient'
+
+Changes = namedtuple('Changes', 'added removed')
+
+
+class RuleError(ValueError):
+    """A rule is malformed or not range restricted."""
+
+
+class Rule:
+    """`head <- body`: derive the head pattern for every body solution."""
+
+    def __init__(self, head, body, transient=False):
+        self.head = tuple(head)
+        self.body = [tuple(pattern) for pattern in body]
+        self.transient = transient
+        if not self.body:
+            raise RuleError('a rule needs at least one body pattern')
+        for pattern in [self.head] + self.body:
+            if is_variable(pattern[1]):
+                raise RuleError(f'relation of {pattern} must be a constant')
+        bound = {t for pattern in self.body for t in pattern if is_variable(t)}
+        unbound = [t for t in self.head if is_variable(t) and t not in bound]
+        if unbound:
+            raise RuleError(f'head variables {unbound} do not occur in the body')
+
+    @classmethod
+    def parse(cls, text, transient=False):
+        head, sep, body = text.partition('<-')
+        if not sep:
+            raise RuleError(f'expected "head <- body", got {text!r}')
+        heads = parse_patterns(head)
+        if len(heads) != 1:
+            raise RuleError(f'a rule has exactly one head pattern, got {head.strip()!r}')
+        return cls(heads[0], parse_patterns(body), transient)
+
+    def __repr__(self):
+        fmt = '{} -{}-> {}'.format
+        body = ', '.join(fmt(*p) for p in self.body)
+        return f'Rule({fmt(*self.head)} <- {body})'
+
+
+# Closures the meta-model implies but never states.  All of them are cheap
+# to recompute, so they are transient: recreated on load, never persisted.
+DEFAULT_RULES = [
+    # type(n), type(type(n)), ... up to the metaNType fixpoint
+    Rule.parse('?x -typeChain-> ?t <- ?x -type-> ?t', transient=True),
+    Rule.parse('?x -typeChain-> ?u <- ?x -typeChain-> ?t, ?t -type-> ?u', transient=True),
+    # a node sits one meta level below its type
+    Rule.parse('?x -impliedMetaLevel-> ?l <- ?x -type-> ?t, ?t -metaLevel-> ?m, '
+               '?l -nextMetaLevel-> ?m', transient=True),
+    # every level above a level; metaLevel-N is above itself (the fixpoint)
+    Rule.parse('?l -higherMetaLevel-> ?m <- ?l -nextMetaLevel-> ?m', transient=True),
+    Rule.parse('?l -higherMetaLevel-> ?n <- ?l -higherMetaLevel-> ?m, ?m -nextMetaLevel-> ?n',
+               transient=True),
+]
+
+
+class FactSet:
+    """Set of (source, relation, target) id triples indexed by relation."""
+
+    def __init__(self, facts=()):
+        self.out = defaultdict(lambda: defaultdict(set))   # r -> s -> {t}
+        self.inc = defaultdict(lambda: defaultdict(set))   # r -> t -> {s}
+        self.size = 0
+        for fact in facts:
+            self.add(fact)
+
+    def add(self, fact):
+        s, r, t = fact
+        targets = self.out[r][s]
+        if t in targets:
+            return False
+        targets.add(t)
+        self.inc[r][t].add(s)
+        self.size += 1
+        return True
+
+    def discard(self, fact):
+        s, r, t = fact
+        targets = self.out.get(r, {}).get(s)
+        if not targets or t not in targets:
+            return False
+        targets.discard(t)
+        self.inc[r][t].discard(s)
+        self.size -= 1
+        return True
+
+    def __contains__(self, fact):
+        s, r, t = fact
+        by_source = self.out.get(r)
+        return by_source is not None and t in by_source.get(s, ())
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for r, by_source in self.out.items():
+            for s, targets in by_source.items():
+                for t in targets:
+                    yield s, r, t
+
+    def match(self, s, r, t):
+        """(source, target) pairs of relation `r`; None leaves a side open."""
+        if s is not None:
+            targets = self.out.get(r, {}).get(s, ())
+            if t is not None:
+                return [(s, t)] if t in targets else []
+            return [(s, x) for x in targets]
+        if t is not None:
+            return [(x, t) for x in self.inc.get(r, {}).get(t, ())]
+        return [(x, y) for x, targets in self.out.get(r, {}).items() for y in targets]
+
+
+class Materializer:
+    """Fixpoint of `rules` over base relations, maintained incrementally.
+
+    Names missing from the store (e.g. derived relation names) are kept in
+    `local`; the id of `local[i]` is `~i`, so it never collides with a
+    store id, even if the store grows later.
+    """
+
+    def __init__(self, store, rules=None):
+        self.store = store
+        self.local = []
+        self._local_ids = {}
+        self.rules = DEFAULT_RULES if rules is None else list(rules)
+        self._compiled = [self._compile(rule) for rule in self.rules]
+        self.base = FactSet(store.triples())
+        self.derived = FactSet()
+        self.total = FactSet(self.base)
+        self.transient = self._transient_relations()
+
+    def id(self, name):
+        """Id of `name` in the store, or in the side table if the store lacks it."""
+        i = self._local_ids.get(name)
+        if i is None:
+            i = self.store.strings.get(name)
+            if i is None:
+                i = self._local_ids[name] = ~len(self.local)
+                self.local.append(name)
+        return i
+
+    def name(self, i):
+        return self.store.name(i) if i >= 0 else self.local[~i]
+
+    def _term(self, term):
+        return term if is_variable(term) else self.id(term)
+
+    def _compile(self, rule):
+        head = tuple(map(self._term, rule.head))
+        body = [tuple(map(self._term, pattern)) for pattern in rule.body]
+        return head, body
+
+    def _transient_relations(self):
+        """Relations marked transient by a rule or by a relation property."""
+        index = SignatureIndex(self.store)
+        relations = set()
+        for rule, (head, _) in zip(self.rules, self._compiled):
+            if rule.transient or TRANSIENT in index.properties(head[1]):
+                relations.add(head[1])
+        return relations
+
+    # Evaluation
+
+    def _join(self, body, first, facts, binding):
+        """Bindings for `body`, matching pattern `first` against `facts` only."""
+        order = [first] + [i for i in range(len(body)) if i != first]
+        return self._extend(body, order, 0, facts, binding)
+
+    def _extend(self, body, order, depth, first_facts, binding):
+        if depth == len(order):
+            yield binding
+            return
+        s, r, t = body[order[depth]]
+        facts = first_facts if depth == 0 else self.total
+        bs = binding.get(s) if is_variable(s) else s
+        bt = binding.get(t) if is_variable(t) else t
+        for x, y in facts.match(bs, r, bt):
+            if bs is None and bt is None and s == t and x != y:
+                continue
+            extended = binding
+            if bs is None or bt is None:
+                extended = dict(binding)
+                if bs is None:
+                    extended[s] = x
+                if bt is None:
+                    extended[t] = y
+            yield from self._extend(body, order, depth + 1, first_facts, extended)
+
+    @staticmethod
+    def _instantiate(head, binding):
+        return tuple(binding[t] if is_variable(t) else t for t in head)
+
+    def _consequences(self, delta):
+        """Head facts with at least one derivation through a fact in `delta`."""
+        for head, body in self._compiled:
+            for i in range(len(body)):
+                if body[i][1] not in delta.out:
+                    continue
+                for binding in self._join(body, i, delta, {}):
+                    yield self._instantiate(head, binding)
+
+    def _propagate(self, delta):
+        """Semi-naive rounds starting from facts just added to `total`."""
+        added = []
+        while len(delta):
+            new = FactSet()
+            for fact in self._consequences(delta):
+                if fact not in self.total and new.add(fact):
+                    added.append(fact)
+            for fact in new:
+                self.total.add(fact)
+                self.derived.add(fact)
+            delta = new
+        return added
+
+    def _derivable(self, fact):
+        """Whether some rule derives `fact` from the current `total`."""
+        for head, body in self._compiled:
+            if head[1] != fact[1]:
+                continue
+            binding = {}
+            for term, value in zip(head, fact):
+                if is_variable(term):
+                    if binding.setdefault(term, value) != value:
+                        break
+                elif term != value:
+                    break
+            else:
+                order = list(range(len(body)))
+                for _ in self._extend(body, order, 0, self.total, binding):
+                    return True
+        return False
+
+    def run(self):
+        """Compute the full closure from the base relations."""
+        self.derived = FactSet()
+        self.total = FactSet(self.base)
+        return self._propagate(FactSet(self.base))
+
+    # Incremental updates
+
+    def _ids(self, facts):
+        return [tuple(f) if all(isinstance(x, int) for x in f) else tuple(map(self.id, f))
+                for f in facts]
+
+    def add(self, facts):
+        """Add base facts (id or name triples); returns the `Changes` to derived facts."""
+        delta = FactSet()
+        for fact in self._ids(facts):
+            if self.base.add(fact) and self.total.add(fact):
+                delta.add(fact)
+        return Changes(self._propagate(delta), [])
+
+    def remove(self, facts):
+        """Remove base facts (id or name triples); returns the `Changes` to derived facts."""
+        removed = FactSet()
+        for fact in self._ids(facts):
+            if self.base.discard(fact):
+                removed.add(fact)
+        # Over-delete: everything with a derivation through a deleted fact,
+        # joined against the old total.
+        deleted = FactSet(removed)
+        delta = removed
+        while len(delta):
+            new = FactSet()
+            for fact in self._consequences(delta):
+                if fact in self.derived and fact not in self.base and fact not in deleted:
+                    deleted.add(fact)
+                    new.add(fact)
+            delta = new
+        for fact in deleted:
+            self.total.discard(fact)
+            self.derived.discard(fact)
+        # Rederive what still has an alternative derivation, then propagate.
+        rederived = FactSet(f for f in deleted if self._derivable(f))
+        for fact in rederived:
+            self.total.add(fact)
+            self.derived.add(fact)
+        restored = list(rederived) + self._propagate(rederived)
+        # Over-deleted facts that came back are not changes, except removed
+        # base facts that are still derivable: those are now implicit.
+        added = [f for f in restored if f in removed]
+        lost = [f for f in deleted if f not in self.total and f not in removed]
+        return Changes(added, lost)
+
+    # Results
+
+    def derived_facts(self, include_transient=True):
+        """Derived (implicit) facts that are not also base facts."""
+        return [f for f in self.derived if f not in self.base
+                and (include_transient or f[1] not in self.transient)]
+
+    def persistent_facts(self):
+        """Everything that may be written out: base plus non-transient derived facts."""
+        return list(self.base) + self.derived_facts(include_transient=False)
+
+    def names(self, facts):
+        return [tuple(map(self.name, f)) for f in facts]
+
+
+def main(argv=None):
+    import argparse
+
+    from .snapshot import load_store
+
+    parser = argparse.ArgumentParser(prog='trigraph rules',
+                                     description='Print the implicit relations the rules '
+                                                 'derive from the sheets.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    parser.add_argument('--persistent', action='store_true',
+                        help='leave out transient relations, as a persisted output would')
+    args = parser.parse_args(argv)
+    store = load_store(*args.paths)
+    materializer = Materializer(store)
+    materializer.run()
+    facts = materializer.derived_facts(include_transient=not args.persistent)
+    for source, relation, target in sorted(materializer.names(facts)):
+        print(f'{source} -{relation}-> {target}')
+    return 0
@@ -0,0 +1,279 @@
+"""
+Parse `.sheet` files into an in-memory meta-model.
+
+A sheet is a small line-oriented document with the sections `meta`,
+`references`, `public`, `public+1`, `private` and `relations`.  The parser
+streams it line by line, expands `* -rel-> X` wildcards to every node the
+sheet declares and returns a `Sheet`.  `load_model` merges sheets into one
+`Model`.
+
+Parsed sheets are cached per file by content hash (in memory and, when a
+cache directory is given, on disk), so repeated runs over many unchanged
+sheets skip parsing entirely.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+from collections import namedtuple
+
+from .tracing import count, span
+
+# Bump whenever the parsed representation changes, so stale cache entries
+# are ignored instead of unpickled into the wrong shape.
+PARSER_VERSION = 1
+
+VISIBILITIES = ('public', 'public+1', 'private')
+SECTIONS = ('meta', 'references', 'relations', 'dependencies', 'subpackages') + VISIBILITIES
+
+DEFAULT_CACHE_DIR = '.trigraph-cache'
+
+_SECTION_RE = re.compile(r'^([A-Za-z][\w+.-]*):\s*$')
+_RELATION_RE = re.compile(r'^(\S+)\s+-(\S+?)->\s+(\S+)$')
+
+Node = namedtuple('Node', 'name visibility description sheet')
+Relation = namedtuple('Relation', 'source relation target sheet line')
+
+
+class SheetError(ValueError):
+    """A sheet could not be parsed or merged into a model."""
+
+    def __init__(self, message, path=None, line=None):
+        self.path = path
+        self.line = line
+        if path is not None:
+            message = f'{path}:{line}: {message}' if line else f'{path}: {message}'
+        super().__init__(message)
+
+
+class Sheet:
+    """Parsed contents of one `.sheet` file."""
+
+    __slots__ = ('name', 'package', 'description', 'path', 'digest',
+                 'references', 'nodes', 'relations')
+
+    def __init__(self, name, package='', description='', path=None, digest=None):
+        self.name = name
+        self.package = package
+        self.description = description
+        self.path = path
+        self.digest = digest
+        self.references = {}   # node name -> sheet reference, e.g. '.types.'
+        self.nodes = {}        # node name -> (visibility, description)
+        self.relations = []    # (source, relation, target, line)
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return f'Sheet({self.name!r}, nodes={len(self.nodes)}, relations={len(self.relations)})'
+
+
+def parse_sheet(lines, path=None, digest=None):
+    """Parse an iterable of sheet lines into a `Sheet`."""
+    fallback = os.path.splitext(os.path.basename(path))[0] if path else ''
+    meta = {}
+    references = {}
+    nodes = {}
+    relations = []
+    wildcards = []
+    section = None
+
+    for lineno, raw in enumerate(lines, 1):
+        line = raw.rstrip('\r\n')
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+
+        # Section headers start in column 0 and carry no value.  Anything
+        # else (including the occasional unindented entry) belongs to the
+        # current section.
+        match = _SECTION_RE.match(line)
+        if match and not line[0].isspace():
+            section = match.group(1)
+            if section not in SECTIONS:
+                raise SheetError(f'unknown section {section!r}', path, lineno)
+            continue
+        if section is None:
+            raise SheetError('entry outside of any section', path, lineno)
+
+        if section == 'relations':
+            match = _RELATION_RE.match(stripped)
+            if not match:
+                raise SheetError(f'malformed relation {stripped!r}', path, lineno)
+            source, relation, target = match.groups()
+            if target == '*':
+                raise SheetError('wildcard targets are not supported', path, lineno)
+            if source == '*':
+                wildcards.append((relation, target, lineno))
+            else:
+                relations.append((source, relation, target, lineno))
+            continue
+
+        key, sep, value = stripped.partition(':')
+        key = key.strip()
+        if not sep or not key:
+            raise SheetError(f'expected "name: value", got {stripped!r}', path, lineno)
+        value = value.strip()
+        if section == 'meta':
+            meta[key] = value
+        elif section == 'references':
+            references[key] = value
+        elif section in VISIBILITIES:
+            if key in nodes:
+                raise SheetError(f'node {key!r} declared twice', path, lineno)
+            nodes[key] = (section, value)
+        # dependencies/subpackages are package-level and carry nothing here
+
+    sheet = Sheet(meta.get('name', fallback), meta.get('package', ''),
+                  meta.get('description', ''), path, digest)
+    sheet.references = references
+    sheet.nodes = nodes
+    # Wildcards apply to every node declared in this sheet, in declaration
+    # order, and are emitted where the wildcard line appeared.
+    expanded = [(name, relation, target, lineno)
+                for relation, target, lineno in wildcards
+                for name in nodes]
+    sheet.relations = sorted(expanded + relations, key=lambda r: r[3])
+    return sheet
+
+
+class SheetCache:
+    """Content-hash keyed cache of parsed sheets.
+
+    Entries live in memory for the lifetime of the cache and, if `directory`
+    is given, as pickles on disk so later processes can reuse them.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._memory = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, digest):
+        return os.path.join(self.directory, f'{digest}.sheet.pickle')
+
+    def get(self, digest):
+        sheet = self._memory.get(digest)
+        if sheet is None and self.directory:
+            try:
+                with open(self._path(digest), 'rb') as f:
+                    sheet = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                sheet = None
+            if sheet is not None:
+                self._memory[digest] = sheet
+        if sheet is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return sheet
+
+    def put(self, digest, sheet):
+        self._memory[digest] = sheet
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f'{self._path(digest)}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(sheet, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._path(digest))
+
+
+def sheet_digest(data):
+    """Cache key for raw sheet bytes."""
+    h = hashlib.sha256(b'sheet-v%d\0' % PARSER_VERSION)
+    h.update(data)
+    return h.hexdigest()
+
+
+def load_sheet(path, cache=None):
+    """Load one sheet file, consulting `cache` by content hash."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = sheet_digest(data)
+    if cache is not None:
+        sheet = cache.get(digest)
+        if sheet is not None:
+            # Identical content may live under a different path; don't
+            # relabel a sheet another caller already holds.
+            if sheet.path != path:
+                copy = Sheet.__new__(Sheet)
+                copy.__setstate__(sheet.__getstate__())
+                copy.path = path
+                sheet = copy
+            return sheet
+    sheet = parse_sheet(data.decode('utf-8').splitlines(), path, digest)
+    if cache is not None:
+        cache.put(digest, sheet)
+    return sheet
+
+
+def find_sheets(*paths):
+    """Expand directories to the `.sheet` files they contain, sorted by path."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.endswith('.sheet'))
+        else:
+            found.append(path)
+    return found
+
+
+class Model:
+    """All sheets of a load merged into one node and relation set."""
+
+    def __init__(self, sheets=()):
+        self.sheets = []
+        self.nodes = {}        # node name -> Node
+        self.relations = []    # Relation, in sheet order
+        for sheet in sheets:
+            self.add_sheet(sheet)
+
+    def add_sheet(self, sheet):
+        for name, (visibility, description) in sheet.nodes.items():
+            other = self.nodes.get(name)
+            if other is not None:
+                raise SheetError(f'node {name!r} already declared in sheet {other.sheet!r}',
+                                 sheet.path)
+            self.nodes[name] = Node(name, visibility, description, sheet.name)
+        self.relations.extend(Relation(s, r, t, sheet.name, line)
+                              for s, r, t, line in sheet.relations)
+        self.sheets.append(sheet)
+
+    def sheet(self, name):
+        for sheet in self.sheets:
+            if sheet.name == name:
+                return sheet
+        raise KeyError(name)
+
+    def node_names(self):
+        """Declared nodes first, then names only used in relations."""
+        names = dict.fromkeys(self.nodes)
+        for s, r, t, _, _ in self.relations:
+            names.setdefault(s)
+            names.setdefault(r)
+            names.setdefault(t)
+        return list(names)
+
+    def __repr__(self):
+        return f'Model(sheets={len(self.sheets)}, nodes={len(self.nodes)}, relations={len(self.relations)})'
+
+
+def load_model(*paths, cache=None):
+    """Load sheets (files or directories) into a `Model`."""
+    if not paths:
+        paths = ('sheets',)
+    with span('load_model'):
+        model = Model(load_sheet(path, cache) for path in find_sheets(*paths))
+    count('sheets', len(model.sheets))
+    return model
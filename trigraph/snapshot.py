@@ -0,0 +1,340 @@
+"""
+Memory-mappable binary snapshots of a compiled `TripleStore`.
+
+A snapshot holds everything the tools need from the sheets -- the interned
+string table, the relation columns, node visibility, sheet membership, the
+`references` table and the trigraph incidence CSR -- as flat little-endian
+arrays.  Opening one maps the file and wraps each section in a typed
+`memoryview`; nothing is parsed or copied, so startup does not grow with
+the number of sheets.
+
+Layout (all sections 8-byte aligned):
+
+    header    magic 'TRIGSNAP', format version, byte order,
+              32-byte source fingerprint, section count
+    sections  (name, typecode, offset, nbytes) per section
+    data      the sections themselves
+
+The fingerprint covers the path, size and mtime of every input sheet plus
+the parser and format versions.  `open_snapshot` rejects a snapshot whose
+version, byte order or fingerprint does not match, and `load_store` then
+rebuilds it from the sheets.  File contents are not hashed: an edit that
+keeps both the size and the mtime of a sheet goes unnoticed until
+`python -m trigraph snapshot` rebuilds the snapshot.
+
+Each set of sheet paths has its own snapshot file (`snapshot_path`), so
+switching between models does not rebuild the snapshot of the other.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from .constraints import ConstraintError, enforce
+from .sheets import DEFAULT_CACHE_DIR, PARSER_VERSION, SheetCache, find_sheets, load_model
+from .store import CSR, TripleStore
+from .tracing import span
+
+MAGIC = b'TRIGSNAP'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<8sII32sI')
+_SECTION = struct.Struct('<24s4sQQ')
+_BYTEORDER = {'little': 1, 'big': 2}[sys.byteorder]
+
+
+class SnapshotError(Exception):
+    """A snapshot is missing, corrupt or does not match its sources."""
+
+
+def snapshot_path(*paths):
+    """The snapshot file of the model loaded from the sheet `paths`."""
+    key = '\0'.join(sorted(map(os.path.normpath, paths or ('sheets',))))
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(DEFAULT_CACHE_DIR, f'model-{digest}.snapshot')
+
+
+def source_fingerprint(files):
+    """Fingerprint of the input sheets, cheap enough to check on every start.
+
+    Only the path, size and mtime of each file are hashed, not its contents,
+    so an edit that keeps both size and mtime is not detected.
+    """
+    h = hashlib.sha256(b'snapshot-v%d-parser-v%d\0' % (FORMAT_VERSION, PARSER_VERSION))
+    for path in files:
+        st = os.stat(path)
+        h.update(f'{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}\0'.encode())
+    return h.digest()
+
+
+def _string_table(strings):
+    """(offsets, blob, sorted ids) for a sequence of strings."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = array('q', [0])
+    total = 0
+    for data in encoded:
+        total += len(data)
+        offsets.append(total)
+    order = array('i', sorted(range(len(encoded)), key=encoded.__getitem__))
+    return offsets, b''.join(encoded), order
+
+
+def write_snapshot(store, path, fingerprint):
+    """Write `store` to `path` atomically."""
+    aux = {}
+    for name in store.sheets:
+        aux.setdefault(name, len(aux))
+    for _, name, target in store.references:
+        aux.setdefault(name, len(aux))
+        aux.setdefault(target, len(aux))
+    aux_strings = list(aux)
+
+    string_offsets, string_blob, string_order = _string_table(list(store.strings))
+    aux_offsets, aux_blob, _ = _string_table(aux_strings)
+    incidence = store.incidence()
+    sections = [
+        ('string_offsets', string_offsets),
+        ('string_blob', string_blob),
+        ('string_order', string_order),
+        ('node_sheet', store.node_sheet),
+        ('node_visibility', store.node_visibility),
+        ('source', store.source),
+        ('target', store.target),
+        ('relation', store.relation),
+        ('relation_sheet', store.relation_sheet),
+        ('relation_line', store.relation_line),
+        ('aux_offsets', aux_offsets),
+        ('aux_blob', aux_blob),
+        ('sheets', array('i', (aux[name] for name in store.sheets))),
+        ('ref_sheet', array('i', (sheet for sheet, _, _ in store.references))),
+        ('ref_name', array('i', (aux[name] for _, name, _ in store.references))),
+        ('ref_target', array('i', (aux[target] for _, _, target in store.references))),
+        ('incidence_offsets', incidence.offsets),
+        ('incidence_indices', incidence.indices),
+    ]
+
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table = []
+    payloads = []
+    for name, data in sections:
+        offset += -offset % 8
+        raw = data.tobytes() if isinstance(data, array) else bytes(data)
+        code = data.typecode if isinstance(data, array) else 'B'
+        table.append(_SECTION.pack(name.encode(), code.encode(), offset, len(raw)))
+        payloads.append((offset, raw))
+        offset += len(raw)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, _BYTEORDER, fingerprint, len(sections)))
+        f.write(b''.join(table))
+        for start, raw in payloads:
+            f.write(b'\0' * (start - f.tell()))
+            f.write(raw)
+    os.replace(tmp, path)
+
+
+class MappedStrings:
+    """Read-only `Interner` over a mapped string table."""
+
+    def __init__(self, offsets, blob, order=None):
+        self.offsets = offsets
+        self.blob = blob
+        self.order = order
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    def _raw(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def get(self, name, default=None):
+        """Binary search of the sorted id table; no dictionary is built."""
+        key = name.encode('utf-8')
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._raw(self.order[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.order) and self._raw(self.order[lo]) == key:
+            return self.order[lo]
+        return default
+
+    def id(self, name):
+        i = self.get(name)
+        if i is None:
+            raise KeyError(name)
+        return i
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def intern(self, name):
+        i = self.get(name)
+        if i is None:
+            raise TypeError('snapshot stores are read-only; use thaw() to modify')
+        return i
+
+
+class MappedStore(TripleStore):
+    """`TripleStore` whose columns are views into a mapped snapshot file."""
+
+    def __init__(self, path, fingerprint=None):
+        super().__init__()
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f'{path}: empty snapshot') from e
+        try:
+            sections = self._read_header(fingerprint)
+        except SnapshotError:
+            self.close()
+            raise
+        self.strings = MappedStrings(sections['string_offsets'], sections['string_blob'],
+                                     sections['string_order'])
+        for name in ('node_sheet', 'node_visibility', 'source', 'target', 'relation',
+                     'relation_sheet', 'relation_line'):
+            setattr(self, name, sections[name])
+        aux = MappedStrings(sections['aux_offsets'], sections['aux_blob'])
+        self.sheets = [aux[i] for i in sections['sheets']]
+        self.references = [(sheet, aux[name], aux[target]) for sheet, name, target
+                           in zip(sections['ref_sheet'], sections['ref_name'],
+                                  sections['ref_target'])]
+        self._csr['incidence'] = CSR(sections['incidence_offsets'],
+                                     sections['incidence_indices'])
+
+    def _read_header(self, fingerprint):
+        view = memoryview(self._mmap)
+        if len(view) < _HEADER.size:
+            raise SnapshotError(f'{self.path}: truncated header')
+        magic, version, byteorder, stored, count = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise SnapshotError(f'{self.path}: not a trigraph snapshot')
+        if version != FORMAT_VERSION or byteorder != _BYTEORDER:
+            raise SnapshotError(f'{self.path}: incompatible snapshot format')
+        if fingerprint is not None and stored != fingerprint:
+            raise SnapshotError(f'{self.path}: snapshot is stale')
+        self.fingerprint = stored
+        sections = {}
+        for i in range(count):
+            name, code, offset, nbytes = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+            if offset + nbytes > len(view):
+                raise SnapshotError(f'{self.path}: truncated section')
+            code = code.rstrip(b'\0').decode()
+            section = view[offset:offset + nbytes]
+            sections[name.rstrip(b'\0').decode()] = section if code == 'B' else section.cast(code)
+        return sections
+
+    def add_node(self, name, visibility=None, sheet=None):
+        if visibility is None:
+            return self.strings.intern(name)
+        raise TypeError('snapshot stores are read-only; use thaw() to modify')
+
+    def add_ids(self, source, relation, target, sheet=None, line=0):
+        raise TypeError('snapshot stores are read-only; use thaw() to modify')
+
+    def thaw(self):
+        """Mutable in-memory copy."""
+        store = TripleStore()
+        for name in self.strings:
+            store.strings.intern(name)
+        for name in ('node_sheet', 'node_visibility', 'source', 'target', 'relation',
+                     'relation_sheet', 'relation_line'):
+            getattr(store, name).extend(getattr(self, name))
+        store.sheets = list(self.sheets)
+        store.references = list(self.references)
+        return store
+
+    def close(self):
+        # Views handed out keep the buffer exported; drop ours first.
+        self.__dict__.update(source=None, target=None, relation=None, node_sheet=None,
+                             node_visibility=None, relation_sheet=None, relation_line=None,
+                             strings=None, _csr={})
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass    # still referenced elsewhere; closed when collected
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_snapshot(path, fingerprint=None):
+    """Map a snapshot; raises `SnapshotError` if it is unusable or stale."""
+    try:
+        return MappedStore(path, fingerprint)
+    except FileNotFoundError as e:
+        raise SnapshotError(f'{path}: no snapshot') from e
+
+
+def load_store(*paths, snapshot=None, cache=None, check=True):
+    """Read-only `MappedStore` for the given sheets, from a fresh snapshot when possible.
+
+    A missing or stale snapshot (by default `snapshot_path(*paths)`) is
+    rebuilt from the sheets, using `cache` for parsing, and mapped like a
+    fresh one, so callers get the same kind of store either way; they
+    `thaw()` it to modify it.  Unless `check` is false, a rebuilt store
+    must satisfy the `unique` and `mandatory` relation properties:
+    violations raise `ConstraintError` and no snapshot is written, so a
+    fresh snapshot is always a checked one.
+    """
+    if snapshot is None:
+        snapshot = snapshot_path(*paths)
+    with span('load_store'):
+        files = find_sheets(*(paths or ('sheets',)))
+        fingerprint = source_fingerprint(files)
+        try:
+            return open_snapshot(snapshot, fingerprint)
+        except SnapshotError:
+            pass
+        if cache is None:
+            cache = SheetCache(DEFAULT_CACHE_DIR)
+        store = TripleStore.from_model(load_model(*files, cache=cache))
+        if check:
+            enforce(store)
+        with span('write_snapshot'):
+            write_snapshot(store, snapshot, fingerprint)
+        return open_snapshot(snapshot, fingerprint)
+
+
+def main(argv=None):
+    import argparse
+    from .validate import format_violation
+
+    parser = argparse.ArgumentParser(prog='trigraph snapshot',
+                                     description='Compile sheets into a mappable snapshot.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    parser.add_argument('-o', '--output',
+                        help='snapshot file (default: the one load_store uses for the paths)')
+    args = parser.parse_args(argv)
+    if args.output is None:
+        args.output = snapshot_path(*args.paths)
+    files = find_sheets(*args.paths)
+    store = TripleStore.from_model(load_model(*files, cache=SheetCache(DEFAULT_CACHE_DIR)))
+    try:
+        enforce(store)
+    except ConstraintError as e:
+        for v in e.violations:
+            print(format_violation(v), file=sys.stderr)
+        print(f'{e.args[0].partition(":")[0]}; {args.output} not written', file=sys.stderr)
+        return 1
+    write_snapshot(store, args.output, source_fingerprint(files))
+    print(f'Wrote {args.output}: {store.num_nodes} nodes, {store.num_relations} relations, '
+          f'{os.path.getsize(args.output)} bytes')
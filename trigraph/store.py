@@ -0,0 +1,345 @@
+"""
+Array-backed, interned triple store for the trigraph.
+
+White nodes (every named node) are interned to dense integer ids.  Each
+black node -- one relation instance `source -relation-> target` -- is a row
+in three parallel int32 columns, so a relation costs 12 bytes of column
+data plus 8 bytes of provenance (sheet, line) instead of a tuple of strings
+and a handful of set entries.
+
+Adjacency is exposed as CSR (compressed sparse row) structures: an
+`offsets` array with one entry per node plus one, and an `indices` array
+holding the neighbours of node `n` in `indices[offsets[n]:offsets[n + 1]]`.
+"""
+
+import sys
+from array import array
+from collections import Counter, defaultdict
+from itertools import accumulate, compress
+from operator import and_, ne
+
+from .sheets import VISIBILITIES
+from .tracing import count, span
+
+# Column roles, named after the trigraph edge colors
+SOURCE, TARGET, RELATION = 'red', 'green', 'blue'
+ROLES = (SOURCE, TARGET, RELATION)
+
+NO_SHEET = -1
+NO_VISIBILITY = -1
+
+
+class Interner:
+    """Bidirectional mapping between names and dense integer ids."""
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def id(self, name):
+        return self.ids[name]
+
+    def get(self, name, default=None):
+        return self.ids.get(name, default)
+
+    def __getitem__(self, i):
+        return self.names[i]
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+
+class CSR:
+    """Compressed sparse rows: `indices[offsets[n]:offsets[n + 1]]` belong to `n`."""
+
+    __slots__ = ('offsets', 'indices')
+
+    def __init__(self, offsets, indices):
+        self.offsets = offsets
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def row(self, n):
+        return self.indices[self.offsets[n]:self.offsets[n + 1]]
+
+    def degree(self, n):
+        return self.offsets[n + 1] - self.offsets[n]
+
+    def nbytes(self):
+        return _nbytes(self.offsets) + _nbytes(self.indices)
+
+
+def group_by(keys, n, values=None):
+    """CSR grouping positions (or `values`) by their key in `keys`.
+
+    `keys` holds one integer in `range(n)` per row.  Rows keep their original
+    order inside each group, so grouping relation ids gives each node its
+    relations in load order.
+    """
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    if values is not None:
+        order = map(values.__getitem__, order)
+    counts = Counter(keys)
+    offsets = array('i', [0])
+    offsets.extend(accumulate(counts.get(k, 0) for k in range(n)))
+    return CSR(offsets, array('i', order))
+
+
+class TripleStore:
+    """Interned nodes plus relation columns `source`, `target`, `relation`."""
+
+    def __init__(self):
+        self.strings = Interner()
+        self.sheets = []                      # sheet names, indexed by sheet id
+        self.node_sheet = array('i')          # node id -> declaring sheet id
+        self.node_visibility = array('b')     # node id -> index into VISIBILITIES
+        self.source = array('i')
+        self.target = array('i')
+        self.relation = array('i')
+        self.relation_sheet = array('i')      # relation id -> sheet id
+        self.relation_line = array('i')       # relation id -> line in that sheet
+        self.references = []                  # (sheet id, name, sheet reference)
+        self._csr = {}
+
+    @classmethod
+    def from_model(cls, model):
+        with span('build'):
+            store = cls()
+            sheet_ids = {sheet.name: store.add_sheet(sheet.name) for sheet in model.sheets}
+            for sheet in model.sheets:
+                store.references.extend((sheet_ids[sheet.name], name, target)
+                                        for name, target in sheet.references.items())
+            for name, node in model.nodes.items():
+                store.add_node(name, node.visibility, sheet_ids[node.sheet])
+            for s, r, t, sheet, line in model.relations:
+                store.add(s, r, t, sheet_ids[sheet], line)
+        count('nodes', store.num_nodes)
+        count('relations', store.num_relations)
+        return store
+
+    # Construction
+
+    def add_sheet(self, name):
+        self.sheets.append(name)
+        return len(self.sheets) - 1
+
+    def add_node(self, name, visibility=None, sheet=NO_SHEET):
+        """Intern `name`; declaring it records visibility and sheet."""
+        i = self.strings.intern(name)
+        if i == len(self.node_sheet):
+            self.node_sheet.append(NO_SHEET)
+            self.node_visibility.append(NO_VISIBILITY)
+        if visibility is not None:
+            self.node_visibility[i] = VISIBILITIES.index(visibility)
+            self.node_sheet[i] = sheet
+        return i
+
+    def add(self, source, relation, target, sheet=NO_SHEET, line=0):
+        """Append one relation by node names and return its (black node) id."""
+        return self.add_ids(self.add_node(source), self.add_node(relation),
+                            self.add_node(target), sheet, line)
+
+    def add_ids(self, source, relation, target, sheet=NO_SHEET, line=0):
+        self.source.append(source)
+        self.target.append(target)
+        self.relation.append(relation)
+        self.relation_sheet.append(sheet)
+        self.relation_line.append(line)
+        self._csr.clear()
+        return len(self.source) - 1
+
+    def extend_ids(self, source, relation, target, sheet=NO_SHEET):
+        """Append relations column by column and return the id of the first."""
+        first = len(self.source)
+        self.source.extend(source)
+        self.target.extend(target)
+        self.relation.extend(relation)
+        n = len(self.source) - first
+        if len(self.target) != first + n or len(self.relation) != first + n:
+            del self.source[first:], self.target[first:], self.relation[first:]
+            raise ValueError('source, relation and target differ in length')
+        self.relation_sheet.extend(array('i', [sheet]) * n)
+        self.relation_line.extend(array('i', bytes(4 * n)))
+        self._csr.clear()
+        return first
+
+    # Access
+
+    @property
+    def num_nodes(self):
+        return len(self.strings)
+
+    @property
+    def num_relations(self):
+        return len(self.source)
+
+    def node_ids(self):
+        """Ids of the nodes visible through this store (all of them)."""
+        return range(self.num_nodes)
+
+    def relation_ids(self):
+        """Ids of the relations visible through this store (all of them)."""
+        return range(self.num_relations)
+
+    def id(self, name):
+        return self.strings.id(name)
+
+    def name(self, node):
+        return self.strings[node]
+
+    def visibility(self, node):
+        v = self.node_visibility[node]
+        return VISIBILITIES[v] if v != NO_VISIBILITY else None
+
+    def column(self, role):
+        return {SOURCE: self.source, TARGET: self.target, RELATION: self.relation}[role]
+
+    def triple(self, r):
+        return self.source[r], self.relation[r], self.target[r]
+
+    def triples(self):
+        return zip(self.source, self.relation, self.target)
+
+    def provenance(self, r):
+        """(sheet name, line) a relation was loaded from."""
+        sheet = self.relation_sheet[r]
+        return (self.sheets[sheet] if sheet != NO_SHEET else None), self.relation_line[r]
+
+    # Adjacency
+
+    def by(self, role):
+        """CSR from node id to the ids of relations having it in `role`."""
+        csr = self._csr.get(role)
+        if csr is None:
+            with span('csr', role=role):
+                csr = self._csr[role] = group_by(self.column(role), self.num_nodes)
+        return csr
+
+    def out_relations(self, node):
+        return self.by(SOURCE).row(node)
+
+    def in_relations(self, node):
+        return self.by(TARGET).row(node)
+
+    def incidence(self):
+        """CSR from white node to every black node touching it, in any role.
+
+        A black node touching the same white node twice (e.g. a self loop)
+        is listed once.
+        """
+        csr = self._csr.get('incidence')
+        if csr is None:
+            with span('incidence'):
+                source, target, relation = self.source, self.target, self.relation
+                keep_target = list(map(ne, target, source))
+                keep_relation = list(map(and_, map(ne, relation, source),
+                                         map(ne, relation, target)))
+                blacks = range(self.num_relations)
+                keys = array('i', source)
+                keys.extend(compress(target, keep_target))
+                keys.extend(compress(relation, keep_relation))
+                values = array('i', blacks)
+                values.extend(compress(blacks, keep_target))
+                values.extend(compress(blacks, keep_relation))
+                csr = self._csr['incidence'] = group_by(keys, self.num_nodes, values)
+        return csr
+
+    def nbytes(self):
+        """Bytes held by the relation and node columns (excluding strings)."""
+        columns = (self.source, self.target, self.relation, self.relation_sheet,
+                   self.relation_line, self.node_sheet, self.node_visibility)
+        return sum(map(_nbytes, columns))
+
+    def __repr__(self):
+        return f'TripleStore(nodes={self.num_nodes}, relations={self.num_relations})'
+
+
+def _nbytes(a):
+    return a.itemsize * len(a) if isinstance(a, array) else a.nbytes
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate retained size of `obj` and everything it contains."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(x, seen) for x in obj)
+    elif hasattr(obj, '__slots__') or hasattr(obj, '__dict__'):
+        size += sum(deep_sizeof(getattr(obj, s), seen)
+                    for s in getattr(obj, '__slots__', ()) if hasattr(obj, s))
+        if hasattr(obj, '__dict__'):
+            size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def legacy_representation(store):
+    """Rebuild the string-tuple `edges` list and adjacency sets used before."""
+    names = list(store.strings)
+    edges = []
+    for r, (s, rel, t) in enumerate(store.triples(), 1):
+        black = f'r{r}'
+        edges.extend([(black, names[s], 'red'), (black, names[t], 'green'),
+                      (black, names[rel], 'blue')])
+    graph = defaultdict(set)
+    for black, white, color in edges:
+        graph[black].add(white)
+        graph[white].add(black)
+    return edges, graph
+
+
+def memory_report(store):
+    """Bytes per relation for the store versus the legacy edge list + adjacency."""
+    m = max(store.num_relations, 1)
+    # Strings are shared by both representations, so count them separately
+    strings = deep_sizeof(store.strings)
+    columns = store.nbytes()
+    adjacency = store.incidence().nbytes()
+    legacy = deep_sizeof(legacy_representation(store), seen=set(map(id, store.strings)))
+    return {
+        'relations': store.num_relations,
+        'nodes': store.num_nodes,
+        'store_columns_per_relation': columns / m,
+        'store_adjacency_per_relation': adjacency / m,
+        'store_strings_per_relation': strings / m,
+        'store_total_per_relation': (columns + adjacency + strings) / m,
+        'legacy_per_relation': legacy / m,
+    }
+
+
+def main(argv=None):
+    import argparse
+    from .sheets import SheetCache, DEFAULT_CACHE_DIR, load_model
+
+    parser = argparse.ArgumentParser(prog='trigraph memory',
+                                     description='Report trigraph store memory use.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    args = parser.parse_args(argv)
+    store = TripleStore.from_model(load_model(*args.paths, cache=SheetCache(DEFAULT_CACHE_DIR)))
+    report = memory_report(store)
+    print(f"{report['relations']} relations, {report['nodes']} nodes")
+    for key, value in report.items():
+        if key.endswith('_per_relation'):
+            print(f'  {key:32s} {value:10.1f} bytes')
@@ -0,0 +1,321 @@
+"""
+Generate synthetic package trees that load, resolve and validate cleanly.
+
+The tree is shaped like the real meta-model, so every stage has the same
+kind of work to do as on real sheets, just more of it:
+
+    layer-0/metametameta/   a copy of the core sheets (`sheets/`)
+    layer-0/bench/          signatures that user-level relation signatures
+                            need and the core does not declare yet
+    layer-1/l1p<P>/         a schema (like `types.sheet` and
+                            `metaRelationSignatures.sheet`: types, relations
+                            and their signatures) plus instance sheets
+    layer-<L>/l<L>p<P>/     instance sheets typed by the public types and
+                            related by the public relations of a layer-1
+                            schema
+
+Instance sheets declare nodes in all three visibility classes, type them
+with `* -type-> T` wildcards or one line per node (by `wildcards`, the
+share of sheets using wildcards) and give every node `edges` relations,
+each accepted by the relation's signature.  A signature allows `fanout`
+source and target types.  References are written the way the packages
+loader resolves them, so neither `python -m trigraph packages` nor
+validation finds anything beyond the issues of the core sheets themselves.
+
+`spec_for(relations)` picks the number of packages (and, for small
+targets, the sheet size) for about that many relations; output is
+deterministic for a given `Spec`.
+"""
+
+import os
+import random
+import shutil
+from collections import namedtuple
+
+from .sheets import find_sheets
+
+CORE = 'layer-0.metametameta'
+CORE_SHEETS = 'sheets'
+CORE_INFO = 'package-info'
+
+Spec = namedtuple('Spec', 'layers packages sheets nodes wildcards fanout edges seed')
+Spec.__new__.__defaults__ = (2, 1, 8, (20, 10, 10), 0.5, 2, 3, 0)
+
+_BENCH_SHEET = f'''\
+meta:
+  name: benchSignatures
+  package: layer-0.bench
+  description: signatures accepting relation signatures declared by user packages
+references:
+  type: {CORE}.metaRelations.
+  metaLevel: {CORE}.metaRelations.
+  signature: {CORE}.metaRelations.
+  sourceType: {CORE}.metaRelations.
+  targetType: {CORE}.metaRelations.
+  class: {CORE}.types.
+  metaNType: {CORE}.types.
+  relationSignature: {CORE}.types.
+  metaRelationSignature: {CORE}.types.
+  metaLevel-3: {CORE}.metaLevels.
+  relation-to-relationSignature: {CORE}.metaRelationSignatures.
+private:
+  relationSignature-to-class: from a relation signature to the types its relation accepts
+relations:
+  relationSignature-to-class -type-> metaNType
+  relationSignature-to-class -type-> metaRelationSignature
+  relationSignature-to-class -metaLevel-> metaLevel-3
+  relationSignature-to-class -sourceType-> relationSignature
+  relationSignature-to-class -targetType-> class
+  signature -signature-> relation-to-relationSignature
+  sourceType -signature-> relationSignature-to-class
+  targetType -signature-> relationSignature-to-class
+'''
+
+_VISIBILITIES = ('public', 'public+1', 'private')
+
+
+def _instance_sheets(spec, layer):
+    return max(1, spec.sheets - 2) if layer == 1 else spec.sheets
+
+
+def estimate(spec):
+    """Relations a tree generated from `spec` will hold, besides the core."""
+    types = sum(spec.nodes)
+    schema = 2 * types + 2 * spec.nodes[0] + spec.nodes[0] * (3 + 2 * spec.fanout)
+    per_sheet = sum(spec.nodes) * (2 + spec.edges)
+    total = 0
+    for layer in range(1, spec.layers + 1):
+        total += spec.packages * (_instance_sheets(spec, layer) * per_sheet
+                                  + (schema if layer == 1 else 0))
+    return total + 8
+
+
+def spec_for(relations, **params):
+    """`Spec` for about `relations` relations; other fields from `params`."""
+    spec = Spec(**params)
+    per_package = estimate(spec._replace(packages=1))
+    if per_package > relations:
+        scale = relations / per_package
+        nodes = tuple(max(1, round(n * scale)) for n in spec.nodes)
+        return spec._replace(packages=1, nodes=nodes)
+    return spec._replace(packages=max(1, round(relations / per_package)))
+
+
+def _write(path, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+        f.write('\n')
+
+
+def _package_info(path, name, layer, dependencies):
+    lines = ['meta:', f'  name: {name}', f'  description: synthetic package {name}',
+             f'  layer: {layer}', '  version: 1.0.0', 'dependencies:']
+    lines.extend(f'  {dependency}' for dependency in dependencies)
+    lines.append('subpackages:')
+    _write(os.path.join(path, 'package-info'), lines)
+
+
+def _head(name, package, description, references):
+    lines = ['meta:', f'  name: {name}', f'  package: {package}',
+             f'  description: {description}', 'references:']
+    lines.extend(f'  {node}: {where}' for node, where in references.items())
+    return lines
+
+
+def _declare(lines, nodes, describe):
+    """Declaration sections for `nodes`, a list of (name, visibility index)."""
+    for v, visibility in enumerate(_VISIBILITIES):
+        names = [name for name, vis in nodes if vis == v]
+        if names:
+            lines.append(f'{visibility}:')
+            lines.extend(f'  {name}: {describe(name)}' for name in names)
+
+
+def _each(lines, names, relation, target, wildcard):
+    if wildcard:
+        lines.append(f'  * -{relation}-> {target}')
+    else:
+        lines.extend(f'  {name} -{relation}-> {target}' for name in names)
+
+
+def _classes(nodes):
+    """Visibility index of each of `sum(nodes)` nodes."""
+    return [v for v, count in enumerate(nodes) for _ in range(count)]
+
+
+def _schema(root, spec, rng, prefix, package):
+    """Types and relations sheets of one layer-1 package; (types, relations)."""
+    core = {'type': f'{CORE}.metaRelations.', 'metaLevel': f'{CORE}.metaRelations.'}
+    types = [(f'{prefix}T{i}', v) for i, v in enumerate(_classes(spec.nodes))]
+    lines = _head(f'{prefix}types', package, f'types of {package}',
+                  dict(core, **{'class': f'{CORE}.types.', 'metaLevel-1': f'{CORE}.metaLevels.'}))
+    _declare(lines, types, lambda name: f'synthetic type {name}')
+    lines.append('relations:')
+    names = [name for name, _ in types]
+    wildcard = rng.random() < spec.wildcards
+    _each(lines, names, 'type', 'class', wildcard)
+    _each(lines, names, 'metaLevel', 'metaLevel-1', wildcard)
+    _write(os.path.join(root, f'{prefix}types.sheet'), lines)
+
+    public = [name for name, v in types if not v]
+    relations = [f'{prefix}r{j}' for j in range(len(public))]
+    references = dict(core, **{'signature': f'{CORE}.metaRelations.',
+                               'sourceType': f'{CORE}.metaRelations.',
+                               'targetType': f'{CORE}.metaRelations.',
+                               'relation': f'{CORE}.types.',
+                               'relationSignature': f'{CORE}.types.',
+                               'metaLevel-1': f'{CORE}.metaLevels.'})
+    references.update((name, f'.{prefix}types.') for name in public)
+    lines = _head(f'{prefix}relations', package, f'relations of {package} and their signatures',
+                  references)
+    _declare(lines, [(r, 0) for r in relations] + [(f'{r}sig', 2) for r in relations],
+             lambda name: f'synthetic relation {name}')
+    lines.extend(['relations:', '  * -metaLevel-> metaLevel-1'])
+    n = len(public)
+    for j, r in enumerate(relations):
+        lines.append(f'  {r} -type-> relation')
+        lines.append(f'  {r}sig -type-> relationSignature')
+        lines.append(f'  {r} -signature-> {r}sig')
+        for i in range(min(spec.fanout, n)):
+            lines.append(f'  {r}sig -sourceType-> {public[(j + i) % n]}')
+        for i in range(min(spec.fanout, n)):
+            lines.append(f'  {r}sig -targetType-> {public[(j + 1 + i) % n]}')
+    _write(os.path.join(root, f'{prefix}relations.sheet'), lines)
+    return public, relations
+
+
+def _instances(root, spec, rng, prefix, package, layer, schema, schema_package):
+    """Instance sheets of one package, typed and related by `schema`."""
+    types, relations = schema
+    n = len(types)
+    fanout = min(spec.fanout, n)
+    classes = _classes(spec.nodes)
+    sheets = []
+    by_type = [[] for _ in range(n)]
+    for k in range(_instance_sheets(spec, layer)):
+        name = f'{prefix}s{k}'
+        wildcard = rng.random() < spec.wildcards
+        shared = rng.randrange(n)
+        nodes = []
+        for i, v in enumerate(classes):
+            node = f'{name}n{i}'
+            t = shared if wildcard else rng.randrange(n)
+            nodes.append((node, v, t))
+            by_type[t].append((node, k))
+        sheets.append((name, wildcard, shared, nodes))
+
+    schema_prefix = schema_package.rsplit('.', 1)[1]
+    for k, (name, wildcard, shared, nodes) in enumerate(sheets):
+        references = {'type': f'{CORE}.metaRelations.', 'metaLevel': f'{CORE}.metaRelations.',
+                      'metaLevel-0': f'{CORE}.metaLevels.'}
+        body = []
+        if wildcard:
+            body.append(f'  * -type-> {types[shared]}')
+            references[types[shared]] = f'{schema_package}.{schema_prefix}types.'
+        else:
+            for node, _, t in nodes:
+                body.append(f'  {node} -type-> {types[t]}')
+                references[types[t]] = f'{schema_package}.{schema_prefix}types.'
+        _each(body, [node for node, _, _ in nodes], 'metaLevel', 'metaLevel-0', wildcard)
+        for node, _, t in nodes:
+            # Relations whose signature accepts type t as source, each with a
+            # target type that signature accepts and that has nodes
+            choices = [(j, u) for j in dict.fromkeys((t - i) % n for i in range(fanout))
+                       for u in dict.fromkeys((j + 1 + i) % n for i in range(fanout))
+                       if by_type[u]]
+            for _ in range(spec.edges if choices else 0):
+                j, u = rng.choice(choices)
+                target, where = rng.choice(by_type[u])
+                body.append(f'  {node} -{relations[j]}-> {target}')
+                references[relations[j]] = f'{schema_package}.{schema_prefix}relations.'
+                if where != k:
+                    references[target] = f'.{sheets[where][0]}.'
+        lines = _head(name, package, f'synthetic instances of {package}', references)
+        _declare(lines, [(node, v) for node, v, _ in nodes],
+                 lambda node: f'synthetic node {node}')
+        lines.append('relations:')
+        lines.extend(body)
+        _write(os.path.join(root, f'{name}.sheet'), lines)
+
+
+def generate(root, spec, core=CORE_SHEETS, core_info=CORE_INFO):
+    """Write a tree for `spec` below `root` (replacing it); the sheet paths."""
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    rng = random.Random(spec.seed)
+    core_dir = os.path.join(root, 'layer-0', 'metametameta')
+    os.makedirs(core_dir)
+    shutil.copy(core_info, os.path.join(core_dir, 'package-info'))
+    for path in find_sheets(core):
+        shutil.copy(path, core_dir)
+    bench_dir = os.path.join(root, 'layer-0', 'bench')
+    _package_info(bench_dir, 'bench', 0, [CORE])
+    _write(os.path.join(bench_dir, 'benchSignatures.sheet'), _BENCH_SHEET.splitlines())
+
+    schemas = []
+    for layer in range(1, spec.layers + 1):
+        for p in range(spec.packages):
+            prefix = f'l{layer}p{p}'
+            package = f'layer-{layer}.{prefix}'
+            path = os.path.join(root, f'layer-{layer}', prefix)
+            if layer == 1:
+                _package_info(path, prefix, layer, [CORE, 'layer-0.bench'])
+                schemas.append((package, _schema(path, spec, rng, prefix, package)))
+                schema_package, schema = schemas[-1]
+            else:
+                schema_package, schema = schemas[p % len(schemas)]
+                _package_info(path, prefix, layer, [CORE, schema_package])
+            _instances(path, spec, rng, prefix, package, layer, schema, schema_package)
+    return find_sheets(root)
+
+
+def _nodes(text):
+    counts = tuple(int(n) for n in text.split(','))
+    if len(counts) != 3 or min(counts) < 0 or not counts[0]:
+        raise ValueError('expected PUBLIC,PUBLIC1,PRIVATE with PUBLIC > 0')
+    return counts
+
+
+def add_arguments(parser):
+    """Generator options shared by `trigraph synthetic` and `trigraph bench`."""
+    defaults = Spec()
+    parser.add_argument('--layers', type=int, default=defaults.layers,
+                        help='package layers above the core (default %(default)s)')
+    parser.add_argument('--sheets', type=int, default=defaults.sheets,
+                        help='sheets per package (default %(default)s)')
+    parser.add_argument('--nodes', type=_nodes, default=defaults.nodes,
+                        metavar='PUB,PUB1,PRIV',
+                        help='nodes per visibility class and sheet (default 20,10,10)')
+    parser.add_argument('--wildcards', type=float, default=defaults.wildcards,
+                        help='share of sheets using `* -type->` wildcards (default %(default)s)')
+    parser.add_argument('--fanout', type=int, default=defaults.fanout,
+                        help='source and target types per signature (default %(default)s)')
+    parser.add_argument('--edges', type=int, default=defaults.edges,
+                        help='relations per instance node (default %(default)s)')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def spec_params(args):
+    return {field: getattr(args, field)
+            for field in ('layers', 'sheets', 'nodes', 'wildcards', 'fanout', 'edges', 'seed')}
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(prog='trigraph synthetic',
+                                     description='Write a synthetic package tree.')
+    add_arguments(parser)
+    parser.add_argument('root', help='output directory (replaced)')
+    parser.add_argument('--relations', type=float, default=1e4,
+                        help='approximate number of relations (default 1e4)')
+    args = parser.parse_args(argv)
+    spec = spec_for(int(args.relations), **spec_params(args))
+    start = time.perf_counter()
+    files = generate(args.root, spec)
+    print(f'Wrote {len(files)} sheets, about {estimate(spec)} relations, to {args.root} '
+          f'in {time.perf_counter() - start:.2f}s')
+    print(f'  {spec}')
+    return 0
@@ -0,0 +1,211 @@
+"""
+Named spans and counters for the pipeline stages, off unless profiling.
+
+Stages mark themselves with `span` and report sizes with `count`:
+
+    with span('parse', sheets=len(paths)):
+        ...
+    count('relations', store.num_relations)
+
+Without an active `Profiler` both return at once (`span` hands back one
+shared no-op context manager), so the calls stay in place in normal runs.
+With one -- `python -m trigraph --profile trace.json <command>`, or the
+`--profile` option of the generator scripts -- every span records its wall
+time and the peak RSS at its end.  With `memory=True` (`--profile-alloc`,
+`--alloc`) it also records the peak of traced Python allocations while it
+ran (tracemalloc; nested spans fold their peaks into their parent), at the
+price of running several times slower.  `write_trace` saves Chrome trace-event JSON
+(chrome://tracing, https://ui.perfetto.dev) with spans as complete events
+and counters and RSS as counter tracks; `summary` is a table per span name.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+_active = None               # the running Profiler, if any
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **args):
+    """Context manager timing stage `name`; `args` are shown with the event."""
+    if _active is None:
+        return _NO_SPAN
+    return _Span(_active, name, args)
+
+
+def count(name, value=1):
+    """Add `value` to counter `name` (nodes, relations, crossings, ...)."""
+    if _active is not None:
+        _active.count(name, value)
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'args', 'start', 'traced')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.traced = self.profiler._enter()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profiler._exit(self, end)
+        return False
+
+
+class Profiler:
+    """Collects span and counter events while it is `start`ed."""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = []
+        self.counters = defaultdict(int)
+        self._peaks = []          # per open span: highest traced peak of finished children
+        self._tracing = False
+
+    def start(self):
+        global _active
+        if self.memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+        _active = self
+        return self
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+        if self._tracing:
+            import tracemalloc
+            tracemalloc.stop()
+            self._tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _us(self, t):
+        return round((t - self.origin) * 1e6, 1)
+
+    def _enter(self):
+        if not self._tracing:
+            return None
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        tracemalloc.reset_peak()
+        self._peaks.append(0)
+        return current
+
+    def _exit(self, s, end):
+        args = dict(s.args)
+        rss = peak_rss_mb()
+        args['peak_rss_mb'] = round(rss, 1)
+        if s.traced is not None:
+            import tracemalloc
+            peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop())
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            args['alloc_peak_mb'] = round((peak - s.traced) / (1 << 20), 2)
+        self.events.append({'name': s.name, 'cat': 'stage', 'ph': 'X', 'pid': self.pid,
+                            'tid': threading.get_ident(), 'ts': self._us(s.start),
+                            'dur': round((end - s.start) * 1e6, 1), 'args': args})
+        self.events.append({'name': 'peak_rss_mb', 'ph': 'C', 'pid': self.pid,
+                            'ts': self._us(end), 'args': {'MB': args['peak_rss_mb']}})
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+        self.events.append({'name': name, 'ph': 'C', 'pid': self.pid,
+                            'ts': self._us(time.perf_counter()),
+                            'args': {name: self.counters[name]}})
+
+    def finish(self, path, out=sys.stderr):
+        """Stop, write the trace to `path` and print the summary to `out`."""
+        self.stop()
+        self.write_trace(path)
+        print('\n'.join(self.summary()), file=out)
+        print(f'Wrote trace {path}', file=out)
+
+    def write_trace(self, path):
+        """Chrome trace-event JSON of everything recorded."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms',
+                       'otherData': {'counters': dict(self.counters)}}, f)
+
+    def summary(self):
+        """Table lines: per span name calls, total and max time, memory peaks."""
+        rows = {}
+        for event in self.events:
+            if event['ph'] != 'X':
+                continue
+            row = rows.setdefault(event['name'], [0, 0.0, 0.0, 0.0, None])
+            args = event['args']
+            row[0] += 1
+            row[1] += event['dur'] / 1000
+            row[2] = max(row[2], event['dur'] / 1000)
+            row[3] = max(row[3], args['peak_rss_mb'])
+            if 'alloc_peak_mb' in args:
+                row[4] = max(row[4] or 0.0, args['alloc_peak_mb'])
+        lines = [f'{"span":24} {"calls":>6} {"total ms":>10} {"max ms":>10} '
+                 f'{"peak RSS MB":>12} {"alloc MB":>9}']
+        for name, (calls, total, longest, rss, alloc) in sorted(
+                rows.items(), key=lambda item: -item[1][1]):
+            lines.append(f'{name:24} {calls:6} {total:10.1f} {longest:10.1f} {rss:12.1f} '
+                         f'{"" if alloc is None else f"{alloc:.2f}":>9}')
+        if self.counters:
+            lines.append('')
+            lines.extend(f'{name:24} {value:>12}' for name, value in sorted(self.counters.items()))
+        return lines
+
+
+@contextmanager
+def profiling(path, memory=False, out=sys.stderr):
+    """Run the body profiled, then write the trace to `path` and a summary to `out`.
+
+    A false `path` profiles nothing, so callers can pass an option through.
+    """
+    if not path:
+        yield None
+        return
+    profiler = Profiler(memory).start()
+    try:
+        yield profiler
+    finally:
+        profiler.finish(path, out)
@@ -0,0 +1,228 @@
+"""
+Check every relation instance against the signatures of its relation.
+
+The model describes itself: `R -signature-> s` assigns signature `s` to
+relation `R`, `s -sourceType-> T` / `s -targetType-> T` restrict the types
+of source and target, and `n -type-> T` gives node types.  A side without
+any `sourceType`/`targetType` is unrestricted (e.g. `any-to-anyType`).
+A relation `a -R-> b` is valid if *any* signature of `R` accepts both the
+types of `a` and the types of `b`.
+
+Checking is done in batches per relation: for each signature the accepted
+nodes (gathered once per set of allowed types from a type -> nodes CSR)
+are tested for all relations of that relation at once, and signatures are
+combined with whole-vector integer AND/OR instead of per-edge Python logic.
+"""
+
+from array import array
+from collections import defaultdict, namedtuple
+from itertools import chain, compress
+from operator import ne
+
+from .store import RELATION, group_by
+from .tracing import count, span
+
+TYPE = 'type'
+SIGNATURE = 'signature'
+SOURCE_TYPE = 'sourceType'
+TARGET_TYPE = 'targetType'
+PROPERTY = 'relationPropertyRelation'
+
+Violation = namedtuple('Violation', 'relation source name target sheet line message')
+
+
+class SignatureIndex:
+    """Signatures, allowed types and node types extracted from a store.
+
+    Only the `type`, `signature`, `sourceType`, `targetType` and
+    `relationPropertyRelation` relations are needed, so they are pulled out
+    of the columns with one filtering pass each instead of building
+    general-purpose indexes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._masks = {}
+        self._accepted = {}      # frozenset of allowed types -> accepted nodes
+        self._types = None
+        self._nodes_of_type = None
+        self.signatures_of = self._pairs(SIGNATURE)
+        self.allowed_by = {SOURCE_TYPE: self._pairs(SOURCE_TYPE),
+                           TARGET_TYPE: self._pairs(TARGET_TYPE)}
+        self.properties_of = self._pairs(PROPERTY)
+
+    def _columns(self, name):
+        """(sources, targets) of all relations named `name`."""
+        relation = self.store.strings.get(name)
+        if relation is None:
+            return (), ()
+        selected = list(map(relation.__eq__, self.store.relation))
+        return (array('i', compress(self.store.source, selected)),
+                array('i', compress(self.store.target, selected)))
+
+    def _pairs(self, name):
+        pairs = defaultdict(list)
+        for source, target in zip(*self._columns(name)):
+            pairs[source].append(target)
+        return pairs
+
+    def signatures(self, relation):
+        return self.signatures_of.get(relation, ())
+
+    def allowed(self, signature, side):
+        """Types allowed on `side` (SOURCE_TYPE or TARGET_TYPE); empty = any."""
+        return self.allowed_by[side].get(signature, ())
+
+    def properties(self, relation):
+        """Names of the relation properties attached to any signature of `relation`."""
+        name = self.store.name
+        return {name(p) for s in self.signatures(relation) for p in self.properties_of.get(s, ())}
+
+    def types(self, node):
+        if self._types is None:
+            self._types = self._pairs(TYPE)
+        return self._types.get(node, ())
+
+    def nodes_of_type(self):
+        """CSR from type to the nodes having it, built once from the `type` relations."""
+        if self._nodes_of_type is None:
+            sources, targets = self._columns(TYPE)
+            self._nodes_of_type = group_by(targets, self.store.num_nodes, sources)
+        return self._nodes_of_type
+
+    def accepted(self, signature, side):
+        """frozenset of the nodes accepted on `side`, or None when any node is."""
+        allowed = frozenset(self.allowed(signature, side))
+        if not allowed:
+            return None
+        nodes = self._accepted.get(allowed)
+        if nodes is None:
+            nodes = self._accepted[allowed] = frozenset(
+                chain.from_iterable(map(self.nodes_of_type().row, allowed)))
+        return nodes
+
+    def mask(self, signature, side):
+        """bytearray over node ids, 1 where the node is accepted on `side`."""
+        key = signature, side
+        mask = self._masks.get(key)
+        if mask is None:
+            nodes = self.accepted(signature, side)
+            n = self.store.num_nodes
+            if nodes is None:
+                mask = bytearray(b'\x01') * n
+            else:
+                mask = bytearray(n)
+                for node in nodes:
+                    mask[node] = 1
+            self._masks[key] = mask
+        return mask
+
+
+def _vector(accepted, nodes):
+    """Membership of `nodes` in `accepted` (None: all) as one integer, a byte per entry."""
+    if accepted is None:
+        return int.from_bytes(b'\x01' * len(nodes), 'little')
+    return int.from_bytes(bytes(map(accepted.__contains__, nodes)), 'little')
+
+
+def check_relations(index, relation, ids):
+    """Positions in `ids` (relations of type `relation`) that no signature accepts."""
+    store = index.store
+    signatures = index.signatures(relation)
+    if not signatures:
+        return range(len(ids))
+    sources = array('i', map(store.source.__getitem__, ids))
+    targets = array('i', map(store.target.__getitem__, ids))
+    valid = 0
+    for signature in signatures:
+        valid |= (_vector(index.accepted(signature, SOURCE_TYPE), sources)
+                  & _vector(index.accepted(signature, TARGET_TYPE), targets))
+    flags = valid.to_bytes(len(ids), 'little')
+    bad = []
+    i = flags.find(0)
+    while i != -1:
+        bad.append(i)
+        i = flags.find(0, i + 1)
+    return bad
+
+
+def _describe(index, relation, source_types, target_types, cache):
+    """Why no signature of `relation` accepts nodes with the given types.
+
+    The message only depends on the relation and the two type sets, so it
+    is built once per distinct combination.
+    """
+    key = relation, source_types, target_types
+    message = cache.get(key)
+    if message is not None:
+        return message
+    name = index.store.name
+    signatures = index.signatures(relation)
+    if not signatures:
+        message = f'relation {name(relation)!r} has no signature'
+    else:
+        reasons = []
+        for signature in signatures:
+            failed = []
+            for side, types in ((SOURCE_TYPE, source_types), (TARGET_TYPE, target_types)):
+                allowed = index.allowed(signature, side)
+                if allowed and not set(allowed).intersection(types):
+                    failed.append(f"{side} {', '.join(map(name, types)) or 'untyped'}"
+                                  f" is not {' or '.join(map(name, allowed))}")
+            reasons.append(f'{name(signature)}: ' + ', '.join(failed))
+        message = 'no signature matches (' + '; '.join(reasons) + ')'
+    cache[key] = message
+    return message
+
+
+def validate(store):
+    """All signature violations of `store`, in relation order."""
+    with span('validate'):
+        index = SignatureIndex(store)
+        by_relation = store.by(RELATION)
+        offsets = by_relation.offsets
+        bad = []
+        for relation in compress(range(store.num_nodes), map(ne, offsets[1:], offsets[:-1])):
+            ids = by_relation.row(relation)
+            bad.extend(ids[i] for i in check_relations(index, relation, ids))
+        bad.sort()
+        name = store.name
+        messages = {}
+        violations = []
+        for r in bad:
+            source, relation, target = store.triple(r)
+            sheet, line = store.provenance(r)
+            message = _describe(index, relation, tuple(index.types(source)),
+                                tuple(index.types(target)), messages)
+            violations.append(Violation(r, name(source), name(relation), name(target),
+                                        sheet, line, message))
+    count('violations', len(violations))
+    return violations
+
+
+def format_violation(v):
+    where = f'{v.sheet}.sheet' if v.sheet else '<unknown>'
+    if v.line:
+        where += f':{v.line}'
+    target = v.target if v.target is not None else '?'
+    return f'{where}: {v.source} -{v.name}-> {target}: {v.message}'
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    from .constraints import check_constraints
+    from .sheets import DEFAULT_CACHE_DIR, SheetCache, load_model
+    from .store import TripleStore
+
+    parser = argparse.ArgumentParser(prog='trigraph validate',
+                                     description='Check relations against their signatures and properties.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    args = parser.parse_args(argv)
+    store = TripleStore.from_model(load_model(*args.paths, cache=SheetCache(DEFAULT_CACHE_DIR)))
+    violations = validate(store) + check_constraints(store)
+    for v in violations:
+        print(format_violation(v))
+    print(f'{store.num_relations} relations checked, {len(violations)} violations',
+          file=sys.stderr)
+    return 1 if violations else 0
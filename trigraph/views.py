@@ -0,0 +1,247 @@
+"""
+Visibility-scoped views over one shared `TripleStore`.
+
+A consumer in layer `n` only sees the nodes of the model whose visibility
+reaches it (see `trigraph.packages.visible`): the model's own layer sees
+everything, the next layer sees `public` and `public+1`, every layer above
+that only `public`.  A relation is visible if its source, relation and
+target node all are.
+
+A `StoreView` is a `TripleStore` that shares every column, the string table
+and the adjacency of the underlying store; all it adds is a byte mask over
+node ids and one over relation ids.  Ids are not renumbered, so anything
+computed on a view can be looked up in the store and vice versa.  Masks
+depend only on which visibilities are visible, so all layers above the next
+one share the same pair; `ViewSet` builds each pair once:
+
+    views = ViewSet(store)
+    public = views.view(2)
+    Trigraph(public), emit(public, [...]), views.engine(2).query('...')
+
+Masks are built with `bytes.translate` and whole-vector integer AND; a view
+over a million relations costs about a megabyte and a quarter second.
+"""
+
+from array import array
+from itertools import compress
+
+from .packages import visible
+from .query import QueryEngine
+from .sheets import VISIBILITIES
+from .store import TripleStore
+
+
+def node_mask(store, visibilities):
+    """bytearray over node ids, 1 where the node's visibility is in `visibilities`."""
+    table = bytearray(256)
+    for v in visibilities:
+        table[VISIBILITIES.index(v)] = 1
+    codes = store.node_visibility
+    raw = codes.tobytes() if isinstance(codes, array) else bytes(codes)
+    return bytearray(raw.translate(table))
+
+
+def relation_mask(store, nodes):
+    """bytearray over relation ids, 1 where source, relation and target are in `nodes`."""
+    n = store.num_relations
+    at = nodes.__getitem__
+    valid = -1
+    for column in (store.source, store.relation, store.target):
+        valid &= int.from_bytes(bytes(map(at, column)), 'little')
+    return bytearray(valid.to_bytes(n, 'little')) if n else bytearray()
+
+
+class MaskedStrings:
+    """String table of a view: names of hidden nodes are not found."""
+
+    def __init__(self, strings, mask):
+        self.strings = strings
+        self.mask = mask
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, i):
+        return self.strings[i]
+
+    def __iter__(self):
+        return iter(self.strings)
+
+    def get(self, name, default=None):
+        i = self.strings.get(name)
+        return i if i is not None and self.mask[i] else default
+
+    def id(self, name):
+        i = self.get(name)
+        if i is None:
+            raise KeyError(name)
+        return i
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def intern(self, name):
+        i = self.get(name)
+        if i is None:
+            raise TypeError('views are read-only')
+        return i
+
+
+class MaskedCSR:
+    """Rows of a shared CSR with hidden relations left out."""
+
+    def __init__(self, csr, mask):
+        self.csr = csr
+        self.mask = mask
+
+    def __len__(self):
+        return len(self.csr)
+
+    def row(self, n):
+        row = self.csr.row(n)
+        return array('i', compress(row, map(self.mask.__getitem__, row)))
+
+    def degree(self, n):
+        return len(self.row(n))
+
+    def nbytes(self):
+        return 0    # shares the underlying CSR
+
+
+class StoreView(TripleStore):
+    """Read-only `TripleStore` restricted to visible nodes and relations."""
+
+    def __init__(self, store, nodes, relations, layer=None):
+        # Share the store's columns instead of building new ones
+        self.__dict__.update(store.__dict__)
+        self.store = store
+        self.layer = layer
+        self.node_mask = nodes
+        self.relation_mask = relations
+        self.strings = MaskedStrings(store.strings, nodes)
+        self._csr = {}
+
+    def add_node(self, name, visibility=None, sheet=None):
+        if visibility is None:
+            return self.strings.intern(name)
+        raise TypeError('views are read-only')
+
+    def add_ids(self, source, relation, target, sheet=None, line=0):
+        raise TypeError('views are read-only')
+
+    def extend_ids(self, source, relation, target, sheet=None):
+        raise TypeError('views are read-only')
+
+    def node_ids(self):
+        return compress(range(self.num_nodes), self.node_mask)
+
+    def relation_ids(self):
+        return compress(range(self.num_relations), self.relation_mask)
+
+    def triples(self):
+        mask = self.relation_mask
+        return zip(compress(self.source, mask), compress(self.relation, mask),
+                   compress(self.target, mask))
+
+    def by(self, role):
+        csr = self._csr.get(role)
+        if csr is None:
+            csr = self._csr[role] = MaskedCSR(self.store.by(role), self.relation_mask)
+        return csr
+
+    def incidence(self):
+        csr = self._csr.get('incidence')
+        if csr is None:
+            csr = self._csr['incidence'] = MaskedCSR(self.store.incidence(), self.relation_mask)
+        return csr
+
+    def nbytes(self):
+        """Bytes held by the view itself (the masks)."""
+        return len(self.node_mask) + len(self.relation_mask)
+
+    def __repr__(self):
+        return (f'StoreView(layer={self.layer}, nodes={sum(self.node_mask)}, '
+                f'relations={sum(self.relation_mask)} of {self.num_relations})')
+
+
+class ViewQueryEngine(QueryEngine):
+    """`QueryEngine` over a view, sharing the permutation indexes of `shared`."""
+
+    def __init__(self, view, shared=None):
+        super().__init__(view)
+        if shared is not None:
+            self._indexes = shared._indexes
+
+    def match_ids(self, source=None, relation=None, target=None):
+        ids = super().match_ids(source, relation, target)
+        return array('i', compress(ids, map(self.store.relation_mask.__getitem__, ids)))
+
+    def count_ids(self, source=None, relation=None, target=None):
+        return len(self.match_ids(source, relation, target))
+
+    def _estimate(self, pattern):
+        # Planning only needs the unfiltered range size
+        bound = [None if isinstance(t, str) else t for t in pattern]
+        return QueryEngine.count_ids(self, *bound)
+
+
+class ViewSet:
+    """Views of one store for consumers in different layers."""
+
+    def __init__(self, store, layer=0):
+        self.store = store
+        self.layer = layer                # layer the model itself belongs to
+        self.shared_engine = QueryEngine(store)
+        self._masks = {}                  # visible visibilities -> (nodes, relations)
+        self._engines = {}
+
+    def visibilities(self, layer):
+        return tuple(v for v in VISIBILITIES if visible(v, self.layer, layer))
+
+    def masks(self, layer):
+        key = self.visibilities(layer)
+        masks = self._masks.get(key)
+        if masks is None:
+            nodes = node_mask(self.store, key)
+            masks = self._masks[key] = nodes, relation_mask(self.store, nodes)
+        return masks
+
+    def view(self, layer):
+        """The store as seen from `layer`."""
+        if layer == self.layer:
+            return self.store
+        nodes, relations = self.masks(layer)
+        return StoreView(self.store, nodes, relations, layer)
+
+    def engine(self, layer):
+        """Query engine for `layer`; all views share one set of indexes."""
+        if layer == self.layer:
+            return self.shared_engine
+        key = self.visibilities(layer)
+        engine = self._engines.get(key)
+        if engine is None:
+            engine = self._engines[key] = ViewQueryEngine(self.view(layer), self.shared_engine)
+        return engine
+
+
+def main(argv=None):
+    import argparse
+    from .snapshot import load_store
+
+    parser = argparse.ArgumentParser(prog='trigraph views',
+                                     description='Show what each layer sees of the model.')
+    parser.add_argument('paths', nargs='*', default=['sheets'])
+    parser.add_argument('--layers', type=int, default=3, help='number of layers to show')
+    parser.add_argument('-v', '--verbose', action='store_true', help='list visible nodes')
+    args = parser.parse_args(argv)
+    store = load_store(*args.paths)
+    views = ViewSet(store)
+    for layer in range(args.layers):
+        view = views.view(layer)
+        nodes = list(view.node_ids())
+        relations = sum(1 for _ in view.relation_ids())
+        print(f'layer {layer}: {len(nodes)} nodes, {relations} relations '
+              f'({", ".join(views.visibilities(layer)) or "nothing"})')
+        if args.verbose:
+            for node in nodes:
+                print(f'  {store.name(node)}')